@@ -0,0 +1,36 @@
+! Procedures taking arrays of rank 1 to 7 for bench_array_args.py.
+
+subroutine rank1(a)
+    implicit none
+    real(kind=8), dimension(:), intent(inout) :: a
+end subroutine rank1
+
+subroutine rank2(a)
+    implicit none
+    real(kind=8), dimension(:, :), intent(inout) :: a
+end subroutine rank2
+
+subroutine rank3(a)
+    implicit none
+    real(kind=8), dimension(:, :, :), intent(inout) :: a
+end subroutine rank3
+
+subroutine rank4(a)
+    implicit none
+    real(kind=8), dimension(:, :, :, :), intent(inout) :: a
+end subroutine rank4
+
+subroutine rank5(a)
+    implicit none
+    real(kind=8), dimension(:, :, :, :, :), intent(inout) :: a
+end subroutine rank5
+
+subroutine rank6(a)
+    implicit none
+    real(kind=8), dimension(:, :, :, :, :, :), intent(inout) :: a
+end subroutine rank6
+
+subroutine rank7(a)
+    implicit none
+    real(kind=8), dimension(:, :, :, :, :, :, :), intent(inout) :: a
+end subroutine rank7
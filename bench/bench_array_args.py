@@ -0,0 +1,53 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Per call overhead of array arguments of rank 1 to 7, for every
+# --array-args mode.  The procedures do nothing, so the time is all spent
+# in the wrapper.
+#
+#   python bench/bench_array_args.py [--calls=N]
+
+import sys
+from optparse import OptionParser
+
+import numpy as np
+
+import benchutils
+
+MODES = ('ndarray', 'memoryview', 'buffer')
+
+def bench(module, rank, ncalls):
+    a = np.zeros((2,)*rank, order='F')
+    proc = getattr(module, 'rank%d' % rank)
+    def calls():
+        for i in xrange(ncalls):
+            proc(a)
+    return benchutils.best_of(calls) / ncalls
+
+def main(argv):
+    parser = OptionParser()
+    parser.add_option('--calls', type='int', default=100000,
+                      help='calls per measurement [default %default]')
+    opts, args = parser.parse_args(argv)
+
+    workdir = benchutils.workdir()
+    try:
+        times = {}
+        for mode in MODES:
+            module = benchutils.build('array_args.f90', 'bench_%s' % mode,
+                                      workdir, ['--array-args=%s' % mode])
+            for rank in range(1, 8):
+                times[mode, rank] = bench(module, rank, opts.calls)
+    finally:
+        benchutils.remove(workdir)
+
+    print "%-6s" % 'rank' + ''.join(["%14s" % mode for mode in MODES])
+    for rank in range(1, 8):
+        print "%-6d" % rank + ''.join(["%12.3fus" % (times[mode, rank] * 1e6)
+                                       for mode in MODES])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
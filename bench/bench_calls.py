@@ -0,0 +1,242 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Fixed cost of calls through the generated wrappers.
+#
+# The procedures of some of the tests/run sources are called with
+# different argument counts, types and array sizes.  For every case the
+# time of a wrapper call is split into the time spent in Fortran and the
+# time spent marshaling the arguments.  The Fortran time is estimated with
+# the <proc>_batched variant: its loop calls the C wrapper directly, so the
+# extra time of n batches over one batch is n-1 calls without marshaling.
+# Where a hand-written ctypes wrapper is given it is timed as a baseline.
+#
+#   python bench/bench_calls.py [--json=FILE] [--compare=OLD.json]
+#                               [--cases=SUBSTRING] [-- fwrapc options]
+#
+# The JSON output records the fwrap, Python, NumPy and Cython versions;
+# --compare prints the wrapper times relative to an earlier run.
+
+import os
+import sys
+import json
+import ctypes
+import platform
+from optparse import OptionParser
+
+import numpy as np
+
+import benchutils
+
+RUNDIR = os.path.join(os.path.dirname(benchutils.BENCHDIR), 'tests', 'run')
+
+# the batched calls use at most MAXBATCH batches and about BATCH_BYTES of
+# arrays.
+MAXBATCH = 1000
+BATCH_BYTES = 1 << 24
+
+CTYPES = {'b' : ctypes.c_byte, 'h' : ctypes.c_short, 'i' : ctypes.c_int,
+          'l' : ctypes.c_long, 'q' : ctypes.c_longlong,
+          'f' : ctypes.c_float, 'd' : ctypes.c_double}
+
+def ctype(dtype):
+    return CTYPES[np.dtype(dtype).char]
+
+def err_args():
+    return ctypes.c_int(), ctypes.create_string_buffer(64)
+
+# hand-written ctypes wrappers, for the baseline.
+
+def ctypes_scalars(lib, proc, dtype):
+    # proc(in, inout) -> (inout, out)
+    c_proc = getattr(lib, '%s_c' % proc)
+    tp = ctype(dtype)
+    def call(a, b):
+        a, b, c = tp(a), tp(b), tp()
+        err, errstr = err_args()
+        c_proc(ctypes.byref(a), ctypes.byref(b), ctypes.byref(c),
+               ctypes.byref(err), errstr)
+        if err.value:
+            raise RuntimeError(errstr.value)
+        return b.value, c.value
+    return call
+
+def ctypes_arrays(lib, proc, dtype):
+    # proc(ain, aout, ainout, ano) with assumed shape 2D arrays.
+    c_proc = getattr(lib, '%s_c' % proc)
+    intp = ctype(np.intp)
+    def call(*arrays):
+        args = []
+        for arr in arrays:
+            arr = np.require(arr, dtype, ['F_CONTIGUOUS', 'ALIGNED'])
+            args += [ctypes.byref(intp(arr.shape[0])),
+                     ctypes.byref(intp(arr.shape[1])),
+                     arr.ctypes.data_as(ctypes.c_void_p)]
+        err, errstr = err_args()
+        c_proc(*(args + [ctypes.byref(err), errstr]))
+        if err.value:
+            raise RuntimeError(errstr.value)
+        return arrays[1:]
+    return call
+
+def arrays(dtype, n):
+    return tuple([np.ones((n, n), dtype=dtype, order='F') for i in range(4)])
+
+# (source, procedure, label, arguments, ctypes wrapper)
+CASES = [
+    ('all_ints', 'int_default', '3 integer args',
+        lambda mod: (1, 2),
+        lambda lib, mod: ctypes_scalars(lib, 'int_default', mod.fwi_integer)),
+    ('all_ints', 'int_x_len', '12 integer args',
+        lambda mod: (1,)*8, None),
+    ('all_reals', 'real_default', '3 real args',
+        lambda mod: (1., 2.),
+        lambda lib, mod: ctypes_scalars(lib, 'real_default', mod.fwr_real)),
+    ('all_complex', 'complex_default', '3 complex args',
+        lambda mod: (1+1j, 2+2j), None),
+    ('all_logicals', 'log_default', '3 logical args',
+        lambda mod: (True, False),
+        lambda lib, mod: ctypes_scalars(lib, 'log_default', mod.fwl_logical)),
+    ('all_char', 'char_arg', '2 character args',
+        lambda mod: ('a'*20, 'abc'), None),
+    ]
+for n in (1, 32, 256):
+    CASES.append(('all_real_arrays', 'assumed_shape',
+                  '4 real arrays %dx%d' % (n, n),
+                  lambda mod, n=n: arrays(mod.fwr_real, n),
+                  lambda lib, mod: ctypes_arrays(lib, 'assumed_shape',
+                                                 mod.fwr_real)))
+CASES.append(('all_integer_arrays', 'assumed_shape', '4 integer arrays 32x32',
+              lambda mod: arrays(mod.fwi_integer, 32), None))
+
+def stacked(args, nbatch):
+    # the arguments of the batched variant, for nbatch batches; scalars are
+    # given per batch as well, else a call without array arguments would
+    # run a single batch.
+    ret = []
+    for arg in args:
+        if isinstance(arg, np.ndarray):
+            arg = np.repeat(arg[..., np.newaxis], nbatch, axis=-1)
+            arg = np.asfortranarray(arg)
+        else:
+            arg = np.repeat(np.asarray(arg), nbatch)
+        ret.append(arg)
+    return ret
+
+def fortran_time(mod, proc, args):
+    batched = getattr(mod, '%s_batched' % proc, None)
+    if batched is None:
+        return None
+    nbytes = sum([arg.nbytes for arg in args if isinstance(arg, np.ndarray)])
+    nbatch = max(10, min(MAXBATCH, BATCH_BYTES // max(nbytes, 1)))
+    one, many = stacked(args, 1), stacked(args, nbatch)
+    t_one = benchutils.time_per_call(lambda: batched(*one))
+    t_many = benchutils.time_per_call(lambda: batched(*many))
+    return max(t_many - t_one, 0.) / (nbatch - 1)
+
+def run_case(mod, case):
+    source, proc, label, make_args, make_ctypes = case
+    args = make_args(mod)
+    func = getattr(mod, proc)
+    result = {'case' : '%s.%s: %s' % (source, proc, label),
+              'source' : source, 'proc' : proc, 'label' : label}
+    wrapper = benchutils.time_per_call(lambda: func(*args))
+    fortran = fortran_time(mod, proc, args)
+    result['wrapper_us'] = wrapper * 1e6
+    if fortran is not None:
+        result['fortran_us'] = fortran * 1e6
+        result['marshal_us'] = (wrapper - fortran) * 1e6
+    if make_ctypes is not None:
+        c_func = make_ctypes(ctypes.CDLL(mod.__file__), mod)
+        result['ctypes_us'] = (benchutils.time_per_call(
+                                    lambda: c_func(*args)) * 1e6)
+    return result
+
+def versions():
+    from fwrap.version import get_version
+    from Cython.Compiler.Version import version as cython_version
+    return {'fwrap' : get_version(),
+            'python' : platform.python_version(),
+            'numpy' : np.__version__,
+            'cython' : cython_version,
+            'machine' : platform.machine()}
+
+def run(cases, options):
+    workdir = benchutils.workdir()
+    results, modules = [], {}
+    try:
+        for case in cases:
+            source = case[0]
+            if source not in modules:
+                try:
+                    modules[source] = benchutils.build(
+                                os.path.join(RUNDIR, '%s.f90' % source),
+                                'bench_%s' % source, workdir,
+                                ['--batched'] + options)
+                except Exception, e:
+                    modules[source] = e
+            mod = modules[source]
+            if isinstance(mod, Exception):
+                results.append({'case' : '%s.%s: %s' % case[:3],
+                                'error' : 'build failed: %s' % mod})
+                continue
+            results.append(run_case(mod, case))
+    finally:
+        benchutils.remove(workdir)
+    return results
+
+def fmt(value):
+    if value is None:
+        return '%10s' % '-'
+    return '%10.3f' % value
+
+def print_results(results, old=None):
+    old = dict([(res['case'], res) for res in (old or [])])
+    cols = ['wrapper_us', 'fortran_us', 'marshal_us', 'ctypes_us']
+    header = '%-56s' % 'case' + ''.join(['%10s' % col[:-3] for col in cols])
+    if old:
+        header += '%10s' % 'vs old'
+    print header
+    for res in results:
+        line = '%-56s' % res['case']
+        if 'error' in res:
+            print line + res['error']
+            continue
+        line += ''.join([fmt(res.get(col)) for col in cols])
+        prev = old.get(res['case'], {}).get('wrapper_us')
+        if prev:
+            line += '%9.2fx' % (res['wrapper_us'] / prev)
+        print line
+    print "(times in microseconds per call)"
+
+def main(argv):
+    parser = OptionParser(usage="%prog [options] [-- fwrapc options]")
+    parser.add_option('--json', help='write the results to this file')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare with the results of an earlier --json run')
+    parser.add_option('--cases', metavar='SUBSTRING',
+                      help='only run the cases containing SUBSTRING')
+    opts, args = parser.parse_args(argv)
+
+    cases = [case for case in CASES
+                if not opts.cases or opts.cases in '%s.%s: %s' % case[:3]]
+    results = run(cases, args)
+
+    old = None
+    if opts.compare:
+        old = json.load(open(opts.compare))['results']
+    print_results(results, old)
+
+    if opts.json:
+        fh = open(opts.json, 'w')
+        try:
+            json.dump({'versions' : versions(), 'options' : args,
+                       'results' : results}, fh, indent=1, sort_keys=True)
+        finally:
+            fh.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,60 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Multithreaded calls of a compute bound Fortran kernel, wrapped with the
+# default settings (GIL released around the call) and with --keep-gil.
+#
+#   python bench/bench_nogil.py [--threads=N]
+
+import sys
+import threading
+from optparse import OptionParser
+
+import numpy as np
+
+import benchutils
+
+def run_threads(func, nthreads):
+    threads = [threading.Thread(target=func) for i in range(nthreads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def bench(module, nthreads, ncalls):
+    x = np.linspace(-1., 1., 10000)
+    def calls():
+        for i in range(ncalls):
+            module.kernel(x.size, 200, x)
+    serial = benchutils.best_of(lambda: run_threads(calls, 1))
+    threaded = benchutils.best_of(lambda: run_threads(calls, nthreads))
+    # the threaded run does nthreads times the work.
+    return serial, threaded, nthreads * serial / threaded
+
+def main(argv):
+    parser = OptionParser()
+    parser.add_option('--threads', type='int', default=4,
+                      help='number of threads [default %default]')
+    parser.add_option('--calls', type='int', default=20,
+                      help='kernel calls per thread [default %default]')
+    opts, args = parser.parse_args(argv)
+
+    workdir = benchutils.workdir()
+    try:
+        variants = [('nogil', []), ('keep_gil', ['--keep-gil=kernel'])]
+        print "%-10s %10s %10s %8s" % ('', '1 thread', '%d threads' %
+                                       opts.threads, 'speedup')
+        for name, options in variants:
+            module = benchutils.build('nogil.f90', 'bench_%s' % name,
+                                      workdir, options)
+            serial, threaded, speedup = bench(module, opts.threads, opts.calls)
+            print "%-10s %9.3fs %9.3fs %7.2fx" % (name, serial, threaded,
+                                                  speedup)
+    finally:
+        benchutils.remove(workdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
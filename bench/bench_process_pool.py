@@ -0,0 +1,75 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Fan out calls of a Fortran kernel over worker processes, with
+# fwrap.runtime.ProcessPool passing the arrays through shared memory, and
+# with a plain multiprocessing.Pool.map pickling them to the workers and
+# back.
+#
+#   python bench/bench_process_pool.py [--processes=N] [--tasks=N]
+
+import sys
+import importlib
+import multiprocessing
+from optparse import OptionParser
+
+import numpy as np
+
+import benchutils
+from fwrap import runtime
+
+def naive_call(task):
+    # Pool.map needs a picklable function; the arrays are pickled.
+    modname, procname, args = task
+    return getattr(importlib.import_module(modname), procname)(*args)
+
+def bench(module, nprocs, ntasks, size, niter):
+    proc = module.relax
+    def plain():
+        arrays = [np.ones(size) for i in range(ntasks)]
+        pool = multiprocessing.Pool(nprocs)
+        try:
+            pool.map(naive_call, [(proc.__module__, proc.__name__,
+                                   (size, niter, a)) for a in arrays])
+        finally:
+            pool.terminate()
+    def shared():
+        arrays = [runtime.shared_array(size) for i in range(ntasks)]
+        for a in arrays:
+            a[...] = 1
+        pool = runtime.ProcessPool(nprocs)
+        try:
+            pool.map(proc, [(size, niter, a) for a in arrays])
+        finally:
+            pool.terminate()
+    return benchutils.best_of(plain), benchutils.best_of(shared)
+
+def main(argv):
+    parser = OptionParser()
+    parser.add_option('--processes', type='int', default=4,
+                      help='number of worker processes [default %default]')
+    parser.add_option('--tasks', type='int', default=16,
+                      help='number of calls [default %default]')
+    parser.add_option('--size', type='int', default=2**22,
+                      help='array elements per call [default %default]')
+    opts, args = parser.parse_args(argv)
+
+    workdir = benchutils.workdir()
+    try:
+        module = benchutils.build('process_pool.f90', 'bench_process_pool',
+                                  workdir)
+        print "%-8s %10s %10s %10s" % ('niter', 'Pool.map', 'shared',
+                                       'speedup')
+        for niter in (1, 10, 100):
+            plain, shared = bench(module, opts.processes, opts.tasks,
+                                  opts.size, niter)
+            print "%-8d %9.3fs %9.3fs %9.2fx" % (niter, plain, shared,
+                                                 plain / shared)
+    finally:
+        benchutils.remove(workdir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,63 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Per call overhead of the checked wrappers and of the <proc>_unchecked
+# wrappers made with --unchecked, which skip the checks of the extents and
+# lengths and the error handling.  The procedures do nothing, so the time is
+# all spent in the wrappers.
+#
+#   python bench/bench_unchecked.py [--calls=N] [-- fwrapc options]
+
+import sys
+from optparse import OptionParser
+
+import numpy as np
+
+import benchutils
+
+PROCS = ('scalar', 'vector', 'matrices', 'strings')
+
+def cases():
+    x = np.zeros(4)
+    a = np.zeros((4, 3), order='F')
+    return {'scalar' : (4,),
+            'vector' : (4, x),
+            'matrices' : (4, 3, a, a, a.copy('F')),
+            'strings' : (b'abcdefgh', b'01234567')}
+
+def bench(proc, args, ncalls):
+    def calls():
+        for i in xrange(ncalls):
+            proc(*args)
+    return benchutils.best_of(calls) / ncalls
+
+def main(argv):
+    parser = OptionParser()
+    parser.add_option('--calls', type='int', default=100000,
+                      help='calls per measurement [default %default]')
+    opts, args = parser.parse_args(argv)
+
+    workdir = benchutils.workdir()
+    try:
+        module = benchutils.build('unchecked.f90', 'bench_unchecked', workdir,
+                                  ['--unchecked=%s' % ','.join(PROCS)] + args)
+        times = {}
+        for name, proc_args in cases().items():
+            for suffix in ('', '_unchecked'):
+                proc = getattr(module, name + suffix)
+                times[name, suffix] = bench(proc, proc_args, opts.calls)
+    finally:
+        benchutils.remove(workdir)
+
+    print "%-10s%14s%14s%10s" % ('proc', 'checked', 'unchecked', 'saved')
+    for name in PROCS:
+        checked, unchecked = times[name, ''], times[name, '_unchecked']
+        print "%-10s%12.3fus%12.3fus%9.1f%%" % (
+                name, checked * 1e6, unchecked * 1e6,
+                100 * (checked - unchecked) / checked)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
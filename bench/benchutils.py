@@ -0,0 +1,70 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Helpers shared by the benchmarks: build a Fortran source with fwrapc into a
+# scratch directory and time callables.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHDIR))
+
+def build(source, name, workdir, options=()):
+    r"""Wrap and compile source as extension module name in workdir and
+    import it.
+
+    options are extra fwrapc arguments, e.g. wrapper options.
+    """
+    from fwrap.fwrapc import fwrapc
+    projdir = os.path.join(workdir, name)
+    argv = ['configure', 'build',
+            '--name=%s' % name,
+            '--outdir=%s' % projdir,
+            os.path.join(BENCHDIR, source),
+            'install'] + list(options)
+    fwrapc(argv=argv)
+    sys.path.insert(0, projdir)
+    try:
+        return __import__(name)
+    finally:
+        sys.path.remove(projdir)
+
+def best_of(func, repeat=3):
+    r"""Return the best wall clock time of repeat calls of func."""
+    times = []
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        times.append(time.time() - t0)
+    return min(times)
+
+def time_per_call(func, min_time=0.1, repeat=3):
+    r"""Return the best time of one call of func, in seconds.
+
+    The number of calls per measurement is doubled until a measurement
+    takes at least min_time.
+    """
+    ncalls = 1
+    while True:
+        t0 = time.time()
+        for i in xrange(ncalls):
+            func()
+        if time.time() - t0 >= min_time:
+            break
+        ncalls *= 2
+    def calls():
+        for i in xrange(ncalls):
+            func()
+    return best_of(calls, repeat) / ncalls
+
+def workdir():
+    return tempfile.mkdtemp(prefix='fwrap_bench_')
+
+def remove(workdir):
+    shutil.rmtree(workdir, ignore_errors=True)
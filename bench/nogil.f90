@@ -0,0 +1,16 @@
+! Compute bound kernels for bench_nogil.py.
+
+subroutine kernel(n, niter, x, res)
+    implicit none
+    integer, intent(in) :: n, niter
+    real(kind=8), dimension(n), intent(in) :: x
+    real(kind=8), intent(out) :: res
+    integer :: i, j
+
+    res = 0
+    do j = 1, niter
+        do i = 1, n
+            res = res + sqrt(abs(x(i)) + j)
+        enddo
+    enddo
+end subroutine kernel
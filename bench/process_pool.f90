@@ -0,0 +1,14 @@
+! A kernel updating a large array in place, for bench_process_pool.py.
+
+subroutine relax(n, niter, a)
+    implicit none
+    integer, intent(in) :: n, niter
+    real(kind=8), dimension(n), intent(inout) :: a
+    integer :: i, k
+
+    do k = 1, niter
+        do i = 2, n-1
+            a(i) = 0.5d0 * a(i) + 0.25d0 * (a(i-1) + a(i+1))
+        enddo
+    enddo
+end subroutine relax
@@ -0,0 +1,25 @@
+! Procedures with checked extents and lengths for bench_unchecked.py.  They
+! do nothing, so the time is all spent in the wrappers.
+
+subroutine scalar(n)
+    implicit none
+    integer, intent(in) :: n
+end subroutine scalar
+
+subroutine vector(n, x)
+    implicit none
+    integer, intent(in) :: n
+    real(kind=8), dimension(n), intent(inout) :: x
+end subroutine vector
+
+subroutine matrices(n, m, a, b, c)
+    implicit none
+    integer, intent(in) :: n, m
+    real(kind=8), dimension(n, m), intent(in) :: a, b
+    real(kind=8), dimension(n, m), intent(inout) :: c
+end subroutine matrices
+
+subroutine strings(s, t)
+    implicit none
+    character(len=8), intent(in) :: s, t
+end subroutine strings
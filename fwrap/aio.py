@@ -0,0 +1,199 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Awaitable calls of the procedures of fwrap generated modules.
+#
+# The wrappers release the GIL around the call into Fortran, so running them
+# on worker threads keeps an event loop responsive while they compute.  Only
+# futures and callbacks are used, so the module works with asyncio and with
+# the trollius backport alike; without either, an executor works with any
+# loop given that has create_future and call_soon_threadsafe methods.
+#
+# This is a runtime helper rather than generated code: a wrapped module is
+# made awaitable with `AsyncModule(module)`.
+
+import sys
+import collections
+import functools
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+class Executor(object):
+    r"""Run wrapped procedures on a pool of threads for an event loop.
+
+    :Input:
+     - *max_workers* - (int) Number of calls computed at the same time.
+     - *max_pending* - (int) Number of calls accepted, computing or waiting
+       for a thread, at any time; further calls wait to be accepted.  By
+       default twice max_workers.
+     - *loop* - The event loop, by default the current one.
+     - *snapshot* - (bool) Copy NumPy array and bytearray arguments when a
+       call is submitted.
+
+    The wrappers convert their arguments on the worker thread, when the
+    call starts, so by default the caller's arrays are passed on as they
+    are: they must not be modified until the call is done, and in place
+    procedures update them as usual.  With snapshot a call sees its arrays
+    as they were when it was submitted, at the cost of a copy per call;
+    the copies are what an in place procedure updates, so its results are
+    only in the values returned.
+    """
+
+    def __init__(self, max_workers=4, max_pending=None, loop=None,
+                 snapshot=False):
+        if max_pending is None:
+            max_pending = 2 * max_workers
+        if max_workers < 1 or max_pending < max_workers:
+            raise ValueError("need 1 <= max_workers <= max_pending, got "
+                             "%d and %d" % (max_workers, max_pending))
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.snapshot = snapshot
+        if loop is None:
+            if asyncio is None:
+                raise ImportError("neither asyncio nor trollius is "
+                                  "available, the loop must be given")
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._pool = ThreadPool(max_workers)
+        self._pending = 0
+        self._waiting = collections.deque()
+
+    def submit(self, proc, *args):
+        r"""Return a future that is done once the call proc(*args) is
+        accepted; its result is a future of the result of the call.
+
+        Awaiting the first future before submitting more calls is how
+        producers get back-pressure.
+        """
+        if self.snapshot:
+            args = _snapshot(args)
+        accepted = self._future()
+        self._waiting.append((accepted, proc, args))
+        self._start()
+        return accepted
+
+    def call(self, proc, *args):
+        r"""Return a future of the result of proc(*args), i.e. the value or
+        tuple of values the wrapper returns.
+
+        The arrays among args must be left alone until the call is done,
+        unless the executor was made with snapshot; see `Executor`.
+        """
+        result = self._future()
+        def accepted_done(accepted):
+            if accepted.cancelled():
+                result.cancel()
+            else:
+                accepted.result().add_done_callback(
+                        functools.partial(_copy_outcome, result))
+        self.submit(proc, *args).add_done_callback(accepted_done)
+        return result
+
+    def pending(self):
+        r"""Return the number of accepted calls that are not done."""
+        return self._pending
+
+    def close(self):
+        r"""Stop the threads once the accepted calls are done."""
+        self._pool.close()
+
+    def _future(self):
+        # futures of the loop's own kind where it makes them.
+        create_future = getattr(self._loop, 'create_future', None)
+        if create_future is not None:
+            return create_future()
+        return asyncio.Future(loop=self._loop)
+
+    def _start(self):
+        while self._waiting and self._pending < self.max_pending:
+            accepted, proc, args = self._waiting.popleft()
+            if accepted.cancelled():
+                continue
+            done = self._future()
+            self._pending += 1
+            self._pool.apply_async(_run, (proc, args),
+                    callback=functools.partial(self._from_thread, done))
+            accepted.set_result(done)
+
+    def _from_thread(self, done, outcome):
+        self._loop.call_soon_threadsafe(self._finish, done, outcome)
+
+    def _finish(self, done, outcome):
+        self._pending -= 1
+        if not done.cancelled():
+            ok, value = outcome
+            if ok:
+                done.set_result(value)
+            else:
+                done.set_exception(value)
+        self._start()
+
+
+class AsyncModule(object):
+    r"""The procedures of a wrapped module as functions returning futures.
+
+    `AsyncModule(module).proc(*args)` returns a future of
+    `module.proc(*args)`, computed by an `Executor`, either the one given
+    or a new one made with the remaining keyword arguments.
+
+    The generated modules have no awaitable variants of their own, as they
+    don't depend on fwrap once built; wrap a module where it is used::
+
+        import mymod
+        from fwrap.aio import AsyncModule
+        aio = AsyncModule(mymod, max_workers=4)
+        ...
+        result = await aio.proc(x, y)
+    """
+
+    def __init__(self, module, executor=None, **kwargs):
+        self.module = module
+        self.executor = executor or Executor(**kwargs)
+
+    def __getattr__(self, name):
+        proc = getattr(self.module, name)
+        if not callable(proc):
+            raise AttributeError("%s.%s is not a procedure" %
+                                 (self.module.__name__, name))
+        return functools.partial(self.executor.call, proc)
+
+
+def _snapshot(args):
+    # copies of the mutable arguments, taken on the loop thread.
+    ret = []
+    for arg in args:
+        if isinstance(arg, np.ndarray):
+            arg = arg.copy(order='K')
+        elif isinstance(arg, bytearray):
+            arg = bytearray(arg)
+        ret.append(arg)
+    return tuple(ret)
+
+def _run(proc, args):
+    # on a worker thread; errors are handed to the loop rather than raised.
+    try:
+        return True, proc(*args)
+    except Exception:
+        return False, sys.exc_info()[1]
+
+def _copy_outcome(dest, src):
+    if dest.cancelled():
+        return
+    if src.cancelled():
+        dest.cancel()
+    elif src.exception() is not None:
+        dest.set_exception(src.exception())
+    else:
+        dest.set_result(src.result())
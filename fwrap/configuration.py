@@ -0,0 +1,193 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Options controlling the generated wrappers.
+#
+# The same options are accepted by fwrapper, fwrapc and the project wscript;
+# waf stores them at configure time and hands them back to fwrapper at build
+# time through `Configuration.to_cmdline`.
+
+class Configuration(object):
+    r"""Options for the code generators.
+
+    Every entry of `options` is an (attribute, command line option, kind,
+    help) tuple.  The kind is 'flag' for an on/off switch, 'procs' for a
+    comma separated list of procedure names, or a tuple of choices, the
+    first of which is the default.
+    """
+
+    options = [
+        ('array_args', '--array-args', ('ndarray', 'memoryview', 'buffer'),
+            'how the wrappers take array arguments: as numpy arrays, as '
+            'typed memoryviews, which accept any Fortran contiguous buffer '
+            'of the right type without a copy, or through the buffer '
+            'protocol directly, which passes such buffers on without '
+            'creating an array or memoryview object'),
+        ('assumed_shape_cfi', '--assumed-shape-cfi', 'flag',
+            'pass assumed-shape array arguments with Fortran 2018 C '
+            'descriptors, which carry the strides of the array, so strided '
+            'and transposed arrays are passed without a copy; needs a '
+            'compiler providing ISO_Fortran_binding.h, e.g. gfortran 9 or '
+            'newer'),
+        ('strict_arrays', '--strict-arrays', 'flag',
+            'never copy array arguments; raise an error naming the argument '
+            'when its dtype, number of dimensions, memory order, alignment or '
+            'writeability would require a copy'),
+        ('copy_stats', '--copy-stats', 'flag',
+            'count the array arguments that are copied and the bytes copied, '
+            'per procedure and argument; the counts are returned by the '
+            "module's fwrap_copy_stats() function"),
+        ('batched', '--batched', 'flag',
+            'also generate a <proc>_batched function for every procedure '
+            'without character arguments; it calls the procedure once per '
+            'index of a trailing batch axis of the array arguments, looping '
+            'in C'),
+        ('ufuncs', '--ufuncs', 'flag',
+            'also generate a NumPy ufunc <proc>_ufunc for every procedure '
+            'whose arguments are all numeric or logical scalars, e.g. '
+            'elemental procedures'),
+        ('char_out_buffers', '--char-out-buffers', 'flag',
+            'take intent(out) character scalars as arguments as well: a '
+            'writable buffer, e.g. a bytearray, is filled in place and '
+            'returned, while None or bytes get a new bytes result'),
+        ('c_order', '--c-order', 'procs',
+            'procedures, or procedure.argument pairs, whose array arguments '
+            'may be passed in C order: a C contiguous array is passed as its '
+            'transpose, a Fortran contiguous view with the extents reversed, '
+            'instead of being copied, and the results are transposed back; '
+            'only for code that does not depend on the order of the '
+            'dimensions'),
+        ('profile', '--profile', 'flag',
+            'count the calls of every procedure, their total and maximum '
+            'time, the time spent in Fortran and in the wrapper, and the '
+            "bytes of their array arguments; returned by the module's "
+            'fwrap_profile() function'),
+        ('workspace', '--workspace', 'procs',
+            'procedure.argument pairs of scratch arguments to hide from the '
+            'Python signature, each optionally followed by =EXPR: a scalar, '
+            'e.g. lwork=max(1,3*n), is set to EXPR, which is required; an '
+            'array is passed a buffer cached per thread, grown when too '
+            'small, whose last extent is EXPR if given; the extents may use '
+            'the scalar arguments and arithmetic, min and max'),
+        ('unchecked', '--unchecked', 'procs',
+            'procedures to also wrap as <proc>_unchecked: the same wrapper '
+            'without the checks of array extents and character lengths, or '
+            'the error handling they need; passing arguments of the wrong '
+            'size is undefined behaviour, so only for validated inner loops'),
+        ('keep_gil', '--keep-gil', 'procs',
+            'procedures to call while holding the GIL, e.g. ones that are '
+            'not thread safe because of SAVE state; every other procedure '
+            'releases the GIL around the call into Fortran'),
+        ]
+
+    def __init__(self, **kwargs):
+        for attr, opt, kind, help in self.options:
+            setattr(self, attr, kwargs.pop(attr, _default(kind)))
+        if kwargs:
+            raise TypeError("unknown configuration options: %s" %
+                            ', '.join(sorted(kwargs)))
+
+    @classmethod
+    def add_options(cls, parser):
+        r"""Add the options to parser.
+
+        Anything with an optparse style `add_option` method works: an
+        OptionParser, an OptionGroup or waf's options context.
+        """
+        for attr, opt, kind, help in cls.options:
+            if kind == 'flag':
+                parser.add_option(opt, dest=attr, action='store_true',
+                                  default=False, help=help)
+            elif kind == 'procs':
+                parser.add_option(opt, dest=attr, action='store', default='',
+                                  metavar='PROC[,PROC...]', help=help)
+            else:
+                parser.add_option(opt, dest=attr, action='store',
+                                  type='choice', choices=list(kind),
+                                  default=kind[0],
+                                  help='%s [default %s]' % (help, kind[0]))
+
+    @classmethod
+    def from_options(cls, opts):
+        r"""Create a configuration from options parsed by a parser set up
+        with `add_options`."""
+        kwargs = {}
+        for attr, opt, kind, help in cls.options:
+            value = getattr(opts, attr, None)
+            if value is None:
+                continue
+            if kind == 'procs':
+                value = _split_procs(value)
+            kwargs[attr] = value
+        return cls(**kwargs)
+
+    def releases_gil(self, proc_name):
+        r"""Whether the wrapper of proc_name releases the GIL around the
+        call into Fortran."""
+        return proc_name.lower() not in self.keep_gil
+
+    def is_unchecked(self, proc_name):
+        r"""Whether proc_name also gets an unchecked wrapper."""
+        return proc_name.lower() in self.unchecked
+
+    def c_order_arg(self, proc_name, arg_name):
+        r"""Whether a C contiguous array passed as arg_name of proc_name
+        is passed as its transpose."""
+        proc_name = proc_name.lower()
+        return (proc_name in self.c_order or
+                '%s.%s' % (proc_name, arg_name.lower()) in self.c_order)
+
+    def workspace_arg(self, proc_name, arg_name):
+        r"""Return the size expression of arg_name of proc_name if it is a
+        workspace argument, '' if it has none, and None if it isn't one."""
+        name = '%s.%s' % (proc_name.lower(), arg_name.lower())
+        for entry in self.workspace:
+            key, sep, expr = entry.partition('=')
+            if key.strip() == name:
+                return expr.strip()
+        return None
+
+    def to_cmdline(self):
+        r"""Return the command line arguments for the non-default options."""
+        args = []
+        for attr, opt, kind, help in self.options:
+            value = getattr(self, attr)
+            if value == _default(kind):
+                continue
+            if kind == 'flag':
+                args.append(opt)
+            elif kind == 'procs':
+                args.append('%s=%s' % (opt, ','.join(value)))
+            else:
+                args.append('%s=%s' % (opt, value))
+        return args
+
+
+def _default(kind):
+    if kind == 'flag':
+        return False
+    elif kind == 'procs':
+        return ()
+    return kind[0]
+
+def _split_procs(value):
+    if isinstance(value, basestring):
+        value = _split_top_level(value)
+    return tuple([name.strip().lower() for name in value if name.strip()])
+
+def _split_top_level(value):
+    # commas inside parentheses belong to size expressions, e.g. max(1,n).
+    items = ['']
+    depth = 0
+    for ch in value:
+        if ch == ',' and not depth:
+            items.append('')
+            continue
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth = max(0, depth - 1)
+        items[-1] += ch
+    return items
@@ -3,26 +3,53 @@
 # All rights reserved. See LICENSE.txt.
 #------------------------------------------------------------------------------
 
+import re
+
 from fwrap import pyf_iface
+from fwrap import fc_wrap
 from fwrap import constants
 from fwrap.code import CodeBuffer
+from fwrap.configuration import Configuration
 
 from fwrap.pyf_iface import _py_kw_mangler
 
 
 
-def wrap_fc(ast):
+def wrap_fc(ast, cfg=None):
+    if cfg is None:
+        cfg = Configuration()
     ret = []
+    modules = {}
     for proc in ast:
-        ret.append(ProcWrapper(wrapped=proc))
+        if isinstance(proc, fc_wrap.ModuleVarWrapper):
+            # the variables of a module are wrapped together.
+            mod_wrapper = modules.get(proc.module.name)
+            if mod_wrapper is None:
+                mod_wrapper = ModuleWrapper(proc.module, cfg)
+                modules[proc.module.name] = mod_wrapper
+                ret.append(mod_wrapper)
+            mod_wrapper.accessors.append(proc)
+            continue
+        if not proc.checked:
+            ret.append(UncheckedProcWrapper(wrapped=proc, cfg=cfg))
+            continue
+        proc_wrapper = ProcWrapper(wrapped=proc, cfg=cfg)
+        ret.append(proc_wrapper)
+        if cfg.batched and BatchedProcWrapper.can_batch(proc_wrapper):
+            ret.append(BatchedProcWrapper(wrapped=proc, cfg=cfg))
+        if cfg.ufuncs and UfuncProcWrapper.can_wrap(proc_wrapper):
+            ret.append(UfuncProcWrapper(wrapped=proc, cfg=cfg))
     return ret
 
 def generate_cy_pxd(ast, fc_pxd_name, buf):
     buf.putln('cimport numpy as np')
     buf.putln("from %s cimport *" % fc_pxd_name)
     buf.putln('')
+    buf.putln('# The <proc>_nogil functions call the procedures without any '
+              'Python objects;')
+    buf.putln('# they return FW_NO_ERR__ or the error code of the wrapper.')
     for proc in ast:
-        buf.putln(proc.cy_prototype())
+        buf.putlines(proc.pxd_declarations())
 
 def gen_cimport_decls(buf):
     for dtype in pyf_iface.intrinsic_types:
@@ -32,24 +59,445 @@ def gen_cdef_extern_decls(buf):
     for dtype in pyf_iface.intrinsic_types:
         buf.putlines(dtype.cdef_extern_decls)
 
-def generate_cy_pyx(ast, name, buf):
-    put_cymod_docstring(ast, name, buf)
+def generate_cy_pyx(ast, name, buf, cfg=None):
+    if cfg is None:
+        cfg = Configuration()
+    put_cymod_docstring(ast, name, buf, cfg)
     buf.putln("np.import_array()")
     buf.putln("include 'fwrap_ktp.pxi'")
     gen_cimport_decls(buf)
     gen_cdef_extern_decls(buf)
+    put_cymod_helpers(cfg, buf)
+    if _uses_cfi(ast):
+        buf.putlines(cfi_array_helper)
+    if _uses_char_buffers(ast):
+        buf.putlines(char_buffer_helper)
+    if _uses_workspace(ast):
+        buf.putlines(workspace_helper)
+    if _uses_module_arrays(ast):
+        buf.putlines(module_array_helper)
     for proc in ast:
         proc.generate_wrapper(buf)
+        if proc.nogil_entry:
+            proc.generate_nogil_wrapper(buf)
+    if cfg.profile:
+        put_profile_functions(ast, buf)
+
+def put_cymod_helpers(cfg, buf):
+    if cfg.array_args == 'memoryview':
+        buf.putln("cimport cython")
+    elif cfg.array_args == 'buffer':
+        buf.putlines(array_buffer_helper)
+    if cfg.strict_arrays:
+        buf.putlines(strict_array_helper)
+    elif cfg.copy_stats:
+        buf.putlines(copy_stats_helper)
+    if cfg.batched:
+        buf.putlines(batched_helper)
+    if cfg.c_order:
+        buf.putlines(c_order_helper)
+    if cfg.profile:
+        buf.putlines(profile_helper)
+    if cfg.ufuncs:
+        buf.putln("np.import_ufunc()")
+
+array_buffer_helper = '''\
+cdef extern from "Python.h":
+    # Py_buffer, with obj as a plain pointer so that an unused view can be
+    # marked empty.
+    ctypedef struct fw_buffer_t "Py_buffer":
+        void *buf
+        void *obj
+        Py_ssize_t len
+        int ndim
+        char *format
+        Py_ssize_t *shape
+    enum:
+        PyBUF_FORMAT
+        PyBUF_WRITABLE
+        PyBUF_F_CONTIGUOUS
+    bint PyObject_CheckBuffer(object obj)
+    int PyObject_GetBuffer(object obj, fw_buffer_t *view, int flags) except -1
+    void PyBuffer_Release(fw_buffer_t *view)
+
+import sys
+cdef char fw_native_order = c'<' if sys.byteorder == 'little' else c'>'
+
+cdef int fw_format_typenum(char *fmt):
+    # The numpy type number of a PEP 3118 format describing a single item
+    # in native byte order, or -1 for any other format.
+    cdef bint cmplx = False, standard = False
+    if fmt == NULL:
+        return np.NPY_UBYTE
+    if fmt[0] == c'@':
+        fmt += 1
+    elif fmt[0] == c'=' or fmt[0] == fw_native_order:
+        # standard sizes, e.g. from ctypes.
+        standard = True
+        fmt += 1
+    if fmt[0] == c'Z':
+        cmplx = True
+        fmt += 1
+    if fmt[0] == 0 or fmt[1] != 0:
+        return -1
+    if cmplx:
+        if fmt[0] == c'f':
+            return np.NPY_CFLOAT
+        elif fmt[0] == c'd':
+            return np.NPY_CDOUBLE
+        elif fmt[0] == c'g':
+            return np.NPY_CLONGDOUBLE
+        return -1
+    if standard:
+        if fmt[0] == c'l':
+            return np.NPY_INT32
+        elif fmt[0] == c'L':
+            return np.NPY_UINT32
+        elif fmt[0] == c'g':
+            return -1
+    if fmt[0] in b'?bBhHiIlLqQfdg':
+        return np.PyArray_DescrFromType(fmt[0]).type_num
+    return -1
+
+cdef bint fw_array_buffer(fw_buffer_t *view, object value, int typenum,
+                          int ndim, bint writeable,
+                          bint required=False) except -1:
+    # Get a Fortran contiguous buffer of value into view.  Unless required,
+    # return False rather than fail when value has no such buffer, or one
+    # of another type or rank; the caller converts value then.
+    cdef int flags = PyBUF_F_CONTIGUOUS | PyBUF_FORMAT
+    if writeable:
+        flags |= PyBUF_WRITABLE
+    if required:
+        PyObject_GetBuffer(value, view, flags)
+        return True
+    if not PyObject_CheckBuffer(value):
+        return False
+    try:
+        PyObject_GetBuffer(value, view, flags)
+    except (BufferError, TypeError, ValueError):
+        return False
+    if (view.ndim == ndim and
+            np.PyArray_EquivTypenums(fw_format_typenum(view.format), typenum)):
+        return True
+    PyBuffer_Release(view)
+    return False
+'''
+
+c_order_helper = '''\
+cdef bint fw_c_order(object value):
+    # Whether value is a C contiguous array that isn't Fortran contiguous;
+    # its transpose is, and can be passed instead of a copy.
+    cdef np.ndarray arr
+    if not isinstance(value, np.ndarray):
+        return False
+    arr = value
+    return (np.PyArray_NDIM(arr) > 1 and
+            np.PyArray_CHKFLAGS(arr, np.NPY_C_CONTIGUOUS) and
+            not np.PyArray_CHKFLAGS(arr, np.NPY_F_CONTIGUOUS))
+'''
+
+cfi_array_helper = '''\
+cdef int fw_cfi_array(CFI_cdesc_t *desc, np.ndarray arr, int rank) except -1:
+    # Describe arr, strides included, in desc.  The Fortran wrapper declares
+    # the type of the argument, the descriptor only describes the memory.
+    cdef int i, err
+    err = CFI_establish(desc, np.PyArray_DATA(arr), CFI_attribute_other,
+                        CFI_type_other, np.PyArray_ITEMSIZE(arr), rank,
+                        <CFI_index_t*>np.PyArray_DIMS(arr))
+    if err != CFI_SUCCESS:
+        raise RuntimeError("CFI_establish failed with error code %d" % err)
+    for i in range(rank):
+        desc.dim[i].sm = np.PyArray_STRIDES(arr)[i]
+    return 0
+'''
+
+char_buffer_helper = '''\
+cdef object fw_char_buffer(object value, bint writeable, object name):
+    # A memoryview of the buffer of a character argument; it keeps the
+    # buffer alive until the wrapper returns.
+    cdef object view
+    cdef Py_buffer *buf
+    try:
+        view = PyMemoryView_FromObject(value)
+    except TypeError:
+        raise TypeError("argument '%s' must be bytes or support the buffer "
+                        "protocol, not %s" % (name, type(value).__name__))
+    buf = PyMemoryView_GET_BUFFER(view)
+    if not PyBuffer_IsContiguous(buf, 'A'):
+        raise ValueError("argument '%s' is not contiguous" % name)
+    if writeable and buf.readonly:
+        raise ValueError("argument '%s' is read-only, but the procedure "
+                         "may write to it" % name)
+    return view
+'''
+
+workspace_helper = '''\
+import threading
+fw_workspaces = threading.local()
+
+cdef np.ndarray fw_workspace(object key, int typenum, np.npy_intp size):
+    # A workspace array of at least size elements, cached per thread and
+    # replaced by a larger one when too small.
+    cdef dict cache
+    cdef np.ndarray ws
+    try:
+        cache = fw_workspaces.cache
+    except AttributeError:
+        cache = fw_workspaces.cache = {}
+    ws = cache.get(key)
+    if ws is None or np.PyArray_SIZE(ws) < size:
+        size = max(size, 1)
+        ws = np.PyArray_EMPTY(1, &size, typenum, 1)
+        cache[key] = ws
+    return ws
+'''
+
+module_array_helper = '''\
+cdef object fw_module_array(object view, void *data, int ndim,
+                            fwi_npy_intp_t *shape, int typenum,
+                            bint writeable):
+    # A Fortran ordered array viewing the module array at data, or None if
+    # it isn't allocated; view is returned again if it still matches.
+    cdef np.ndarray arr
+    cdef int i
+    if data == NULL:
+        return None
+    if view is not None:
+        arr = view
+        if np.PyArray_DATA(arr) == data:
+            for i in range(ndim):
+                if np.PyArray_DIMS(arr)[i] != shape[i]:
+                    break
+            else:
+                return view
+    arr = np.PyArray_New(np.ndarray, ndim, <np.npy_intp*>shape, typenum,
+                         NULL, data, 0, np.NPY_FARRAY, None)
+    if not writeable:
+        arr.flags.writeable = False
+    return arr
+
+cdef int fw_module_array_set(object view, object value,
+                             object name) except -1:
+    # assign value to all of the module array viewed.
+    if view is None:
+        raise ValueError("module array %s is not allocated" % name)
+    view[...] = value
+    return 0
+'''
+
+def cymod_helper_names(cfg):
+    names = []
+    if cfg.copy_stats and not cfg.strict_arrays:
+        names += ['fwrap_copy_stats', 'fwrap_reset_copy_stats']
+    if cfg.profile:
+        names += ['fwrap_profile', 'fwrap_reset_profile']
+    return names
+
+profile_helper = '''\
+cdef extern from "time.h":
+    ctypedef struct fw_timespec_t "struct timespec":
+        long tv_sec
+        long tv_nsec
+    enum:
+        CLOCK_MONOTONIC
+    int clock_gettime(int clock, fw_timespec_t *ts) nogil
+
+ctypedef struct fw_profile_t:
+    long long count
+    double total
+    double max
+    double fortran
+    long long nbytes
+
+cdef inline double fw_clock() nogil:
+    # seconds on the monotonic clock.
+    cdef fw_timespec_t ts
+    clock_gettime(CLOCK_MONOTONIC, &ts)
+    return ts.tv_sec + 1e-9 * ts.tv_nsec
+
+cdef inline void fw_profile_record(fw_profile_t *prof, double t0, double t1,
+                                   double t2, long long nbytes):
+    # A call entered the wrapper at t0 and ran in Fortran from t1 to t2.
+    cdef double elapsed = fw_clock() - t0
+    prof.count += 1
+    prof.total += elapsed
+    if elapsed > prof.max:
+        prof.max = elapsed
+    prof.fortran += t2 - t1
+    prof.nbytes += nbytes
+
+cdef void fw_profile_clear(fw_profile_t *prof):
+    prof.count = prof.nbytes = 0
+    prof.total = prof.max = prof.fortran = 0
+
+cdef object fw_profile_stats(dict stats, object name, fw_profile_t *prof):
+    if prof.count:
+        stats[name] = {'count' : prof.count,
+                       'total' : prof.total,
+                       'max' : prof.max,
+                       'fortran' : prof.fortran,
+                       'marshal' : prof.total - prof.fortran,
+                       'nbytes' : prof.nbytes}
+'''
+
+def put_profile_functions(ast, buf):
+    profiled = [proc for proc in ast if proc.profiled()]
+    buf.putlines('''\
+def fwrap_profile():
+    """
+    fwrap_profile() -> stats
+
+    Return the calls of the procedures since the module was loaded or
+    fwrap_reset_profile() was called.  stats maps the names of the
+    procedures called to dicts with the 'count' of calls, their 'total'
+    and 'max' time in seconds, the parts of the total spent in Fortran,
+    'fortran', and in the wrapper, 'marshal', and the total size in bytes
+    of their array arguments, 'nbytes'.
+
+    """
+    cdef dict stats = {}''')
+    buf.indent()
+    for proc in profiled:
+        buf.putln("fw_profile_stats(stats, '%s', &%s)" %
+                  (proc.name, proc.profile_name()))
+    buf.putln("return stats")
+    buf.dedent()
+    buf.putlines('''\
+def fwrap_reset_profile():
+    """
+    fwrap_reset_profile()
+
+    Reset the counts returned by fwrap_profile().
+
+    """''')
+    buf.indent()
+    for proc in profiled:
+        buf.putln("fw_profile_clear(&%s)" % proc.profile_name())
+    buf.dedent()
+
+strict_array_helper = '''\
+cdef object fw_strict_array(object value, int typenum, int ndim,
+                            bint writeable, object name,
+                            bint contiguous=True):
+    # Return value if it can be passed to the Fortran procedure as is;
+    # otherwise raise an error describing why it would have to be copied.
+    cdef np.ndarray arr
+    if not isinstance(value, np.ndarray):
+        raise TypeError("argument '%s' must be a numpy array, not %s "
+                        "(copying is disabled)" % (name, type(value).__name__))
+    arr = value
+    if (not np.PyArray_EquivTypenums(np.PyArray_TYPE(arr), typenum) or
+            not np.PyArray_ISNOTSWAPPED(arr)):
+        raise TypeError("argument '%s' has dtype %s, expected %s "
+                        "(copying is disabled)" %
+                        (name, arr.dtype, np.PyArray_DescrFromType(typenum)))
+    if np.PyArray_NDIM(arr) != ndim:
+        raise ValueError("argument '%s' has %d dimensions, expected %d" %
+                         (name, np.PyArray_NDIM(arr), ndim))
+    if contiguous and not np.PyArray_CHKFLAGS(arr, np.NPY_F_CONTIGUOUS):
+        if np.PyArray_CHKFLAGS(arr, np.NPY_C_CONTIGUOUS):
+            order = "is C contiguous"
+        else:
+            order = "is not contiguous"
+        raise ValueError("argument '%s' %s, expected a Fortran contiguous "
+                         "array (copying is disabled)" % (name, order))
+    if not np.PyArray_CHKFLAGS(arr, np.NPY_ALIGNED):
+        raise ValueError("argument '%s' is not aligned "
+                         "(copying is disabled)" % name)
+    if writeable and not np.PyArray_CHKFLAGS(arr, np.NPY_WRITEABLE):
+        raise ValueError("argument '%s' is read-only, but the procedure "
+                         "may write to it" % name)
+    return arr
+'''
+
+copy_stats_helper = '''\
+cdef dict fw_copy_stats = {}
+
+cdef object fw_coerce_array(object value, int typenum, int ndim,
+                            object proc, object name,
+                            int requirements=np.NPY_F_CONTIGUOUS):
+    # PyArray_FROMANY, recording the copies it makes.
+    cdef object arr = np.PyArray_FROMANY(value, typenum, ndim, ndim,
+                                         requirements)
+    cdef list stats
+    if arr is not value:
+        stats = fw_copy_stats.get((proc, name))
+        if stats is None:
+            stats = fw_copy_stats[proc, name] = [0, 0]
+        stats[0] += 1
+        stats[1] += np.PyArray_NBYTES(arr)
+    return arr
+
+def fwrap_copy_stats():
+    """
+    fwrap_copy_stats() -> stats
+
+    Return the array arguments copied since the module was loaded or
+    fwrap_reset_copy_stats() was called.  stats maps the names of the
+    procedures that copied to dicts with the total 'count' of copies, the
+    total 'nbytes' copied and, under 'args', a (count, nbytes) tuple for
+    every argument that was copied.
+
+    """
+    cdef dict ret = {}
+    for (proc, name), (count, nbytes) in sorted(fw_copy_stats.items()):
+        proc_stats = ret.setdefault(proc, {'count' : 0, 'nbytes' : 0,
+                                           'args' : {}})
+        proc_stats['count'] += count
+        proc_stats['nbytes'] += nbytes
+        proc_stats['args'][name] = (count, nbytes)
+    return ret
 
-def put_cymod_docstring(ast, modname, buf):
-    dstring = get_cymod_docstring(ast, modname)
+def fwrap_reset_copy_stats():
+    """
+    fwrap_reset_copy_stats()
+
+    Reset the counts returned by fwrap_copy_stats().
+
+    """
+    fw_copy_stats.clear()
+'''
+
+batched_helper = '''\
+cdef np.npy_intp fw_batch_len(np.ndarray arr, int ndim, np.npy_intp nbatch,
+                              object name) except -2:
+    # Return the number of batches of arr, an argument of rank ndim with the
+    # batch axis appended, checking it against nbatch (-1 if not known yet).
+    # Arguments without the batch axis are used for every batch.
+    cdef np.npy_intp n
+    if np.PyArray_NDIM(arr) == ndim:
+        return nbatch
+    n = np.PyArray_DIM(arr, ndim)
+    if nbatch != -1 and n != nbatch:
+        raise ValueError("argument '%s' has %d batches, expected %d" %
+                         (name, n, nbatch))
+    return n
+
+cdef np.npy_intp fw_batch_stride(np.ndarray arr, int ndim):
+    # The byte offset between consecutive batches of arr.
+    if np.PyArray_NDIM(arr) == ndim:
+        return 0
+    return np.PyArray_STRIDE(arr, ndim)
+
+cdef np.ndarray fw_batch_out(object value, int typenum, np.npy_intp nbatch):
+    # A new array with one element per batch, filled from value unless it
+    # is None.
+    cdef np.ndarray arr = np.PyArray_EMPTY(1, &nbatch, typenum, 1)
+    if value is not None:
+        arr[...] = value
+    return arr
+'''
+
+def put_cymod_docstring(ast, modname, buf, cfg=None):
+    dstring = get_cymod_docstring(ast, modname, cfg)
     buf.putln('"""')
     buf.putlines(dstring)
     buf.putempty()
     buf.putln('"""')
 
 # XXX:  Put this in a cymodule class?
-def get_cymod_docstring(ast, modname):
+def get_cymod_docstring(ast, modname, cfg=None):
     from fwrap.version import get_version
     from fwrap.gen_config import all_dtypes
     dstring = ("""\
@@ -62,11 +510,22 @@ For usage information see the function docstrings.
     dstring += ["Functions",
                 "---------"]
     # Functions
-    names = sorted(["%s(...)" % proc.name for proc in ast])
-    dstring += names
+    names = [proc.name for proc in ast
+                if not isinstance(proc, ModuleWrapper)]
+    if cfg is not None:
+        names += cymod_helper_names(cfg)
+    dstring += sorted(["%s(...)" % name for name in names])
 
     dstring += [""]
 
+    # Fortran modules
+    names = [proc.name for proc in ast if isinstance(proc, ModuleWrapper)]
+    if names:
+        dstring += ["Modules",
+                    "-------"]
+        dstring += sorted(names)
+        dstring += [""]
+
     dstring += ["Data Types",
                 "----------"]
     # Datatypes
@@ -76,14 +535,14 @@ For usage information see the function docstrings.
 
     return dstring
 
-def CyArgWrapper(arg):
+def CyArgWrapper(arg, cfg=None):
     import fc_wrap
     if isinstance(arg, fc_wrap.ErrStrArgWrapper):
         return _CyErrStrArg(arg)
     elif isinstance(arg.dtype, pyf_iface.ComplexType):
         return _CyCmplxArg(arg)
     elif isinstance(arg.dtype, pyf_iface.CharacterType):
-        return _CyCharArg(arg)
+        return _CyCharArg(arg, cfg)
     return _CyArgWrapper(arg)
 
 
@@ -122,9 +581,22 @@ class _CyArgWrapper(object):
     def call_arg_list(self):
         return ["&%s" % self.name]
 
+    def nogil_arg_declarations(self):
+        if self.arg.intent == 'in':
+            return ["%s %s" % (self.cy_dtype_name, self.name)]
+        return ["%s *%s" % (self.cy_dtype_name, self.name)]
+
+    def nogil_call_arg_list(self):
+        if self.arg.intent == 'in':
+            return ["&%s" % self.name]
+        return [self.name]
+
     def post_call_code(self):
         return []
 
+    def nbytes_code(self):
+        return []
+
     def pre_call_code(self):
         return []
 
@@ -159,11 +631,18 @@ class _CyArgWrapper(object):
 
 class _CyCharArg(_CyArgWrapper):
 
-    def __init__(self, arg):
+    # bytes arguments are copied into (or out of) a new bytes object as
+    # before; any other object supporting the buffer protocol, e.g. a
+    # bytearray, a memoryview or a numpy array, is passed to Fortran in place
+    # through a memoryview of it.
+
+    def __init__(self, arg, cfg=None):
         super(_CyCharArg, self).__init__(arg)
+        self.cfg = cfg or Configuration()
         self.intern_name = 'fw_%s' % self.name
         self.intern_len_name = '%s_len' % self.intern_name
         self.intern_buf_name = '%s_buf' % self.intern_name
+        self.intern_view_name = '%s_view' % self.intern_name
 
     def _get_cy_dtype_name(self):
         return "fw_bytes"
@@ -172,18 +651,28 @@ class _CyCharArg(_CyArgWrapper):
         from fwrap.gen_config import py_type_name_from_type
         return py_type_name_from_type(self.arg.ktp)
 
+    def takes_buffer(self):
+        if self.arg.intent == 'out':
+            return self.cfg.char_out_buffers
+        return True
+
     def extern_declarations(self):
-        if self.arg.intent in ('in', 'inout', None):
-            return ["%s %s" % (self.cy_dtype_name, self.name)]
-        elif self.is_assumed_size():
-            return ['%s %s' % (self.cy_dtype_name, self.name)]
+        # an assumed length result takes its length from the argument.
+        if self.takes_buffer() or self.is_assumed_size():
+            return ["object %s" % self.name]
+        return []
+
+    def docstring_extern_arg_list(self):
+        if self.takes_buffer() or self.is_assumed_size():
+            return [self.name]
         return []
 
     def intern_declarations(self):
         ret = ['cdef %s %s' % (self.cy_dtype_name, self.intern_name),
-                'cdef fwi_npy_intp_t %s' % self.intern_len_name]
-        if self.arg.intent in ('out', 'inout', None):
-            ret.append('cdef char *%s' % self.intern_buf_name)
+               'cdef fwi_npy_intp_t %s' % self.intern_len_name,
+               'cdef char *%s' % self.intern_buf_name]
+        if self.takes_buffer():
+            ret.append('cdef object %s' % self.intern_view_name)
         return ret
 
     def get_len(self):
@@ -200,8 +689,10 @@ class _CyCharArg(_CyArgWrapper):
         return len_str
 
     def _in_pre_call_code(self):
+        # the buffer pointer is taken here, the call may not hold the GIL.
         return ['%s = len(%s)' % (self.intern_len_name, self.name),
-                '%s = %s' % (self.intern_name, self.name)]
+                '%s = %s' % (self.intern_name, self.name),
+                '%s = <char*>%s' % (self.intern_buf_name, self.intern_name)]
 
     def _out_pre_call_code(self):
         len_str = self._len_str()
@@ -215,29 +706,62 @@ class _CyCharArg(_CyArgWrapper):
                (self.intern_buf_name, self.name, self.intern_len_name)]
        return ret
 
+    def _buffer_pre_call_code(self):
+        # the length is the size of the buffer; the Fortran wrapper checks
+        # it against the declared length.
+        view = self.intern_view_name
+        return ["%s = fw_char_buffer(%s, %d, '%s')" %
+                    (view, self.name, self.arg.intent != 'in', self.name),
+                '%s = PyMemoryView_GET_BUFFER(%s).len' %
+                    (self.intern_len_name, view),
+                '%s = <char*>PyMemoryView_GET_BUFFER(%s).buf' %
+                    (self.intern_buf_name, view)]
+
+    def _bytes_test(self):
+        test = 'type(%s) is bytes' % self.name
+        if self.arg.intent == 'out' and not self.is_assumed_size():
+            test = '%s is None or %s' % (self.name, test)
+        return test
+
     def pre_call_code(self):
         if self.arg.intent == 'in':
-            return self._in_pre_call_code()
+            ret = self._in_pre_call_code()
         elif self.arg.intent == 'out':
-            return self._out_pre_call_code()
+            ret = self._out_pre_call_code()
         elif self.arg.intent in ('inout', None):
-            return self._inout_pre_call_code()
+            ret = self._inout_pre_call_code()
+        if not self.takes_buffer():
+            return ret
+        if self.arg.intent != 'in':
+            # tells return_tuple_list which of the two was used.
+            ret.append('%s = None' % self.intern_view_name)
+        return (['if %s:' % self._bytes_test()] +
+                ['    %s' % line for line in ret] +
+                ['else:'] +
+                ['    %s' % line for line in self._buffer_pre_call_code()])
 
     def _fromstringandsize_call(self):
         return '%s = PyBytes_FromStringAndSize(NULL, %s)' % \
                     (self.intern_name, self.intern_len_name)
 
     def call_arg_list(self):
-        if self.arg.intent == 'in':
-            return ['&%s' % self.intern_len_name,
-                    '<char*>%s' % self.intern_name]
-        else:
-            return ['&%s' % self.intern_len_name, self.intern_buf_name]
+        return ['&%s' % self.intern_len_name, self.intern_buf_name]
+
+    def nogil_arg_declarations(self):
+        return ['fwi_npy_intp_t %s_len' % self.name,
+                'fw_character_t *%s' % self.name]
+
+    def nogil_call_arg_list(self):
+        return ['&%s_len' % self.name, self.name]
 
     def return_tuple_list(self):
-        if self.arg.intent in ('out', 'inout', None):
-            return [self.intern_name]
-        return []
+        if self.arg.intent not in ('out', 'inout', None):
+            return []
+        if self.takes_buffer():
+            # a buffer argument is returned itself.
+            return ['(%s if %s is not None else %s)' %
+                        (self.name, self.intern_view_name, self.intern_name)]
+        return [self.intern_name]
 
     def _gen_dstring(self):
         dstring = ["%s : %s" %
@@ -248,7 +772,7 @@ class _CyCharArg(_CyArgWrapper):
         return [", ".join(dstring)]
 
     def in_dstring(self):
-        if self.is_assumed_size():
+        if self.takes_buffer() or self.is_assumed_size():
             return self._gen_dstring()
         else:
             return super(_CyCharArg, self).in_dstring()
@@ -283,6 +807,9 @@ class _CyErrStrArg(object):
     def post_call_code(self):
         return []
 
+    def nbytes_code(self):
+        return []
+
     def docstring_extern_arg_list(self):
         return []
 
@@ -310,25 +837,65 @@ class _CyCmplxArg(_CyArgWrapper):
         return ['&%s' % self.name]
 
 
-def CyArrayArgWrapper(arg):
+def CyArrayArgWrapper(arg, cfg=None, proc_name=None):
+    import fc_wrap
     if arg.dtype.type == 'character':
-        return CyCharArrayArgWrapper(arg)
-    return _CyArrayArgWrapper(arg)
+        return CyCharArrayArgWrapper(arg, cfg, proc_name)
+    elif isinstance(arg, fc_wrap.CfiArrayArgWrapper):
+        return CyCfiArrayArgWrapper(arg, cfg, proc_name)
+    return _CyArrayArgWrapper(arg, cfg, proc_name)
 
 
 class _CyArrayArgWrapper(object):
 
     is_array = True
+    # whether Fortran needs the data Fortran contiguous.
+    contiguous = True
 
-    def __init__(self, arg):
+    def __init__(self, arg, cfg=None, proc_name=None):
         self.arg = arg
+        self.cfg = cfg or Configuration()
+        self.proc_name = proc_name
         self.extern_name = _py_kw_mangler(self.arg.name)
         self.intern_name = '%s_' % self.extern_name
+        self.corder_name = '%s_corder' % self.extern_name
+        self.buf_name = '%s_buf' % self.extern_name
 
     def extern_declarations(self):
         return ['object %s' % self.extern_name]
 
+    def uses_memoryview(self):
+        return self.cfg.array_args == 'memoryview'
+
+    def uses_buffer(self):
+        return self.cfg.array_args == 'buffer'
+
+    def takes_c_order(self):
+        # descriptor arguments take any layout as it is.
+        return (self.contiguous and self.arg.ndims > 1 and
+                self.proc_name is not None and
+                self.cfg.c_order_arg(self.proc_name, self.arg.name))
+
     def intern_declarations(self):
+        ret = self._intern_declarations()
+        if self.takes_c_order():
+            ret.append('cdef bint %s' % self.corder_name)
+        return ret
+
+    def _intern_declarations(self):
+        if self.uses_memoryview():
+            # Fortran contiguous; read-only buffers are fine for intent in.
+            return ["cdef %s%s[%s] %s" %
+                    (self.arg.intent == 'in' and 'const ' or '',
+                     self.arg.ktp,
+                     ', '.join(['::1'] + [':']*(self.arg.ndims-1)),
+                     self.intern_name)]
+        if self.uses_buffer():
+            # the buffer is released after the call, whether or not it was
+            # acquired, so it must start out empty.
+            return ['cdef object %s' % self.intern_name,
+                    'cdef fw_buffer_t %s' % self.buf_name,
+                    '%s.obj = NULL' % self.buf_name]
         return ["cdef np.ndarray[%s, ndim=%d, mode='fortran'] %s" % \
                 (self.arg.ktp,
                  self.arg.ndims,
@@ -340,31 +907,127 @@ class _CyArrayArgWrapper(object):
         return py_type_name_from_type(self.arg.ktp)
 
     def call_arg_list(self):
-        shapes = ['<fwi_npy_intp_t*>&%s.shape[%d]' % (self.intern_name, i) \
+        if self.uses_buffer():
+            shape_of = self.buf_name
+        else:
+            shape_of = self.intern_name
+        shapes = ['<fwi_npy_intp_t*>&%s.shape[%d]' % (shape_of, i) \
                                 for i in range(self.arg.ndims)]
-        data = ['<%s*>%s.data' % (self.arg.ktp, self.intern_name)]
-        return shapes + data
+        return shapes + [self._data_ptr()]
+
+    def _data_ptr(self):
+        if self.uses_buffer():
+            return '<%s*>%s.buf' % (self.arg.ktp, self.buf_name)
+        if self.uses_memoryview():
+            # the wrapper is compiled without bounds checks, so this is
+            # fine for empty arrays too.
+            return '<%s*>&%s[%s]' % (self.arg.ktp, self.intern_name,
+                                     ', '.join(['0']*self.arg.ndims))
+        return '<%s*>%s.data' % (self.arg.ktp, self.intern_name)
+
+    def nogil_extent_names(self):
+        return ['%s_d%d' % (self.extern_name, i+1)
+                    for i in range(self.arg.ndims)]
+
+    def nogil_arg_declarations(self):
+        return (['fwi_npy_intp_t %s' % name
+                    for name in self.nogil_extent_names()] +
+                ['%s *%s' % (self.arg.ktp, self.extern_name)])
+
+    def nogil_call_arg_list(self):
+        return (['&%s' % name for name in self.nogil_extent_names()] +
+                [self.extern_name])
 
     def pre_call_code(self):
-        # NOTE: we can support a STRICT macro that would disable the
-        # PyArray_ANYARRAY() call, forcing all incoming arrays to be already F
-        # contiguous.
-        tmpl = ("%(intern)s = np.PyArray_FROMANY("
+        return self.c_order_code() + self._pre_call_code()
+
+    def c_order_code(self):
+        # a C contiguous argument is passed as its transpose, the extents
+        # reversed, rather than copied to Fortran order.
+        if not self.takes_c_order():
+            return []
+        return ['%s = fw_c_order(%s)' % (self.corder_name, self.extern_name),
+                'if %s:' % self.corder_name,
+                '    %s = %s.T' % (self.extern_name, self.extern_name)]
+
+    def _pre_call_code(self):
+        if self.uses_memoryview():
+            # take any buffer that fits as it is, convert anything else.
+            return ['try:',
+                    '    %s = %s' % (self.intern_name, self.extern_name),
+                    'except (TypeError, ValueError):',
+                    '    %s' % self.coerce_code(self.arg.ndims,
+                                                self.proc_name)]
+        if self.uses_buffer():
+            # pass the buffer of the argument itself if it fits, whatever
+            # object it comes from; convert anything else.
+            get_buffer = ('fw_array_buffer(&%s, %s, %s, %d, %d' %
+                            (self.buf_name, self.intern_name,
+                             self._npy_enum(), self.arg.ndims,
+                             self.arg.intent != 'in'))
+            return ['%s = %s' % (self.intern_name, self.extern_name),
+                    'if not %s):' % get_buffer,
+                    '    %s' % self.coerce_code(self.arg.ndims,
+                                                self.proc_name),
+                    '    %s, 1)' % get_buffer]
+        return [self.coerce_code(self.arg.ndims, self.proc_name)]
+
+    def coerce_code(self, ndim, proc_name):
+        if self.cfg.strict_arrays:
+            # incoming arrays must already be usable as they are.
+            tmpl = ("%(intern)s = fw_strict_array("
+                                    "%(extern)s, %(dtenum)s, %(ndim)d, "
+                                    "%(writeable)d, '%(extern)s'%(strict)s)")
+        elif self.cfg.copy_stats:
+            tmpl = ("%(intern)s = fw_coerce_array("
+                                    "%(extern)s, %(dtenum)s, %(ndim)d, "
+                                    "'%(proc)s', '%(extern)s'%(coerce)s)")
+        else:
+            tmpl = ("%(intern)s = np.PyArray_FROMANY("
                                     "%(extern)s, %(dtenum)s, "
                                     "%(ndim)d, %(ndim)d, "
-                                    "np.NPY_F_CONTIGUOUS)")
+                                    "%(requirements)s)")
         d = {'intern' : self.intern_name,
              'extern' : self.extern_name,
-             'dtenum' : self.arg.dtype.npy_enum,
-             'ndim' : self.arg.ndims}
-        return [tmpl % d]
+             'dtenum' : self._npy_enum(),
+             'ndim' : ndim,
+             'writeable' : self.arg.intent != 'in',
+             'proc' : proc_name,
+             'requirements' : 'np.NPY_F_CONTIGUOUS',
+             'strict' : '',
+             'coerce' : ''}
+        if not self.contiguous:
+            d.update(requirements='np.NPY_ALIGNED',
+                     strict=', 0',
+                     coerce=', np.NPY_ALIGNED')
+        return tmpl % d
+
+    def _npy_enum(self):
+        return self.arg.dtype.npy_enum
 
     def post_call_code(self):
+        if self.uses_buffer():
+            return ['PyBuffer_Release(&%s)' % self.buf_name]
         return []
 
+    def nbytes_code(self):
+        # the size of the array passed, for profiling.
+        if self.uses_buffer():
+            return ['%s.len' % self.buf_name]
+        elif self.uses_memoryview():
+            return ['%s.nbytes' % self.intern_name]
+        return ['np.PyArray_NBYTES(%s)' % self.intern_name]
+
     def return_tuple_list(self):
         if self.arg.intent in ('out', 'inout', None):
-            return [self.intern_name]
+            if self.uses_memoryview():
+                # the object the buffer came from.
+                ret = '%s.base' % self.intern_name
+            else:
+                ret = self.intern_name
+            if self.takes_c_order():
+                ret = '(%s.T if %s else %s)' % (ret, self.corder_name, ret)
+            return [ret]
         return []
 
     def _gen_dstring(self):
@@ -398,42 +1061,51 @@ class _CyArrayArgWrapper(object):
 
 class CyCharArrayArgWrapper(_CyArrayArgWrapper):
 
-    def __init__(self, arg):
-        super(CyCharArrayArgWrapper, self).__init__(arg)
+    # The Fortran side takes the element length and the extents separately
+    # from a pointer to the data, so the S<n> array is passed as it is: the
+    # caller's array is never touched (in particular its dtype isn't
+    # reassigned), which keeps concurrent calls on shared arrays safe.
+
+    def __init__(self, arg, cfg=None, proc_name=None):
+        super(CyCharArrayArgWrapper, self).__init__(arg, cfg, proc_name)
         intern_name = _py_kw_mangler(self.arg.intern_name)
-        self.odtype_name = "%s_odtype" % intern_name
         self.shape_name = "%s_shape" % intern_name
         self.name = intern_name
 
-    def intern_declarations(self):
-        ret = super(CyCharArrayArgWrapper, self).intern_declarations()
-        return ret + ["cdef fwi_npy_intp_t %s[%d]" %
-                (self.shape_name, self.arg.ndims+1)]
-
-    def pre_call_code(self):
-        tmpl = ("%(odtype)s = %(name)s.dtype\n"
-                "for i in range(%(ndim)d): "
-                    "%(shape)s[i+1] = %(name)s.shape[i]\n"
-                "%(name)s.dtype = 'b'\n"
-                "%(intern)s = %(name)s\n"
-                "%(shape)s[0] = <fwi_npy_intp_t>"
-                    "(%(name)s.shape[0]/%(shape)s[1])")
-        D = {"odtype" : self.odtype_name,
-             "ndim" : self.arg.ndims,
-             "name" : self.extern_name,
-             "intern" : self.intern_name,
-             "shape" : self.shape_name}
-
-        return (tmpl  % D).splitlines()
+    def uses_memoryview(self):
+        # no buffer is acquired, see call_arg_list.
+        return False
+
+    def uses_buffer(self):
+        return False
+
+    def _intern_declarations(self):
+        return ["cdef np.ndarray %s" % self.intern_name,
+                "cdef fwi_npy_intp_t %s[%d]" %
+                    (self.shape_name, self.arg.ndims+1)]
+
+    def _pre_call_code(self):
+        ret = [self.coerce_code(self.arg.ndims, self.proc_name),
+               "%s[0] = np.PyArray_ITEMSIZE(%s)" %
+                    (self.shape_name, self.intern_name)]
+        for i in range(self.arg.ndims):
+            ret.append("%s[%d] = %s.shape[%d]" %
+                    (self.shape_name, i+1, self.intern_name, i))
+        return ret
 
-    def post_call_code(self):
-        return ["%s.dtype = %s" % (self.extern_name, self.odtype_name)]
+    def _npy_enum(self):
+        # NPY_STRING without a length keeps the length of the argument.
+        return 'np.NPY_STRING'
 
     def call_arg_list(self):
         shapes = ["&%s[%d]" % (self.shape_name, i)
                     for i in range(self.arg.ndims+1)]
-        data = ["<%s*>%s.data" % (self.arg.ktp, self.intern_name)]
-        return shapes + data
+        return shapes + [self._data_ptr()]
+
+    def nogil_extent_names(self):
+        # the length of the elements comes first.
+        return (['%s_len' % self.extern_name] +
+                super(CyCharArrayArgWrapper, self).nogil_extent_names())
 
     def _gen_dstring(self):
         dims = self.arg.orig_arg.dimension
@@ -449,20 +1121,148 @@ class CyCharArrayArgWrapper(_CyArrayArgWrapper):
         return [", ".join(dstring)]
 
 
+class CyWorkspaceArrayArgWrapper(_CyArrayArgWrapper):
+
+    # A scratch array hidden from the Python signature.  The wrapper passes
+    # a per thread cached array, grown when too small, with the extents the
+    # Fortran declaration asks for, computed from the scalar arguments and
+    # the values of the hidden scalars.
+
+    def __init__(self, arg, cfg=None, proc_name=None, hidden=()):
+        super(CyWorkspaceArrayArgWrapper, self).__init__(arg, cfg, proc_name)
+        self.shape_name = '%s_shape' % self.extern_name
+        self.key = '%s.%s' % (proc_name, self.extern_name)
+        self.extents = self._extents(hidden)
+
+    def _extents(self, hidden):
+        dims = list(self.arg.orig_arg.dimension)
+        expr = self.cfg.workspace_arg(self.proc_name, self.arg.name)
+        extents = []
+        for i, dim in enumerate(dims):
+            if expr and i == len(dims) - 1:
+                extent = expr
+            elif dim.is_explicit_shape:
+                extent = dim.sizeexpr
+            else:
+                raise ValueError("workspace array %s has a dimension of "
+                                 "unknown extent; give the last one as "
+                                 "%s=EXPR" % (self.key, self.key))
+            for argw in hidden:
+                extent = re.sub(r'\b%s\b' % argw.name,
+                                '(%s)' % argw.value, extent)
+            extents.append(extent.lower())
+        return extents
+
+    def extern_declarations(self):
+        return []
+
+    def uses_memoryview(self):
+        return False
+
+    def uses_buffer(self):
+        return False
+
+    def takes_c_order(self):
+        return False
+
+    def _intern_declarations(self):
+        return ['cdef np.ndarray %s' % self.intern_name,
+                'cdef fwi_npy_intp_t %s[%d]' %
+                    (self.shape_name, self.arg.ndims)]
+
+    def _pre_call_code(self):
+        ret = []
+        for i, extent in enumerate(self.extents):
+            ret.append('%s[%d] = %s' % (self.shape_name, i, extent))
+        size = ' * '.join(['%s[%d]' % (self.shape_name, i)
+                                for i in range(self.arg.ndims)])
+        ret.append("%s = fw_workspace('%s', %s, %s)" %
+                    (self.intern_name, self.key, self._npy_enum(), size))
+        return ret
+
+    def call_arg_list(self):
+        shapes = ['&%s[%d]' % (self.shape_name, i)
+                    for i in range(self.arg.ndims)]
+        return shapes + [self._data_ptr()]
+
+    def return_tuple_list(self):
+        return []
+
+    def in_dstring(self):
+        return []
+
+    def out_dstring(self):
+        return []
+
+    def docstring_extern_arg_list(self):
+        return []
+
+    def docstring_return_tuple_list(self):
+        return []
+
+
+class CyCfiArrayArgWrapper(_CyArrayArgWrapper):
+
+    # Passed to Fortran as a C descriptor built from the array's data
+    # pointer, extents and strides; any aligned array of the right type goes
+    # through as it is, whatever its memory layout.
+
+    contiguous = False
+
+    def __init__(self, arg, cfg=None, proc_name=None):
+        super(CyCfiArrayArgWrapper, self).__init__(arg, cfg, proc_name)
+        self.cdesc_name = '%s_cdesc' % self.extern_name
+
+    def uses_memoryview(self):
+        return False
+
+    def uses_buffer(self):
+        return False
+
+    def _intern_declarations(self):
+        return ['cdef np.ndarray %s' % self.intern_name,
+                'cdef fw_cfi_cdesc_t %s' % self.cdesc_name]
+
+    def _pre_call_code(self):
+        return [self.coerce_code(self.arg.ndims, self.proc_name),
+                'fw_cfi_array(<CFI_cdesc_t*>&%s, %s, %d)' %
+                    (self.cdesc_name, self.intern_name, self.arg.ndims)]
+
+    def call_arg_list(self):
+        return ['<CFI_cdesc_t*>&%s' % self.cdesc_name]
+
+    def nogil_arg_declarations(self):
+        return ['CFI_cdesc_t *%s' % self.extern_name]
+
+    def nogil_call_arg_list(self):
+        return [self.extern_name]
+
+
 class CyArgWrapperManager(object):
 
     def __init__(self, args):
         self.args = args
 
     @classmethod
-    def from_fwrapped_proc(cls, fw_proc):
+    def from_fwrapped_proc(cls, fw_proc, cfg=None):
         fw_arg_man = fw_proc.arg_man
+        proc_name = _py_kw_mangler(fw_proc.wrapped_name())
+        hidden = fw_arg_man.hidden_args()
         args = []
         for fw_arg in fw_arg_man.arg_wrappers:
+            if fw_arg in hidden:
+                # set by the Fortran wrapper.
+                continue
             if fw_arg.is_array:
-                args.append(CyArrayArgWrapper(fw_arg))
+                if (cfg is not None and
+                        cfg.workspace_arg(fw_proc.wrapped_name(),
+                                          fw_arg.name) is not None):
+                    args.append(CyWorkspaceArrayArgWrapper(fw_arg, cfg,
+                                                           proc_name, hidden))
+                else:
+                    args.append(CyArrayArgWrapper(fw_arg, cfg, proc_name))
             else:
-                args.append(CyArgWrapper(fw_arg))
+                args.append(CyArgWrapper(fw_arg, cfg))
         return cls(args=args)
 
     def call_arg_list(self):
@@ -477,6 +1277,29 @@ class CyArgWrapperManager(object):
             decls.extend(arg.extern_declarations())
         return decls
 
+    def nogil_arg_declarations(self):
+        decls = []
+        for arg in self.args:
+            if not _is_err_arg(arg):
+                decls.extend(arg.nogil_arg_declarations())
+        return decls
+
+    def nogil_call_arg_list(self):
+        cal = []
+        for arg in self.args:
+            if _is_err_arg(arg):
+                cal.extend(arg.call_arg_list())
+            else:
+                cal.extend(arg.nogil_call_arg_list())
+        return cal
+
+    def err_declarations(self):
+        decls = []
+        for arg in self.args:
+            if _is_err_arg(arg):
+                decls.extend(arg.intern_declarations())
+        return decls
+
     def intern_declarations(self):
         decls = []
         for arg in self.args:
@@ -501,6 +1324,12 @@ class CyArgWrapperManager(object):
             pcc.extend(arg.post_call_code())
         return pcc
 
+    def nbytes_code(self):
+        nbc = []
+        for arg in self.args:
+            nbc.extend(arg.nbytes_code())
+        return nbc
+
     def docstring_extern_arg_list(self):
         decls = []
         for arg in self.args:
@@ -528,10 +1357,21 @@ class CyArgWrapperManager(object):
 
 class ProcWrapper(object):
 
-    def __init__(self, wrapped):
+    nogil_entry = True
+
+    def __init__(self, wrapped, cfg=None):
         self.wrapped = wrapped
+        self.cfg = cfg or Configuration()
         self.name = _py_kw_mangler(self.wrapped.wrapped_name())
-        self.arg_mgr = CyArgWrapperManager.from_fwrapped_proc(wrapped)
+        self.base_name = self.name
+        self.arg_mgr = CyArgWrapperManager.from_fwrapped_proc(wrapped,
+                                                              self.cfg)
+
+    def profile_name(self):
+        return 'fw_profile_%s' % self.name
+
+    def profiled(self):
+        return self.cfg.profile
 
     def all_dtypes(self):
         return self.wrapped.all_dtypes()
@@ -543,15 +1383,58 @@ class ProcWrapper(object):
                 arg_list=arg_list)
         return template % sdict
 
+    def pxd_declarations(self):
+        if self.nogil_entry:
+            return [self.cy_prototype(), self.nogil_prototype()]
+        return [self.cy_prototype()]
+
+    def nogil_prototype(self):
+        template = "cdef int %(proc_name)s_nogil(%(arg_list)s) nogil"
+        arg_list = ', '.join(self.arg_mgr.nogil_arg_declarations())
+        return template % dict(proc_name=self.name, arg_list=arg_list)
+
+    def generate_nogil_wrapper(self, buf):
+        buf.putln("%s:" % self.nogil_prototype())
+        buf.indent()
+        buf.putlines(self.arg_mgr.err_declarations())
+        proc_call = "%s(%s)" % (self.wrapped.name,
+                        ', '.join(self.arg_mgr.nogil_call_arg_list()))
+        if self.cfg.releases_gil(self.base_name):
+            buf.putln(proc_call)
+        else:
+            buf.putln("with gil:")
+            buf.putln("    %s" % proc_call)
+        buf.putln("return %s" % constants.ERR_NAME)
+        buf.dedent()
+
     def proc_declaration(self):
         return "%s:" % self.cy_prototype()
 
+    def decorators(self):
+        for arg in self.arg_mgr.args:
+            if _is_err_arg(arg):
+                continue
+            if arg.is_array and arg.uses_memoryview():
+                return ["@cython.boundscheck(False)"]
+        return []
+
     def proc_call(self):
         proc_call = "%(call_name)s(%(call_arg_list)s)" % {
                 'call_name' : self.wrapped.name,
                 'call_arg_list' : ', '.join(self.arg_mgr.call_arg_list())}
         return proc_call
 
+    def put_proc_call(self, buf):
+        # the arguments are all C values and pointers by now, so the call
+        # into Fortran doesn't need the GIL.
+        if self.cfg.releases_gil(self.base_name):
+            buf.putln("with nogil:")
+            buf.indent()
+            buf.putln(self.proc_call())
+            buf.dedent()
+        else:
+            buf.putln(self.proc_call())
+
     def temp_declarations(self, buf):
         decls = self.arg_mgr.intern_declarations()
         for line in decls:
@@ -582,6 +1465,8 @@ class ProcWrapper(object):
         buf.putlines(ck_err)
 
     def post_try_finally(self, buf):
+        # the post call code, e.g. releasing buffers, runs however the
+        # conversions and the call end.
         post_cc = CodeBuffer()
         self.post_call_code(post_cc)
 
@@ -591,6 +1476,14 @@ class ProcWrapper(object):
             buf.putln("try:")
             buf.indent()
 
+        self.pre_call_code(buf)
+        if self.profiled():
+            nbytes = ' + '.join(self.arg_mgr.nbytes_code()) or '0'
+            buf.putln('fw_nbytes = %s' % nbytes)
+            buf.putln('fw_t1 = fw_clock()')
+        self.put_proc_call(buf)
+        if self.profiled():
+            buf.putln('fw_t2 = fw_clock()')
         self.check_error(buf)
 
         if use_try:
@@ -604,13 +1497,21 @@ class ProcWrapper(object):
             buf.dedent()
 
     def generate_wrapper(self, buf):
+        if self.profiled():
+            buf.putln('cdef fw_profile_t %s' % self.profile_name())
+        buf.putlines(self.decorators())
         buf.putln(self.proc_declaration())
         buf.indent()
         self.put_docstring(buf)
+        if self.profiled():
+            # the wrapper's own time runs from here to the return.
+            buf.putln('cdef double fw_t0 = fw_clock(), fw_t1, fw_t2')
+            buf.putln('cdef long long fw_nbytes')
         self.temp_declarations(buf)
-        self.pre_call_code(buf)
-        buf.putln(self.proc_call())
         self.post_try_finally(buf)
+        if self.profiled():
+            buf.putln('fw_profile_record(&%s, fw_t0, fw_t1, fw_t2, '
+                      'fw_nbytes)' % self.profile_name())
         rt = self.return_tuple()
         if rt: buf.putln(rt)
         buf.dedent()
@@ -654,3 +1555,522 @@ class ProcWrapper(object):
             dstring.extend(descrs)
 
         return dstring
+
+
+class _CyBatchedArg(object):
+    # An argument of a batched wrapper.  Array arguments get a trailing
+    # batch axis; scalar arguments are given once for all batches or as a 1D
+    # array with one value per batch.
+
+    def __init__(self, cy_arg, proc_name):
+        self.cy_arg = cy_arg
+        self.arg = cy_arg.arg
+        self.proc_name = proc_name
+        if cy_arg.is_array:
+            self.ndims = self.arg.ndims
+            self.extern_name = cy_arg.extern_name
+        else:
+            self.ndims = 0
+            self.extern_name = cy_arg.name
+        self.intern_name = '%s_' % self.extern_name
+        self.stride_name = '%s_stride' % self.extern_name
+
+    def is_input(self):
+        return self.cy_arg.is_array or self.arg.intent in ('in', 'inout', None)
+
+    def extern_declarations(self):
+        if self.is_input():
+            return ['object %s' % self.extern_name]
+        return []
+
+    def intern_declarations(self):
+        return ['cdef np.ndarray %s' % self.intern_name,
+                'cdef np.npy_intp %s' % self.stride_name]
+
+    def convert_code(self):
+        if self.cy_arg.is_array:
+            ret = [self.cy_arg.coerce_code(self.ndims+1, self.proc_name)]
+        elif self.is_input():
+            # cast like scalar arguments are, e.g. from the default integer.
+            ret = ['%s = np.PyArray_FROMANY(%s, %s, 0, 1, '
+                            'np.NPY_F_CONTIGUOUS | np.NPY_FORCECAST)' %
+                    (self.intern_name, self.extern_name,
+                     self.arg.dtype.npy_enum)]
+        else:
+            return []
+        ret.append("fw_nbatch = fw_batch_len(%s, %d, fw_nbatch, '%s')" %
+                    (self.intern_name, self.ndims, self.extern_name))
+        return ret
+
+    def alloc_code(self):
+        ret = []
+        if not self.cy_arg.is_array and self.arg.intent != 'in':
+            # scalar results get one element per batch.
+            if self.arg.intent == 'out':
+                value = 'None'
+            else:
+                value = self.intern_name
+            ret.append('%s = fw_batch_out(%s, %s, fw_nbatch)' %
+                        (self.intern_name, value, self.arg.dtype.npy_enum))
+        ret.append('%s = fw_batch_stride(%s, %d)' %
+                    (self.stride_name, self.intern_name, self.ndims))
+        return ret
+
+    def post_call_code(self):
+        return []
+
+    def nbytes_code(self):
+        return ['np.PyArray_NBYTES(%s)' % self.intern_name]
+
+    def call_arg_list(self):
+        shapes = ['<fwi_npy_intp_t*>&%s.shape[%d]' % (self.intern_name, i)
+                    for i in range(self.ndims)]
+        data = ['<%s*>(%s.data + fw_b*%s)' %
+                    (self.arg.ktp, self.intern_name, self.stride_name)]
+        return shapes + data
+
+    def return_tuple_list(self):
+        if self.arg.intent in ('out', 'inout', None):
+            return [self.intern_name]
+        return []
+
+    def docstring_extern_arg_list(self):
+        return self.cy_arg.docstring_extern_arg_list()
+
+    def docstring_return_tuple_list(self):
+        return self.cy_arg.docstring_return_tuple_list()
+
+    def in_dstring(self):
+        return self.cy_arg.in_dstring()
+
+    def out_dstring(self):
+        return self.cy_arg.out_dstring()
+
+
+class _CyBatchedErrArg(object):
+    # The error flag and message are shared by all batches.
+
+    def __init__(self, cy_arg):
+        self.cy_arg = cy_arg
+
+    def extern_declarations(self):
+        return []
+
+    def intern_declarations(self):
+        return self.cy_arg.intern_declarations()
+
+    def convert_code(self):
+        return []
+
+    def alloc_code(self):
+        return []
+
+    def call_arg_list(self):
+        return self.cy_arg.call_arg_list()
+
+    def post_call_code(self):
+        return []
+
+    def nbytes_code(self):
+        return []
+
+    def return_tuple_list(self):
+        return []
+
+    def docstring_extern_arg_list(self):
+        return []
+
+    def docstring_return_tuple_list(self):
+        return []
+
+    def in_dstring(self):
+        return []
+
+    def out_dstring(self):
+        return []
+
+
+class ModuleWrapper(object):
+    r"""Extension type with the variables of a Fortran module as
+    properties; the module is wrapped as its only instance.
+
+    Scalars are read and written through their address, taken once.  The
+    address and extents of an array are asked for on every access, and a
+    new view of the Fortran storage is made only when they changed, i.e.
+    after the array was reallocated.
+    """
+
+    nogil_entry = False
+
+    def __init__(self, module, cfg=None):
+        self.module = module
+        self.cfg = cfg or Configuration()
+        self.name = _py_kw_mangler(module.name)
+        self.type_name = 'fw_module_%s' % module.name
+        self.accessors = []
+        # no arguments, for the checks over all procedures.
+        self.arg_mgr = CyArgWrapperManager(args=[])
+
+    def profiled(self):
+        return False
+
+    def all_dtypes(self):
+        dts = []
+        for accessor in self.accessors:
+            dts.extend(accessor.all_dtypes())
+        return dts
+
+    def pxd_declarations(self):
+        return []
+
+    def _attr_name(self, var):
+        return 'fw_%s' % var.name
+
+    def _dstring(self, var):
+        from fwrap.gen_config import py_type_name_from_type
+        dstring = '%s : %s' % (_py_kw_mangler(var.name),
+                               py_type_name_from_type(var.ktp))
+        if var.is_array:
+            dstring += ', %dD array, %s' % (len(var.dimension),
+                                            var.dimension.attrspec)
+            if var.allocatable:
+                dstring += ', allocatable'
+        if var.protected:
+            dstring += ', protected'
+        return dstring
+
+    def docstring(self):
+        dstring = ["Variables of the Fortran module %s." % self.module.name,
+                   "",
+                   "Arrays are views of the Fortran storage, or None while "
+                   "not allocated;",
+                   "assigning to an array copies into the storage.  A view "
+                   "must not be",
+                   "used once its array was deallocated or reallocated.",
+                   "Protected variables are read-only.",
+                   "",
+                   "Variables",
+                   "---------"]
+        return dstring + [self._dstring(accessor.var)
+                            for accessor in self.accessors]
+
+    def generate_wrapper(self, buf):
+        buf.putln('cdef class %s:' % self.type_name)
+        buf.indent()
+        buf.putln('"""')
+        buf.putlines(self.docstring())
+        buf.putln('"""')
+        for accessor in self.accessors:
+            var = accessor.var
+            if var.is_array:
+                buf.putln('cdef object %s' % self._attr_name(var))
+            else:
+                buf.putln('cdef %s *%s' % (var.ktp, self._attr_name(var)))
+        scalars = [accessor for accessor in self.accessors
+                        if not accessor.var.is_array]
+        if scalars:
+            buf.putempty()
+            buf.putln('def __cinit__(self):')
+            for accessor in scalars:
+                buf.putln('    %s(<void**>&self.%s)' %
+                          (accessor.name, self._attr_name(accessor.var)))
+        for accessor in self.accessors:
+            buf.putempty()
+            if accessor.var.is_array:
+                self.put_array_property(accessor, buf)
+            else:
+                self.put_scalar_property(accessor, buf)
+        buf.dedent()
+        buf.putempty()
+        buf.putln('%s = %s()' % (self.name, self.type_name))
+        buf.putempty()
+
+    def put_scalar_property(self, accessor, buf):
+        var = accessor.var
+        d = {'name' : _py_kw_mangler(var.name),
+             'dstring' : self._dstring(var),
+             'attr' : self._attr_name(var),
+             'ktp' : var.ktp}
+        buf.putlines('''\
+property %(name)s:
+    "%(dstring)s"
+    def __get__(self):
+        return self.%(attr)s[0]''' % d)
+        if not var.protected:
+            buf.putlines('''\
+    def __set__(self, %(ktp)s value):
+        self.%(attr)s[0] = value''' % d)
+
+    def put_array_property(self, accessor, buf):
+        var = accessor.var
+        d = {'name' : _py_kw_mangler(var.name),
+             'dstring' : self._dstring(var),
+             'ndim' : len(var.dimension),
+             'accessor' : accessor.name,
+             'attr' : self._attr_name(var),
+             'enum' : var.dtype.npy_enum,
+             'qualname' : '%s.%s' % (self.module.name, var.name),
+             'writeable' : int(not var.protected)}
+        # continuation lines line up with the opening parenthesis.
+        d['pad'] = ' ' * len('self.%(attr)s = fw_module_array(' % d)
+        buf.putlines('''\
+property %(name)s:
+    "%(dstring)s"
+    def __get__(self):
+        cdef void *fw_data
+        cdef fwi_npy_intp_t fw_shape[%(ndim)d]
+        %(accessor)s(&fw_data, fw_shape)
+        self.%(attr)s = fw_module_array(self.%(attr)s, fw_data, %(ndim)d,
+        %(pad)sfw_shape, %(enum)s, %(writeable)d)
+        return self.%(attr)s''' % d)
+        if not var.protected:
+            buf.putlines('''\
+    def __set__(self, value):
+        fw_module_array_set(self.%(name)s, value, "%(qualname)s")''' % d)
+
+
+class UncheckedProcWrapper(ProcWrapper):
+    r"""Wrapper calling the unchecked C wrapper of a procedure.
+
+    The arguments are converted as usual, but their extents and lengths
+    aren't checked against the Fortran declarations, and there is no error
+    code to check after the call.
+    """
+
+    nogil_entry = False
+
+    def __init__(self, wrapped, cfg=None):
+        super(UncheckedProcWrapper, self).__init__(wrapped, cfg)
+        self.name = '%s_unchecked' % self.base_name
+
+    def check_error(self, buf):
+        pass
+
+
+class BatchedProcWrapper(ProcWrapper):
+    r"""Wrapper calling a procedure once per index of a batch axis.
+
+    The arguments are converted and checked once; the loop over the
+    batches calls the C wrapper directly with offset pointers.
+    """
+
+    nogil_entry = False
+
+    def __init__(self, wrapped, cfg=None):
+        super(BatchedProcWrapper, self).__init__(wrapped, cfg)
+        self.base_name = self.name
+        self.name = '%s_batched' % self.base_name
+        args = []
+        for cy_arg in self.arg_mgr.args:
+            if _is_err_arg(cy_arg):
+                args.append(_CyBatchedErrArg(cy_arg))
+            else:
+                args.append(_CyBatchedArg(cy_arg, self.name))
+        self.arg_mgr = CyArgWrapperManager(args=args)
+
+    @staticmethod
+    def can_batch(proc_wrapper):
+        # character arguments are passed as Python strings and descriptor
+        # arguments describe a single array; they have no batched form.
+        for cy_arg in proc_wrapper.arg_mgr.args:
+            if isinstance(cy_arg, (_CyCharArg, CyCharArrayArgWrapper,
+                                   CyCfiArrayArgWrapper,
+                                   CyWorkspaceArrayArgWrapper)):
+                return False
+        return True
+
+    def decorators(self):
+        return []
+
+    def temp_declarations(self, buf):
+        buf.putln('cdef np.npy_intp fw_b, fw_nbatch = -1')
+        super(BatchedProcWrapper, self).temp_declarations(buf)
+
+    def pre_call_code(self, buf):
+        for arg in self.arg_mgr.args:
+            buf.putlines(arg.convert_code())
+        buf.putln('if fw_nbatch == -1:')
+        buf.putln('    fw_nbatch = 1')
+        for arg in self.arg_mgr.args:
+            buf.putlines(arg.alloc_code())
+        buf.putln('%s = FW_NO_ERR__' % constants.ERR_NAME)
+
+    def put_proc_call(self, buf):
+        loop = CodeBuffer()
+        loop.putln('for fw_b in range(fw_nbatch):')
+        loop.indent()
+        loop.putln(self.proc_call())
+        loop.putln('if %s != FW_NO_ERR__:' % constants.ERR_NAME)
+        loop.putln('    break')
+        if self.cfg.releases_gil(self.base_name):
+            buf.putln("with nogil:")
+            buf.indent()
+            buf.putlines(loop.getvalue())
+            buf.dedent()
+        else:
+            buf.putlines(loop.getvalue())
+
+    def check_error(self, buf):
+        ck_err = ('if fw_iserr__ != FW_NO_ERR__:\n'
+                  '    raise RuntimeError(\"an error was encountered '
+                           "when calling the '%s' wrapper "
+                           "(batch %%d).\" %% fw_b)") % self.base_name
+        buf.putlines(ck_err)
+
+    def docstring(self):
+        dstring = super(BatchedProcWrapper, self).docstring()
+        return dstring[:1] + [
+            "",
+            "Call %s once for every index of the last axis of the array" %
+                self.base_name,
+            "arguments, which have one more dimension than listed below.",
+            "Scalar arguments are either given once for all calls or as 1D",
+            "arrays with one value per call; scalar results are returned as",
+            "1D arrays."] + dstring[1:]
+
+
+
+class UfuncProcWrapper(ProcWrapper):
+    r"""Wrapper making a NumPy ufunc of a procedure with scalar arguments.
+
+    The inputs of the ufunc are the intent in and inout arguments, its
+    outputs the function result and the intent inout and out arguments.
+    Its one loop takes the kinds of the procedure's arguments; NumPy casts
+    other types to them.
+    """
+
+    nogil_entry = False
+
+    def __init__(self, wrapped, cfg=None):
+        super(UfuncProcWrapper, self).__init__(wrapped, cfg)
+        self.base_name = self.name
+        self.name = '%s_ufunc' % self.base_name
+        self.loop_name = 'fw_%s_loop' % self.name
+        args = [arg for arg in self.arg_mgr.args if not _is_err_arg(arg)]
+        self.in_args = [arg for arg in args
+                            if arg.arg.intent in ('in', 'inout', None)]
+        self.out_args = [arg for arg in args
+                            if arg.arg.intent in ('out', 'inout', None)]
+        self.err_args = [arg for arg in self.arg_mgr.args if _is_err_arg(arg)]
+
+    def profiled(self):
+        # the loop is called by numpy, there is no wrapper to time.
+        return False
+
+    @staticmethod
+    def can_wrap(proc_wrapper):
+        # every argument has to be a numeric or logical scalar; elemental
+        # procedures always qualify.
+        intents = set()
+        for cy_arg in proc_wrapper.arg_mgr.args:
+            if _is_err_arg(cy_arg):
+                continue
+            if cy_arg.is_array or isinstance(cy_arg, _CyCharArg):
+                return False
+            intents.add(cy_arg.arg.intent)
+        return bool(intents & set(['in', 'inout', None]) and
+                    intents & set(['out', 'inout', None]))
+
+    def pxd_declarations(self):
+        return []
+
+    def _element(self, idx, arg):
+        return ('(<%s*>(fw_args[%d] + fw_i*fw_steps[%d]))[0]' %
+                    (arg.cy_dtype_name, idx, idx))
+
+    def put_loop(self, buf):
+        buf.putln('cdef void %s(char **fw_args, np.npy_intp *fw_dims, '
+                  'np.npy_intp *fw_steps, void *fw_data) nogil:' %
+                  self.loop_name)
+        buf.indent()
+        buf.putln('cdef np.npy_intp fw_i')
+        decls = []
+        for arg in self.arg_mgr.args:
+            if not _is_err_arg(arg):
+                decls.append('cdef %s %s' % (arg.cy_dtype_name, arg.name))
+        for arg in self.err_args:
+            decls.extend(arg.intern_declarations())
+        buf.putlines(decls)
+        if not self.cfg.releases_gil(self.base_name):
+            buf.putln('with gil:')
+            buf.indent()
+        buf.putln('for fw_i in range(fw_dims[0]):')
+        buf.indent()
+        nin = len(self.in_args)
+        for idx, arg in enumerate(self.in_args):
+            buf.putln('%s = %s' % (arg.name, self._element(idx, arg)))
+        # the wrappers of procedures without array or character arguments
+        # never report errors.
+        buf.putln(self.proc_call())
+        for idx, arg in enumerate(self.out_args):
+            buf.putln('%s = %s' % (self._element(nin+idx, arg), arg.name))
+        buf.dedent()
+        if not self.cfg.releases_gil(self.base_name):
+            buf.dedent()
+        buf.dedent()
+
+    def generate_wrapper(self, buf):
+        self.put_loop(buf)
+        types = [arg.arg.dtype.npy_enum for arg in self.in_args + self.out_args]
+        D = {'name' : self.name,
+             'loop' : self.loop_name,
+             'ntypes' : len(types),
+             'nin' : len(self.in_args),
+             'nout' : len(self.out_args),
+             'doc' : '\\n'.join(self.docstring())}
+        buf.putlines(("cdef np.PyUFuncGenericFunction fw_%(name)s_loops[1]\n"
+                      "cdef void *fw_%(name)s_data[1]\n"
+                      "cdef char fw_%(name)s_types[%(ntypes)d]\n"
+                      "fw_%(name)s_loops[0] = %(loop)s\n"
+                      "fw_%(name)s_data[0] = NULL") % D)
+        for idx, npy_enum in enumerate(types):
+            buf.putln('fw_%s_types[%d] = %s' % (self.name, idx, npy_enum))
+        buf.putlines(("%(name)s = np.PyUFunc_FromFuncAndData("
+                        "fw_%(name)s_loops, fw_%(name)s_data, "
+                        "fw_%(name)s_types, 1, %(nin)d, %(nout)d, "
+                        "np.PyUFunc_None, \"%(name)s\",\n"
+                      "        \"%(doc)s\", 0)") % D)
+
+    def docstring(self):
+        dstring = super(UfuncProcWrapper, self).docstring()
+        return dstring[:1] + [
+            "",
+            "NumPy ufunc calling %s for every element of the broadcast" %
+                self.base_name,
+            "arguments.  The results can be stored in existing arrays with",
+            "the out keyword."] + dstring[1:]
+
+
+def _is_err_arg(cy_arg):
+    if isinstance(cy_arg, _CyErrStrArg):
+        return True
+    return not cy_arg.is_array and cy_arg.name == constants.ERR_NAME
+
+def _uses_cfi(ast):
+    for proc in ast:
+        for arg in proc.arg_mgr.args:
+            if isinstance(arg, CyCfiArrayArgWrapper):
+                return True
+    return False
+
+def _uses_module_arrays(ast):
+    for proc in ast:
+        if isinstance(proc, ModuleWrapper):
+            for accessor in proc.accessors:
+                if accessor.var.is_array:
+                    return True
+    return False
+
+def _uses_char_buffers(ast):
+    for proc in ast:
+        for arg in proc.arg_mgr.args:
+            if isinstance(arg, _CyCharArg) and arg.takes_buffer():
+                return True
+    return False
+
+def _uses_workspace(ast):
+    for proc in ast:
+        for arg in proc.arg_mgr.args:
+            if isinstance(arg, CyWorkspaceArrayArgWrapper):
+                return True
+    return False
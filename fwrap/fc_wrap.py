@@ -5,26 +5,71 @@
 
 from fwrap import pyf_iface as pyf
 from fwrap import constants
+from fwrap.configuration import Configuration
 
 def _arg_name_mangler(name):
     return "fw_%s" % name
 
-def wrap_pyf_iface(ast):
+def wrap_pyf_iface(ast, cfg=None):
     fc_wrapper = []
     for proc in ast:
+        if proc.kind == 'module':
+            for var in proc.variables():
+                fc_wrapper.append(ModuleVarWrapper(proc, var))
+            continue
         if proc.kind == 'function':
-            fc_wrapper.append(FunctionWrapper(wrapped=proc))
+            wrapper_cls = FunctionWrapper
         elif proc.kind == 'subroutine':
-            fc_wrapper.append(SubroutineWrapper(wrapped=proc))
+            wrapper_cls = SubroutineWrapper
         else:
             raise ValueError("object not function or subroutine, %s" % proc)
+        fc_wrapper.append(wrapper_cls(wrapped=proc, cfg=cfg))
+        if cfg is not None and cfg.is_unchecked(proc.name):
+            fc_wrapper.append(wrapper_cls(wrapped=proc, cfg=cfg,
+                                          checked=False))
     return fc_wrapper
 
+def uses_cfi(ast):
+    r"""Whether any procedure in ast takes a C descriptor argument."""
+    for proc in ast:
+        if not isinstance(proc, ProcWrapper):
+            continue
+        for argw in proc.arg_man.arg_wrappers:
+            if isinstance(argw, CfiArrayArgWrapper):
+                return True
+    return False
+
+cfi_pxd_decls = '''\
+cdef extern from "ISO_Fortran_binding.h":
+    enum:
+        CFI_SUCCESS
+        CFI_attribute_other
+        CFI_type_other
+    ctypedef ptrdiff_t CFI_index_t
+    ctypedef struct CFI_dim_t:
+        CFI_index_t lower_bound
+        CFI_index_t extent
+        CFI_index_t sm
+    ctypedef struct CFI_cdesc_t:
+        void *base_addr
+        size_t elem_len
+        CFI_dim_t dim[1]
+    int CFI_establish(CFI_cdesc_t *dv, void *base_addr, int attribute,
+                      int type, size_t elem_len, int rank,
+                      CFI_index_t *extents)
+'''
+
 def generate_fc_pxd(ast, fc_header_name, buf):
     buf.putln("from %s cimport *" %
                 constants.KTP_PXD_HEADER_SRC.split('.')[0])
     buf.putln('')
-    buf.putln('cdef extern from "%s":' % fc_header_name)
+    if uses_cfi(ast):
+        buf.putlines(cfi_pxd_decls)
+        buf.putln('cdef extern from "%s":' % fc_header_name)
+        buf.putln('    ctypedef struct fw_cfi_cdesc_t:')
+        buf.putln('        pass')
+        buf.putln('')
+    buf.putln('cdef extern from "%s" nogil:' % fc_header_name)
     buf.indent()
     for proc in ast:
         buf.putln(proc.cy_prototype())
@@ -32,6 +77,10 @@ def generate_fc_pxd(ast, fc_header_name, buf):
 
 def generate_fc_h(ast, ktp_header_name, buf):
     buf.putln('#include "%s"' % ktp_header_name)
+    if uses_cfi(ast):
+        # room for a descriptor of any rank.
+        buf.putln('#include "ISO_Fortran_binding.h"')
+        buf.putln('typedef CFI_CDESC_T(CFI_MAX_RANK) fw_cfi_cdesc_t;')
     buf.putln('')
     for proc in ast:
         buf.putln(proc.c_prototype())
@@ -72,14 +121,24 @@ def _dim_test(dims1, dims2):
 
 class ProcWrapper(object):
 
-    def __init__(self, wrapped):
-        self.name = constants.PROC_SUFFIX_TMPL % wrapped.name
+    # An unchecked wrapper, made with checked=False, is named
+    # <proc>_unchecked_c; it doesn't check the extents and lengths it is
+    # passed and has no error arguments.
+
+    def __init__(self, wrapped, cfg=None, checked=True):
+        if checked:
+            self.name = constants.PROC_SUFFIX_TMPL % wrapped.name
+        else:
+            self.name = (constants.PROC_SUFFIX_TMPL %
+                            ('%s_unchecked' % wrapped.name))
         self.wrapped = wrapped
+        self.cfg = cfg or Configuration()
+        self.checked = checked
         self.arg_man = None
         self._get_arg_man()
 
     def _get_arg_man(self):
-        self.arg_man = ArgWrapperManager(self.wrapped)
+        self.arg_man = ArgWrapperManager(self.wrapped, self.cfg, self.checked)
 
     def wrapped_name(self):
         return self.wrapped.name
@@ -159,15 +218,94 @@ class SubroutineWrapper(ProcWrapper):
     pass
 
 
+class ModuleVarWrapper(object):
+
+    # A bind(c) subroutine returning the address of a module variable and,
+    # for an array, its extents.  The address is taken in an internal
+    # procedure whose dummy argument has the target attribute; an array
+    # that isn't allocated has a null address and zero extents.
+
+    def __init__(self, module, var):
+        self.module = module
+        self.var = var
+        self.name = (constants.PROC_SUFFIX_TMPL %
+                        ('fw_%s_%s' % (module.name, var.name)))
+
+    def extern_arg_list(self):
+        if self.var.is_array:
+            return ['fw_data', 'fw_shape']
+        return ['fw_data']
+
+    def proc_declaration(self):
+        return 'subroutine %s(%s) bind(c, name="%s")' % \
+                (self.name, ', '.join(self.extern_arg_list()), self.name)
+
+    def generate_wrapper(self, buf, gmn=constants.KTP_MOD_NAME):
+        var = self.var
+        buf.putln(self.proc_declaration())
+        buf.indent()
+        buf.putln('use %s' % gmn)
+        buf.putln('use %s, only: %s' % (self.module.name, var.name))
+        buf.putln('implicit none')
+        buf.putln('type(c_ptr), intent(out) :: fw_data')
+        if var.is_array:
+            ndims = len(var.dimension)
+            buf.putln('integer(kind=%s), dimension(%d), intent(out) :: '
+                      'fw_shape' % (pyf.dim_dtype.fw_ktp, ndims))
+            if var.allocatable:
+                buf.putln('fw_data = c_null_ptr')
+                buf.putln('fw_shape = 0')
+                buf.putln('if (.not. allocated(%s)) return' % var.name)
+            buf.putln('fw_shape = shape(%s)' % var.name)
+            buf.putln('call fw_address(%s, fw_shape)' % var.name)
+            fw_var = pyf.Var('fw_var', var.dtype,
+                             dimension=['fw_extents(%d)' % (i+1)
+                                            for i in range(ndims)])
+        else:
+            buf.putln('call fw_address(%s)' % var.name)
+            fw_var = pyf.Var('fw_var', var.dtype)
+        buf.dedent()
+        buf.putln('contains')
+        buf.indent()
+        if var.is_array:
+            buf.putln('subroutine fw_address(fw_var, fw_extents)')
+            buf.indent()
+            buf.putln('integer(kind=%s), dimension(%d), intent(in) :: '
+                      'fw_extents' % (pyf.dim_dtype.fw_ktp, ndims))
+        else:
+            buf.putln('subroutine fw_address(fw_var)')
+            buf.indent()
+        buf.putln('%s, target :: fw_var' % ', '.join(fw_var.var_specs()))
+        buf.putln('fw_data = c_loc(fw_var)')
+        buf.dedent()
+        buf.putln('end subroutine fw_address')
+        buf.dedent()
+        buf.putln('end subroutine %s' % self.name)
+
+    def c_proto_args(self):
+        if self.var.is_array:
+            return ['void **', '%s *' % pyf.dim_dtype.fw_ktp]
+        return ['void **']
+
+    def c_prototype(self):
+        return "%s;" % self.cy_prototype()
+
+    def cy_prototype(self):
+        return 'void %s(%s)' % (self.name, ', '.join(self.c_proto_args()))
+
+    def all_dtypes(self):
+        return self.var.all_dtypes()
+
+
 class FunctionWrapper(ProcWrapper):
 
     RETURN_ARG_NAME = constants.RETURN_ARG_NAME
 
-    def __init__(self, wrapped):
-        super(FunctionWrapper, self).__init__(wrapped)
+    def __init__(self, wrapped, cfg=None, checked=True):
+        super(FunctionWrapper, self).__init__(wrapped, cfg, checked)
 
     def _get_arg_man(self):
-        self.arg_man = ArgWrapperManager(self.wrapped)
+        self.arg_man = ArgWrapperManager(self.wrapped, self.cfg, self.checked)
 
     def return_spec_declaration(self):
         return self.arg_man.return_spec_declaration()
@@ -178,8 +316,10 @@ class FunctionWrapper(ProcWrapper):
 
 class ArgWrapperManager(object):
 
-    def __init__(self, proc):
+    def __init__(self, proc, cfg=None, checked=True):
         self.proc = proc
+        self.cfg = cfg or Configuration()
+        self.checked = checked
         self.isfunction = (proc.kind == 'function')
         self.ret_arg = None
         if self.isfunction:
@@ -198,12 +338,43 @@ class ArgWrapperManager(object):
 
     def _gen_wrappers(self):
         wargs = []
-        for arg in self._orig_args + [self.errflag]:
-            wargs.append(ArgWrapperFactory(arg))
-        self.arg_wrappers = wargs + [self.errstr]
+        if self.checked:
+            args = self._orig_args + [self.errflag]
+        else:
+            args = self._orig_args
+        for arg in args:
+            argw = (self._workspace_wrapper(arg) or
+                    ArgWrapperFactory(arg, self.cfg))
+            argw.checked = self.checked
+            wargs.append(argw)
+        if self.checked:
+            wargs.append(self.errstr)
+        self.arg_wrappers = wargs
         if self.isfunction:
             self.ret_arg = self.arg_wrappers[0]
 
+    def _workspace_wrapper(self, arg):
+        # workspace scalars are set in the wrapper rather than passed in;
+        # workspace arrays are passed as usual, the Cython wrapper fills
+        # them in.
+        expr = self.cfg.workspace_arg(self.proc.name, arg.name)
+        if expr is None:
+            return None
+        if arg.dtype.type == 'character':
+            raise ValueError("workspace argument %s.%s is of type character" %
+                             (self.proc.name, arg.name))
+        if getattr(arg, 'dimension', None):
+            return ArrayArgWrapper(arg)
+        if not expr:
+            raise ValueError("workspace scalar %s.%s needs a value, as in "
+                             "%s.%s=EXPR" % ((self.proc.name, arg.name)*2))
+        return HideArgWrapper(pyf.HiddenArgument(arg.name, arg.dtype,
+                                                 value=expr, intent='hide'))
+
+    def hidden_args(self):
+        return [argw for argw in self.arg_wrappers
+                    if isinstance(argw, HideArgWrapper)]
+
     def call_arg_list(self):
         cl = [argw.intern_name for argw in self.arg_wrappers
                 if (argw.intern_name != FunctionWrapper.RETURN_ARG_NAME and
@@ -262,8 +433,13 @@ class ArgWrapperManager(object):
         return "%s = FW_NO_ERR__" % constants.ERR_NAME
 
     def pre_call_code(self):
-        all_pcc = [self.init_err()]
-        for argw in self.arg_wrappers:
+        all_pcc = []
+        if self.checked:
+            all_pcc.append(self.init_err())
+        # hidden arguments first, the extents of arrays may depend on them.
+        hidden = self.hidden_args()
+        for argw in hidden + [argw for argw in self.arg_wrappers
+                                if argw not in hidden]:
             pcc = argw.pre_call_code()
             if pcc:
                 all_pcc.extend(pcc)
@@ -276,7 +452,8 @@ class ArgWrapperManager(object):
             pcc = argw.post_call_code()
             if pcc:
                 all_pcc.extend(pcc)
-        all_pcc += [self.no_err()]
+        if self.checked:
+            all_pcc.append(self.no_err())
         return all_pcc
 
     def _return_var_name(self):
@@ -288,10 +465,13 @@ class ArgWrapperManager(object):
                 [self.errflag.dtype])
 
 
-def ArgWrapperFactory(arg):
+def ArgWrapperFactory(arg, cfg=None):
     if getattr(arg, 'dimension', None):
         if arg.dtype.type == 'character':
             return CharArrayArgWrapper(arg)
+        if (cfg is not None and cfg.assumed_shape_cfi and
+                CfiArrayArgWrapper.can_wrap(arg)):
+            return CfiArrayArgWrapper(arg)
 
         # FIXME: uncomment when logical arrays use c_f_pointer
         # FIXME: currently this is a workaround for 4.3.3 <= gfortran version <
@@ -314,6 +494,8 @@ def ArgWrapperFactory(arg):
 class ArgWrapperBase(object):
 
     is_array = False
+    # whether the extents and lengths passed in are checked.
+    checked = True
 
     def pre_call_code(self):
         return []
@@ -414,11 +596,17 @@ class HideArgWrapper(ArgWrapperBase):
                 pyf.Var(name=arg.name, dtype=arg.dtype, dimension=None)
         self.value = arg.value
         assert self.value is not None
-        self.intern_name = self._intern_var.name
+        self.name = self.intern_name = self._intern_var.name
+        self.dtype = arg.dtype
+        self.ktp = arg.ktp
+        self.intent = arg.intent
 
     def extern_arg_list(self):
         return []
 
+    def c_types(self):
+        return []
+
     def extern_declarations(self):
         return []
 
@@ -451,7 +639,7 @@ class ArrayArgWrapper(ArgWrapper):
     def pre_call_code(self):
         dims = pyf.Dimension([dim.name for dim in self._arr_dims])
         ckstr = _dim_test(self.orig_arg.dimension, dims)
-        if ckstr:
+        if ckstr and self.checked:
             return _err_test_block(
                             ckstr,
                             'FW_ARR_DIM__',
@@ -459,6 +647,37 @@ class ArrayArgWrapper(ArgWrapper):
         return []
 
 
+class CfiArrayArgWrapper(ArrayArgWrapper):
+
+    # An assumed-shape argument that stays assumed-shape in the bind(c)
+    # wrapper, so the C side passes a Fortran 2018 C descriptor.  The
+    # descriptor carries the extents and byte strides of the array, so
+    # strided arrays reach the wrapped procedure without a copy.
+
+    @staticmethod
+    def can_wrap(arg):
+        return all([dim.is_assumed_shape for dim in arg.dimension])
+
+    def _set_extern_args(self):
+        self._arr_dims = []
+        self.ndims = len(self.orig_arg.dimension)
+        self.extern_arg = pyf.Argument(
+                                name=self.name,
+                                dtype=self.dtype,
+                                intent=self.intent,
+                                dimension=(':',)*self.ndims)
+        self.extern_args = [self.extern_arg]
+
+    def c_types(self):
+        return ['CFI_cdesc_t *']
+
+    def c_declarations(self):
+        return ['CFI_cdesc_t *%s' % self.name]
+
+    def pre_call_code(self):
+        return []
+
+
 class ScalarPtrWrapper(ArgWrapper):
 
     def _set_intern_name(self):
@@ -510,7 +729,7 @@ class CharArgWrapper(ScalarPtrWrapper):
         self.extern_args = [self.len_arg] + self.extern_args
 
     def _err_ck_code(self):
-        if self.is_assumed_len:
+        if self.is_assumed_len or not self.checked:
             ck_code = []
         else:
             test = ("%s .ne. %s" %
@@ -588,7 +807,7 @@ class CharArrayArgWrapper(ArrayPtrArg):
 
     def _check_code(self):
         orig_check = super(CharArrayArgWrapper, self)._check_code()
-        if self.is_assumed_len:
+        if self.is_assumed_len or not self.checked:
             char_ck = []
         else:
             test = "%s .ne. %s" % (self.dtype.len, self.len_arg.name)
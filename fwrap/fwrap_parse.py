@@ -4,17 +4,34 @@
 #------------------------------------------------------------------------------
 
 from fwrap import pyf_iface as pyf
+from fwrap import prescan
 from fparser import api
 
 def generate_ast(fsrcs):
     ast = []
     for src in fsrcs:
-        block = api.parse(src, analyze=True)
+        # only the specification parts of the top-level procedures are
+        # handed to fparser's analysis.
+        index = prescan.scan(src)
+        if index.ok:
+            block = api.parse(index.needed_source(prescan.PROC_KINDS +
+                                                  ('module',)),
+                              isfree=index.isfree,
+                              isstrict=index.isstrict,
+                              include_dirs=index.include_dirs,
+                              analyze=True)
+        else:
+            block = api.parse(src, analyze=True)
         tree = block.content
         for proc in tree:
 
+            if is_module(proc):
+                ast.append(_get_module(proc))
+                continue
+
             if not is_proc(proc):
-                # we ignore non-top-level procedures until modules are supported.
+                # module procedures and other non-top-level procedures
+                # aren't wrapped.
                 continue
 
             args = _get_args(proc)
@@ -37,6 +54,41 @@ def generate_ast(fsrcs):
 def is_proc(proc):
     return proc.blocktype in ('subroutine', 'function')
 
+def is_module(block):
+    return block.blocktype == 'module'
+
+def _get_module(mod):
+    # only the variables that can be viewed from Python are kept: public,
+    # intrinsic non-character type with an integer constant kind, and
+    # arrays that are explicit-shape or allocatable.
+    variables = []
+    for name in sorted(mod.a.variables):
+        var = mod.a.variables[name]
+        if (var.is_parameter() or var.is_pointer() or
+                not var.is_public()):
+            continue
+        try:
+            dtype = _get_dtype(var.get_typedecl())
+        except (RuntimeError, KeyError):
+            continue
+        if dtype.type == 'character':
+            continue
+        protected = 'PROTECTED' in [attr.upper() for attr in var.attributes]
+        if var.is_scalar():
+            variables.append(pyf.ModuleVariable(name=name, dtype=dtype,
+                                                protected=protected))
+        elif var.is_array():
+            dimspec = pyf.Dimension(var.get_array_spec())
+            allocatable = var.is_allocatable()
+            if not allocatable and not all([dim.is_explicit_shape
+                                                for dim in dimspec]):
+                continue
+            variables.append(pyf.ModuleVariable(name=name, dtype=dtype,
+                                                dimension=dimspec,
+                                                allocatable=allocatable,
+                                                protected=protected))
+    return pyf.Module(name=mod.name, mod_objects=variables)
+
 def _get_ret_arg(proc):
     ret_var = proc.get_variable(proc.result)
     ret_arg = _get_arg(ret_var)
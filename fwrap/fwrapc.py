@@ -9,6 +9,8 @@ import os, sys, shutil
 import subprocess
 from optparse import OptionParser, OptionGroup
 
+from fwrap.configuration import Configuration
+
 PROJECT_OUTDIR = 'fwproj'
 PROJECT_NAME = PROJECT_OUTDIR
 
@@ -87,6 +89,18 @@ def call_waf(opts, args, orig_args):
 
     return 0
 
+def abspath_option(argv, opt, value):
+    # waf runs from the project directory; pass it an absolute path.
+    ret, skip = [], False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == opt:
+            skip = True
+        elif not arg.startswith(opt + '='):
+            ret.append(arg)
+    return ret + ['%s=%s' % (opt, os.path.abspath(value))]
+
 def print_version():
     from fwrap.version import get_version
     vandl = """\
@@ -116,8 +130,25 @@ def fwrapc(argv):
             help='name for the extension module [default %default]')
     configure_opts.add_option("--outdir",
             help='directory for the intermediate files [default %default]')
+    configure_opts.add_option("--toolchain",
+            help='directory caching the detected compilers, Python, numpy '
+                 'and Cython settings and the kind type map.  Projects '
+                 'configured with the same toolchain directory skip '
+                 'detection; remove it to detect again')
     parser.add_option_group(configure_opts)
 
+    # options for the generated wrappers
+    wrapper_opts = OptionGroup(parser, "Wrapper Options")
+    Configuration.add_options(wrapper_opts)
+    parser.add_option_group(wrapper_opts)
+
+    # build options
+    build_opts = OptionGroup(parser, "Build Options")
+    build_opts.add_option("--timeline", action="store_true", default=False,
+            help='report when each build task ran and how much of the '
+                 'build ran in parallel')
+    parser.add_option_group(build_opts)
+
     conf_defaults = dict(name=PROJECT_NAME, outdir=PROJECT_OUTDIR)
     parser.set_defaults(**conf_defaults)
 
@@ -131,4 +162,7 @@ def fwrapc(argv):
         parser.print_usage()
         return 1
 
+    if opts.toolchain:
+        argv = abspath_option(argv, '--toolchain', opts.toolchain)
+
     return call_waf(opts, args, argv)
@@ -13,10 +13,11 @@ from fwrap import gen_config as gc
 from fwrap import fc_wrap
 from fwrap import cy_wrap
 from fwrap.code import CodeBuffer, reflow_fort
+from fwrap.configuration import Configuration
 
 PROJNAME = 'fwproj'
 
-def wrap(sources, name=PROJNAME):
+def wrap(sources, name=PROJNAME, cfg=None):
     r"""Generate wrappers for sources.
 
     The core wrapping routine for fwrap.  Generates wrappers for the sources
@@ -28,6 +29,7 @@ def wrap(sources, name=PROJNAME):
        wrapped.
      - *name* - (string) Name of the project and the name of the resulting
        python module
+     - *cfg* - (`Configuration`) Options for the generated wrappers.
     """
 
     # validate name
@@ -52,7 +54,7 @@ def wrap(sources, name=PROJNAME):
     f_ast = parse(source_files)
 
     # Generate wrapper files
-    generate(f_ast, name)
+    generate(f_ast, name, cfg)
 
 def parse(source_files):
     r"""Parse fortran code returning parse tree
@@ -65,20 +67,23 @@ def parse(source_files):
 
     return ast
 
-def generate(fort_ast, name):
+def generate(fort_ast, name, cfg=None):
     r"""Given a fortran abstract syntax tree ast, generate wrapper files
 
     :Input:
      - *fort_ast* - (`fparser.ProgramBlock`) Abstract syntax tree from parser
      - *name* - (string) Name of the library module
+     - *cfg* - (`Configuration`) Options for the generated wrappers.
 
      Raises `Exception.IOError` if writing the generated code fails.
     """
 
     # Generate wrapping abstract syntax trees
     # logger.info("Generating abstract syntax tress for c and cython.")
-    c_ast = fc_wrap.wrap_pyf_iface(fort_ast)
-    cython_ast = cy_wrap.wrap_fc(c_ast)
+    if cfg is None:
+        cfg = Configuration()
+    c_ast = fc_wrap.wrap_pyf_iface(fort_ast, cfg)
+    cython_ast = cy_wrap.wrap_fc(c_ast, cfg)
 
     # Generate files and write them out
     generators = ( (generate_type_specs,(c_ast,name)),
@@ -86,19 +91,29 @@ def generate(fort_ast, name):
                    (generate_fc_h,(c_ast,name)),
                    (generate_fc_pxd,(c_ast,name)),
                    (generate_cy_pxd,(cython_ast,name)),
-                   (generate_cy_pyx,(cython_ast,name)) )
+                   (generate_cy_pyx,(cython_ast,name,cfg)) )
 
     for (generator,args) in generators:
         file_name, buf = generator(*args)
         write_to_dir(os.getcwd(), file_name, buf)
 
 def write_to_dir(dir, file_name, buf):
-    fh = open(os.path.join(dir, file_name), 'w')
+    if isinstance(buf, basestring):
+        text = buf
+    else:
+        text = buf.getvalue()
+    path = os.path.join(dir, file_name)
+    # leave an identical file alone so its mtime doesn't trigger a rebuild.
+    if os.path.isfile(path):
+        fh = open(path, 'r')
+        try:
+            if fh.read() == text:
+                return
+        finally:
+            fh.close()
+    fh = open(path, 'w')
     try:
-        if isinstance(buf, basestring):
-            fh.write(buf)
-        else:
-            fh.write(buf.getvalue())
+        fh.write(text)
     finally:
         fh.close()
 
@@ -113,9 +128,9 @@ def generate_cy_pxd(cy_ast, name):
     cy_wrap.generate_cy_pxd(cy_ast, fc_pxd_name, buf)
     return constants.CY_PXD_TMPL % name, buf
 
-def generate_cy_pyx(cy_ast, name):
+def generate_cy_pyx(cy_ast, name, cfg=None):
     buf = CodeBuffer()
-    cy_wrap.generate_cy_pyx(cy_ast, name, buf)
+    cy_wrap.generate_cy_pyx(cy_ast, name, buf, cfg)
     return constants.CY_PYX_TMPL % name, buf
 
 def generate_fc_pxd(fc_ast, name):
@@ -163,8 +178,10 @@ Cython, & Python.
         args = None
     else:
         args = sources
+    Configuration.add_options(parser)
     parsed_options, source_files = parser.parse_args(args=args)
     if not source_files:
         parser.error("no source files")
-    wrap(source_files, parsed_options.name)
+    wrap(source_files, parsed_options.name,
+         Configuration.from_options(parsed_options))
     return 0
@@ -4,7 +4,7 @@
 #------------------------------------------------------------------------------
 
 from cStringIO import StringIO
-from cPickle import dumps
+from pickle import Pickler
 import constants
 
 INDENT = "    "
@@ -13,10 +13,15 @@ INDENT = "    "
 # -- Collect, store and load type specifications to / from a file ---
 
 def all_dtypes(ast):
-    dtypes = set()
+    # keep the order of first appearance so the generated files are
+    # reproducible.
+    dtypes, seen = [], set()
     for proc in ast:
-        dtypes.update(proc.all_dtypes())
-    return list(dtypes)
+        for dtype in proc.all_dtypes():
+            if dtype not in seen:
+                seen.add(dtype)
+                dtypes.append(dtype)
+    return dtypes
 
 def extract_ctps(ast):
     return ctps_from_dtypes(all_dtypes(ast))
@@ -33,6 +38,18 @@ def ctps_from_dtypes(dtypes):
                        lang=dtype.lang))
     return ret
 
+class _SortedPickler(Pickler):
+    # pickles dicts with their keys sorted; the iteration order of a dict
+    # depends on the hash seed.
+
+    def _batch_setitems(self, items):
+        Pickler._batch_setitems(self, iter(sorted(items)))
+
+def dumps(obj):
+    buf = StringIO()
+    _SortedPickler(buf).dump(obj)
+    return buf.getvalue()
+
 def generate_type_specs(ast, buf):
     ctps = extract_ctps(ast)
     _generate_type_specs(ctps, buf)
@@ -80,7 +97,10 @@ module fwrap_ktp_mod
     fbuf.write(buf.getvalue())
 
 def get_ctp_classes(ctps):
-    clses = set([type(ctp) for ctp in ctps])
+    clses = []
+    for ctp in ctps:
+        if type(ctp) not in clses:
+            clses.append(type(ctp))
     return clses
 
 def get_c_includes(ctp_classes):
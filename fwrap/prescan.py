@@ -0,0 +1,315 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Cheap line-oriented pre-scan of Fortran sources.
+#
+# fparser's analysis is expensive and fwrap only needs the specification part
+# of the procedures it wraps.  The scanner here splits a source into logical
+# statements, locates the scoping units (procedures, modules, programs, block
+# data, interface blocks and derived type definitions) and records for every
+# unit where its specification part ends.  From that index we build a reduced
+# source -- same number of lines, everything unneeded blanked out -- that is
+# handed to fparser instead of the whole file.
+#
+# The scanner is deliberately conservative: if the scoping units don't
+# balance it marks the index as unusable and callers fall back to the full
+# source.
+
+import os
+import re
+
+PROC_KINDS = ('subroutine', 'function')
+
+_type_spec = (r'(?:integer|real|double\s*precision|complex|double\s*complex|'
+              r'logical|character|type\s*\(\s*\w+\s*\))'
+              r'(?:\s*\*\s*(?:\d+|\(\s*\*\s*\)|\([^()]*\)))?'
+              r'(?:\s*\((?:[^()]|\([^()]*\))*\))?')
+
+_prefix_kwds = r'(?:recursive|pure|elemental|impure|non_recursive|module)'
+
+def _header_re(sep):
+    return re.compile(
+            r'^(?P<prefix>(?:(?:%(kwds)s|%(type)s)%(sep)s)*)'
+            r'(?P<kind>subroutine|function)%(sep)s(?P<name>[a-z]\w*)\s*'
+            r'(?:\((?:[^()]|\([^()]*\))*\))?\s*'
+            r'(?:(?:result|bind)\s*\([^()]*\)\s*)*$' %
+                {'kwds' : _prefix_kwds, 'type' : _type_spec, 'sep' : sep},
+            re.I)
+
+def _unit_re(sep):
+    return re.compile(
+            r'^(?:(?P<kind>module|program)%(sep)s(?!procedure)(?P<name>[a-z]\w*)'
+            r'|(?P<bd>block\s*data)(?:%(sep)s(?P<bdname>[a-z]\w*))?'
+            r'|(?P<sub>submodule)\s*\([^()]*\)\s*(?P<subname>[a-z]\w*))\s*$' %
+                {'sep' : sep},
+            re.I)
+
+_header = {True : _header_re(r'\s+'), False : _header_re(r'\s*')}
+_unit = {True : _unit_re(r'\s+'), False : _unit_re(r'\s*')}
+
+_interface = re.compile(r'^(?:abstract\s*)?interface\b', re.I)
+_typedef = re.compile(
+        r'^type\s*(?:(?:,[^:]*)?::\s*[a-z]\w*|\s[a-z]\w*)\s*$', re.I)
+_end = re.compile(
+        r'^end\s*(?:(?P<what>subroutine|function|module|submodule|program|'
+        r'block\s*data|interface|type)(?:\s*[a-z]\w*)?)?\s*$', re.I)
+
+# statements that can only appear in the execution part (or that start the
+# internal subprogram part).  Statement functions match the assignment
+# pattern too, which is harmless since they follow all declarations.
+_executable = re.compile(
+        r'^(?:(?:call|if|do|select|case|print|write|read|open|close|inquire|'
+        r'rewind|backspace|endfile|allocate|deallocate|return|stop|go\s*to|'
+        r'continue|where|forall|nullify|cycle|exit|pause|assign|associate|'
+        r'block|critical|contains)\b'
+        r'|[a-z]\w*\s*(?:\([^=]*\))?\s*(?:%\s*\w+\s*(?:\([^=]*\))?\s*)*=)',
+        re.I)
+
+_label = re.compile(r'^\d+\s+')
+
+
+class ScopeEntry(object):
+
+    def __init__(self, kind, name, start, depth, prefix=''):
+        self.kind = kind
+        self.name = name
+        self.prefix = prefix
+        self.start = start
+        self.depth = depth
+        self.spec_end = None
+        self.end = None
+
+    def is_toplevel(self):
+        return self.depth == 0
+
+    def __repr__(self):
+        return ("ScopeEntry(%s %s, lines %d-%s, spec_end=%s)" %
+                (self.kind, self.name, self.start, self.end, self.spec_end))
+
+
+def _strip_comment(text, quote=None):
+    # returns the code part of text and the open quote character, if any, at
+    # the end of the line.
+    if '!' not in text and '"' not in text and "'" not in text:
+        return text, quote
+    for idx, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ('"', "'"):
+            quote = ch
+        elif ch == '!':
+            return text[:idx], None
+    return text, quote
+
+def _split_semicolons(text):
+    if ';' not in text:
+        return [text]
+    parts, quote, last = [], None, 0
+    for idx, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ('"', "'"):
+            quote = ch
+        elif ch == ';':
+            parts.append(text[last:idx])
+            last = idx+1
+    parts.append(text[last:])
+    return parts
+
+def free_form_statements(lines):
+    stmts = []
+    pieces, first, quote = [], None, None
+    for idx, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped[0] in '!#':
+            continue
+        code, quote = _strip_comment(line, quote)
+        code = code.strip()
+        if pieces and code.startswith('&'):
+            code = code[1:]
+        if first is None:
+            first = idx
+        if code.endswith('&'):
+            pieces.append(code[:-1])
+            continue
+        pieces.append(code)
+        text = ''.join(pieces)
+        for part in _split_semicolons(text):
+            part = _label.sub('', part.strip())
+            if part:
+                stmts.append((part, first, idx))
+        pieces, first, quote = [], None, None
+    return stmts
+
+def fixed_form_statements(lines):
+    stmts = []
+    current = None
+    for idx, line in enumerate(lines):
+        if not line.strip() or line[0] in 'cC*!dD#':
+            continue
+        if line[0] == '\t':
+            is_cont = line[1:2].isdigit() and line[1:2] != '0'
+            text = is_cont and line[2:] or line[1:]
+        else:
+            is_cont = len(line) > 5 and line[5] not in ' 0'
+            text = line[6:72]
+        text = _strip_comment(text)[0]
+        if is_cont and current is not None:
+            current[0] += text
+            current[2] = idx
+            continue
+        if current is not None:
+            stmts.append(tuple(current))
+        current = [text, idx, idx]
+    if current is not None:
+        stmts.append(tuple(current))
+    ret = []
+    for text, first, last in stmts:
+        for part in _split_semicolons(text):
+            part = part.strip()
+            if part:
+                ret.append((part, first, last))
+    return ret
+
+
+class SourceIndex(object):
+
+    def __init__(self, lines, isfree=True, isstrict=False):
+        self.lines = lines
+        self.isfree = isfree
+        self.isstrict = isstrict
+        self.entries = []
+        self.ok = True
+        self._scan()
+
+    def _statements(self):
+        if self.isfree:
+            return free_form_statements(self.lines)
+        return fixed_form_statements(self.lines)
+
+    def _scan(self):
+        header = _header[self.isfree]
+        unit = _unit[self.isfree]
+        stack = []
+        for text, first, last in self._statements():
+            top = stack and stack[-1] or None
+
+            # track where the specification part of a unit ends.
+            if (top is not None and top.kind not in ('interface', 'type')
+                    and top.spec_end is None and _executable.match(text)):
+                if ';' in self.lines[first]:
+                    # declarations may share the line; the specification
+                    # part can't be cut there.
+                    self.ok = False
+                    return
+                top.spec_end = first
+                continue
+
+            mobj = header.match(text)
+            if mobj:
+                stack.append(ScopeEntry(mobj.group('kind').lower(),
+                                        mobj.group('name').lower(),
+                                        first, len(stack),
+                                        ' '.join(mobj.group('prefix').lower().split())))
+                continue
+            mobj = unit.match(text)
+            if mobj:
+                if mobj.group('kind'):
+                    kind, name = mobj.group('kind'), mobj.group('name')
+                elif mobj.group('bd'):
+                    kind, name = 'blockdata', mobj.group('bdname') or ''
+                else:
+                    kind, name = 'submodule', mobj.group('subname')
+                stack.append(ScopeEntry(kind.lower(), name.lower(),
+                                        first, len(stack)))
+                continue
+            if _interface.match(text):
+                stack.append(ScopeEntry('interface', '', first, len(stack)))
+                continue
+            if _typedef.match(text) and top is not None:
+                stack.append(ScopeEntry('type', '', first, len(stack)))
+                continue
+
+            mobj = _end.match(text)
+            if not mobj:
+                continue
+            what = mobj.group('what')
+            if what:
+                what = ''.join(what.lower().split())
+            if not stack:
+                self.ok = False
+                return
+            entry = stack.pop()
+            if what and what != entry.kind:
+                self.ok = False
+                return
+            if not what and entry.kind in ('interface', 'type'):
+                self.ok = False
+                return
+            entry.end = last
+            self.entries.append(entry)
+        if stack:
+            self.ok = False
+        self.entries.sort(key=lambda e: e.start)
+
+    def toplevel(self, kinds=PROC_KINDS):
+        return [e for e in self.entries if e.is_toplevel() and e.kind in kinds]
+
+    def _end_stmt(self, entry):
+        if self.isfree:
+            return "end %s %s" % (entry.kind, entry.name)
+        return "      end"
+
+    def needed_source(self, kinds=PROC_KINDS):
+        r"""Return the source reduced to the specification parts of the
+        top-level units of the given kinds.
+
+        Unneeded lines are blanked rather than removed so that line numbers
+        in fparser's messages still refer to the original source.  If the
+        scan failed the full source is returned unchanged.
+        """
+        if not self.ok:
+            return '\n'.join(self.lines)
+        out = [''] * len(self.lines)
+        for entry in self.toplevel(kinds):
+            if entry.spec_end is None:
+                out[entry.start:entry.end+1] = self.lines[entry.start:entry.end+1]
+            else:
+                out[entry.start:entry.spec_end] = \
+                        self.lines[entry.start:entry.spec_end]
+                out[entry.spec_end] = self._end_stmt(entry)
+        return '\n'.join(out)
+
+
+def scan(src):
+    r"""Pre-scan a Fortran source file or source string.
+
+    :Input:
+     - *src* - (string) Path to a Fortran source file or Fortran source.
+
+    Returns a `SourceIndex`; its `include_dirs` attribute is set to the
+    directory of the source file, if any.
+    """
+    from fparser import api
+    include_dirs = None
+    if os.path.isfile(src):
+        fh = open(src, 'r')
+        try:
+            text = fh.read()
+        finally:
+            fh.close()
+        include_dirs = [os.getcwd(), os.path.dirname(os.path.abspath(src))]
+    else:
+        text = src
+    reader = api.get_reader(src)
+    index = SourceIndex(text.splitlines(), reader.isfree, reader.isstrict)
+    index.include_dirs = include_dirs
+    if getattr(reader, 'ispyf', False) or \
+            os.path.splitext(src)[1].lower() in ('.c', '.pyf'):
+        # signature files and f2py comments in C sources are left to fparser.
+        index.ok = False
+    return index
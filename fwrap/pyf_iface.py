@@ -136,6 +136,10 @@ class CharacterType(Dtype):
     cdef_extern_decls = '''\
 cdef extern from "string.h":
     void *memcpy(void *dest, void *src, size_t n)
+cdef extern from "Python.h":
+    object PyMemoryView_FromObject(object obj)
+    Py_buffer *PyMemoryView_GET_BUFFER(object mview)
+    bint PyBuffer_IsContiguous(Py_buffer *view, char fort)
 '''
 
     mangler = "fw_%s"
@@ -585,7 +589,7 @@ class ArgManager(object):
 
         if left_out:
             raise RuntimeError(
-                    "Required names not provided by scope %r" % list(left_out))
+                    "Required names not provided by scope %r" % sorted(left_out))
 
     def order_declarations(self):
         decl_list = []
@@ -680,10 +684,48 @@ class Subroutine(Procedure):
         self.arg_man = ArgManager(self.args, params=self.params)
 
 
+class ModuleVariable(Var):
+    # A variable in the specification part of a module; an array is either
+    # explicit-shape or allocatable.  A protected variable may only be
+    # changed by the module itself.
+
+    def __init__(self, name, dtype, dimension=None, allocatable=False,
+                 protected=False):
+        super(ModuleVariable, self).__init__(name, dtype, dimension)
+        self.allocatable = allocatable
+        self.protected = protected
+
+    def _get_ktp(self):
+        return self.dtype.fw_ktp
+    ktp = property(_get_ktp)
+
+    def all_dtypes(self):
+        adts = self.dtype.all_dtypes()
+        if self.is_array:
+            adts += [dim_dtype]
+        return adts
+
+
 class Module(object):
 
     def __init__(self, name, mod_objects=None, uses=None):
-        pass
+        if not valid_fort_name(name):
+            raise InvalidNameException(
+                    "%s is not a valid Fortran module name." % name)
+        self.name = name.lower()
+        self.kind = 'module'
+        self.mod_objects = list(mod_objects or [])
+        self.uses = list(uses or [])
+
+    def variables(self):
+        return [obj for obj in self.mod_objects
+                    if isinstance(obj, ModuleVariable)]
+
+    def all_dtypes(self):
+        dts = []
+        for var in self.variables():
+            dts.extend(var.all_dtypes())
+        return dts
 
 
 class Use(object):
@@ -0,0 +1,343 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+# Helpers for calling the procedures of fwrap generated modules.
+#
+# Nothing here is needed by the generated modules themselves; the helpers
+# only use numpy and work with any wrapped procedure that takes its array
+# arguments as numpy arrays.
+
+import os
+import sys
+import mmap
+import weakref
+import tempfile
+import importlib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+DEFAULT_CHUNK_BYTES = 64 * 2**20
+
+# where shared arrays are backed; a RAM file system where there is one.
+SHM_DIR = os.path.isdir('/dev/shm') and '/dev/shm' or None
+
+def stream(proc, args, chunked, outputs=None, accumulate=None,
+           chunk_len=None, chunk_bytes=DEFAULT_CHUNK_BYTES, prefetch=True):
+    r"""Call proc over chunks of the last axis of some of its arguments.
+
+    Large inputs, e.g. `numpy.memmap` arrays, are never converted as a
+    whole: every call gets a Fortran contiguous copy of one chunk, so at
+    most two chunks of the inputs (the one being computed and the next one)
+    are in memory at a time.
+
+    :Input:
+     - *proc* - The wrapped procedure.
+     - *args* - (sequence) Its arguments.
+     - *chunked* - (sequence of int) Positions in args of the input arrays
+       split along their last axis.  The arguments that are neither
+       chunked, outputs nor accumulated are passed to every call as they
+       are.
+     - *outputs* - (dict) Maps positions in args to positions in the
+       results of proc.  The argument is an array, split like the chunked
+       ones, that the result is written into; each call gets an
+       uninitialised chunk in its place, unless the argument is chunked as
+       well, e.g. for intent(inout) arrays.
+     - *accumulate* - (dict) Maps positions in args to positions in the
+       results of proc.  The result of a call is passed to the next call in
+       place of the argument, e.g. for running sums.
+     - *chunk_len* - (int) Number of indices along the last axis per call.
+       By default as many as fit in chunk_bytes for the chunked and output
+       arguments together.
+     - *prefetch* - (bool) Copy the next chunk in a background thread
+       while the current one is computed.  Wrappers that release the GIL
+       overlap both.
+
+    All chunked and output arguments must have the same length along
+    their last axis.  The results of proc are counted from 0 in the tuple
+    it returns; a single result is at position 0.
+
+    Returns the results of the last call, or None if the last axis is
+    empty.
+    """
+    args = list(args)
+    outputs = dict(outputs or {})
+    accumulate = dict(accumulate or {})
+    split = list(chunked) + [pos for pos in sorted(outputs)
+                                    if pos not in chunked]
+    if not split:
+        raise ValueError("no chunked or output arguments")
+    for pos in split:
+        if not isinstance(args[pos], np.ndarray):
+            args[pos] = np.asarray(args[pos])
+        if args[pos].ndim == 0:
+            raise ValueError("argument %d is a scalar, it can't be chunked" %
+                             pos)
+    length = args[split[0]].shape[-1]
+    for pos in split[1:]:
+        if args[pos].shape[-1] != length:
+            raise ValueError("argument %d has length %d along its last "
+                             "axis, expected %d" %
+                             (pos, args[pos].shape[-1], length))
+    if chunk_len is None:
+        chunk_len = _chunk_len(args, split, chunk_bytes)
+    if chunk_len < 1:
+        raise ValueError("chunk_len must be positive, got %d" % chunk_len)
+
+    starts = range(0, length, chunk_len)
+
+    def load(start):
+        # the arguments of the call for the chunk at start.
+        stop = min(start + chunk_len, length)
+        chunk = {}
+        for pos in chunked:
+            chunk[pos] = np.array(args[pos][..., start:stop], order='F')
+        for pos in outputs:
+            if pos in chunk:
+                continue
+            shape = args[pos].shape[:-1] + (stop - start,)
+            chunk[pos] = np.empty(shape, dtype=args[pos].dtype, order='F')
+        return stop, chunk
+
+    pool = prefetch and len(starts) > 1 and ThreadPool(1) or None
+    try:
+        result = None
+        pending = None
+        for idx, start in enumerate(starts):
+            if pending is not None:
+                stop, chunk = pending.get()
+            else:
+                stop, chunk = load(start)
+            pending = None
+            if pool is not None and idx + 1 < len(starts):
+                pending = pool.apply_async(load, (starts[idx+1],))
+            call_args = list(args)
+            for pos, value in chunk.items():
+                call_args[pos] = value
+            result = proc(*call_args)
+            results = _as_tuple(result)
+            for pos, rpos in outputs.items():
+                args[pos][..., start:stop] = results[rpos]
+            for pos, rpos in accumulate.items():
+                args[pos] = results[rpos]
+        return result
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def _chunk_len(args, split, chunk_bytes):
+    per_index = 0
+    for pos in split:
+        arr = args[pos]
+        per_index += arr.itemsize * int(np.prod(arr.shape[:-1]))
+    return max(1, chunk_bytes // max(1, per_index))
+
+def _as_tuple(result):
+    if isinstance(result, tuple):
+        return result
+    return (result,)
+
+
+class _Segment(mmap.mmap):
+    # A shared mapping of a file that other processes open by its path.
+    pass
+
+# weak references to the segments this process created, and their paths.
+_owned_segments = {}
+
+def _map_file(fd, path, nbytes):
+    seg = _Segment(fd, nbytes)
+    seg.path = path
+    seg.address = np.frombuffer(seg, np.uint8).__array_interface__['data'][0]
+    return seg
+
+def _unlink_segment(ref):
+    path, pid = _owned_segments.pop(ref)
+    # forked workers inherit the table, only the creator removes the file.
+    if pid == os.getpid():
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+def shared_array(shape, dtype=np.float64, order='F', dir=None):
+    r"""Return a new, uninitialised array in memory shared with the workers
+    of a `ProcessPool`.
+
+    The array is backed by a file in dir, by default `SHM_DIR`, that is
+    removed once the array and all views of it are gone.  Arrays and views
+    of them are passed to the workers without a copy, and in place results
+    are seen by the caller.
+    """
+    dtype = np.dtype(dtype)
+    if isinstance(shape, (int, long)):
+        shape = (shape,)
+    nbytes = max(1, dtype.itemsize * int(np.prod(shape)))
+    fd, path = tempfile.mkstemp(prefix='fwrap-', dir=dir or SHM_DIR)
+    try:
+        os.ftruncate(fd, nbytes)
+        seg = _map_file(fd, path, nbytes)
+    except:
+        os.unlink(path)
+        raise
+    finally:
+        os.close(fd)
+    _owned_segments[weakref.ref(seg, _unlink_segment)] = (path, os.getpid())
+    return np.ndarray(shape, dtype, buffer=seg, order=order)
+
+def _segment_of(arr):
+    base = arr
+    while isinstance(base, np.ndarray):
+        base = base.base
+    if isinstance(base, _Segment):
+        return base
+    return None
+
+def _describe(arr, seg):
+    # enough to rebuild the array in another process that maps seg.
+    return ('shared', seg.path, len(seg),
+            arr.__array_interface__['data'][0] - seg.address,
+            arr.shape, arr.strides, arr.dtype)
+
+def _rebuild(desc, segments):
+    kind, path, nbytes, offset, shape, strides, dtype = desc
+    seg = segments.get(path)
+    if seg is None:
+        fd = os.open(path, os.O_RDWR)
+        try:
+            seg = segments[path] = _map_file(fd, path, nbytes)
+        finally:
+            os.close(fd)
+    return np.ndarray(shape, dtype, buffer=seg, offset=offset,
+                      strides=strides)
+
+def _call_in_worker(name, descs):
+    modname, procname = name
+    proc = getattr(importlib.import_module(modname), procname)
+    segments = {}
+    args = []
+    for desc in descs:
+        if desc[0] == 'shared':
+            args.append(_rebuild(desc, segments))
+        else:
+            args.append(desc[1])
+    result = proc(*args)
+    # arrays in the argument buffers, e.g. intent(inout) results, go back
+    # as descriptions; anything else is pickled.
+    ret = []
+    for item in _as_tuple(result):
+        seg = None
+        if isinstance(item, np.ndarray):
+            seg = _segment_of(item)
+        if seg is not None and segments.get(seg.path) is seg:
+            ret.append(_describe(item, seg))
+        else:
+            ret.append(('value', item))
+    return isinstance(result, tuple), ret
+
+
+class PoolResult(object):
+    r"""The pending result of `ProcessPool.apply_async`."""
+
+    def __init__(self, async_result, segments, originals):
+        # the segments stay mapped, and their files in place, until the
+        # worker is done with them.
+        self._async_result = async_result
+        self._segments = segments
+        self._originals = originals
+
+    def ready(self):
+        return self._async_result.ready()
+
+    def wait(self, timeout=None):
+        self._async_result.wait(timeout)
+
+    def get(self, timeout=None):
+        r"""Return the result of the call, raising its exception if it
+        failed.  Arrays the procedure returns from the shared argument
+        buffers are views of them, or the argument itself if it was
+        returned as it is."""
+        is_tuple, descs = self._async_result.get(timeout)
+        ret = []
+        for desc in descs:
+            if desc[0] == 'shared':
+                arg = self._originals.get(desc)
+                if arg is None:
+                    arg = _rebuild(desc, self._segments)
+                ret.append(arg)
+            else:
+                ret.append(desc[1])
+        if is_tuple:
+            return tuple(ret)
+        return ret[0]
+
+
+class ProcessPool(object):
+    r"""Call wrapped procedures in worker processes.
+
+    Procedures are looked up in the workers by module and name, so any
+    procedure of an importable fwrap module works, e.g. ones that aren't
+    thread safe.  Array arguments go through shared memory: arrays made by
+    `shared_array`, and views of them, are mapped by the workers as they
+    are; other arrays are copied once into a new shared array.  Results
+    that are argument arrays, as for intent(inout) arguments, come back as
+    those arrays without a copy.  Everything else is pickled as usual.
+
+    :Input:
+     - *processes* - (int) Number of workers, by default the number of
+       CPUs.
+    """
+
+    def __init__(self, processes=None):
+        self._pool = multiprocessing.Pool(processes)
+
+    def apply_async(self, proc, args):
+        r"""Call proc(*args) in a worker; returns a `PoolResult`."""
+        name = (proc.__module__, proc.__name__)
+        segments = {}
+        originals = {}
+        descs = []
+        for arg in args:
+            if not isinstance(arg, np.ndarray):
+                descs.append(('value', arg))
+                continue
+            seg = _segment_of(arg)
+            if seg is None:
+                copy = shared_array(arg.shape, arg.dtype)
+                copy[...] = arg
+                arg, seg = copy, _segment_of(copy)
+            desc = _describe(arg, seg)
+            segments[seg.path] = seg
+            originals[desc] = arg
+            descs.append(desc)
+        return PoolResult(self._pool.apply_async(_call_in_worker,
+                                                 (name, descs)),
+                          segments, originals)
+
+    def apply(self, proc, args):
+        r"""Call proc(*args) in a worker and return the result."""
+        return self.apply_async(proc, args).get()
+
+    def map(self, proc, arg_lists):
+        r"""Return the results of proc(*args) for every args in arg_lists,
+        computed in parallel."""
+        pending = [self.apply_async(proc, args) for args in arg_lists]
+        return [result.get() for result in pending]
+
+    def close(self):
+        self._pool.close()
+
+    def join(self):
+        self._pool.join()
+
+    def terminate(self):
+        self._pool.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.terminate()
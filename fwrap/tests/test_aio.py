@@ -0,0 +1,217 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+import time
+import threading
+import Queue
+
+import numpy as np
+
+from fwrap import aio
+
+from nose.plugins.skip import SkipTest
+from nose.tools import ok_, eq_, raises
+
+class Gate(object):
+    # stands in for a wrapped module; its procedures block until released.
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = self.max_running = 0
+
+    def proc(self, a, b):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        return a + b, a * b
+
+    def fail(self):
+        raise ValueError("failed")
+
+
+class Future(object):
+    # the part of asyncio's futures the executor uses; callbacks are run by
+    # the loop, as asyncio does.
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._state = 'pending'
+        self._value = None
+        self._callbacks = []
+
+    def done(self):
+        return self._state != 'pending'
+
+    def cancelled(self):
+        return self._state == 'cancelled'
+
+    def cancel(self):
+        if self.done():
+            return False
+        self._finish('cancelled', None)
+        return True
+
+    def set_result(self, value):
+        self._finish('result', value)
+
+    def set_exception(self, exc):
+        self._finish('exception', exc)
+
+    def result(self):
+        if self._state == 'exception':
+            raise self._value
+        ok_(self._state == 'result')
+        return self._value
+
+    def exception(self):
+        if self._state == 'exception':
+            return self._value
+        return None
+
+    def add_done_callback(self, callback):
+        if self.done():
+            self._loop.call_soon_threadsafe(callback, self)
+        else:
+            self._callbacks.append(callback)
+
+    def _finish(self, state, value):
+        ok_(not self.done())
+        self._state, self._value = state, value
+        for callback in self._callbacks:
+            self._loop.call_soon_threadsafe(callback, self)
+        self._callbacks = []
+
+
+class Loop(object):
+    # a minimal event loop: callbacks from any thread are queued and run by
+    # whoever runs the loop.
+
+    def __init__(self):
+        self.ready = Queue.Queue()
+
+    def create_future(self):
+        return Future(self)
+
+    def call_soon_threadsafe(self, callback, *args):
+        self.ready.put((callback, args))
+
+    def run_once(self, timeout):
+        try:
+            callback, args = self.ready.get(timeout=timeout)
+        except Queue.Empty:
+            return
+        callback(*args)
+
+    def run_until_complete(self, future, timeout=5):
+        deadline = time.time() + timeout
+        while not future.done():
+            ok_(time.time() < deadline, "future not done in time")
+            self.run_once(0.01)
+        return future.result()
+
+    def run_for(self, delay):
+        deadline = time.time() + delay
+        while time.time() < deadline:
+            self.run_once(0.01)
+
+
+class test_executor(object):
+
+    def setup(self):
+        self.loop = Loop()
+        self.gate = Gate()
+
+    def run(self, future):
+        return self.loop.run_until_complete(future)
+
+    def test_call(self):
+        self.gate.release.set()
+        mod = aio.AsyncModule(self.gate, max_workers=2, loop=self.loop)
+        eq_(self.run(mod.proc(2, 3)), (5, 6))
+        mod.executor.close()
+
+    def test_concurrency(self):
+        ex = aio.Executor(max_workers=2, max_pending=3, loop=self.loop)
+        results = [ex.call(self.gate.proc, i, 1) for i in range(6)]
+        # only max_pending calls are accepted at a time.
+        self.loop.run_for(0.1)
+        eq_(ex.pending(), 3)
+        self.gate.release.set()
+        done = [self.run(result) for result in results]
+        eq_([res[0] for res in done], [1, 2, 3, 4, 5, 6])
+        eq_(self.gate.max_running, 2)
+        self.loop.run_for(0.05)
+        eq_(ex.pending(), 0)
+        ex.close()
+
+    def test_submit(self):
+        ex = aio.Executor(max_workers=1, max_pending=1, loop=self.loop)
+        first = self.run(ex.submit(self.gate.proc, 1, 1))
+        second = ex.submit(self.gate.proc, 2, 2)
+        self.loop.run_for(0.05)
+        ok_(not second.done())
+        self.gate.release.set()
+        eq_(self.run(first), (2, 1))
+        eq_(self.run(self.run(second)), (4, 4))
+        ex.close()
+
+    def test_cancel(self):
+        ex = aio.Executor(max_workers=1, max_pending=1, loop=self.loop)
+        first = ex.call(self.gate.proc, 1, 1)
+        second = ex.submit(self.gate.proc, 2, 2)
+        # a call cancelled before it is accepted never runs.
+        second.cancel()
+        self.gate.release.set()
+        eq_(self.run(first), (2, 1))
+        self.loop.run_for(0.05)
+        eq_(ex.pending(), 0)
+        ex.close()
+
+    def test_snapshot(self):
+        a = np.arange(3.)
+        ex = aio.Executor(max_workers=1, loop=self.loop, snapshot=True)
+        result = ex.call(self.gate.proc, a, 1.)
+        # changes after submitting don't reach the call.
+        a[...] = -1
+        self.gate.release.set()
+        total, product = self.run(result)
+        eq_(total.tolist(), [1., 2., 3.])
+        ex.close()
+
+    def test_no_snapshot(self):
+        a = np.arange(3.)
+        ex = aio.Executor(max_workers=1, loop=self.loop)
+        result = ex.call(self.gate.proc, a, 1.)
+        a[...] = -1
+        self.gate.release.set()
+        total, product = self.run(result)
+        eq_(total.tolist(), [0., 0., 0.])
+        ex.close()
+
+    @raises(ValueError)
+    def test_error(self):
+        mod = aio.AsyncModule(self.gate, loop=self.loop)
+        self.run(mod.fail())
+
+    @raises(ValueError)
+    def test_bad_limits(self):
+        aio.Executor(max_workers=2, max_pending=1, loop=self.loop)
+
+
+def test_asyncio_loop():
+    if aio.asyncio is None:
+        raise SkipTest("neither asyncio nor trollius is available")
+    loop = aio.asyncio.new_event_loop()
+    try:
+        mod = aio.AsyncModule(Gate(), loop=loop)
+        mod.module.release.set()
+        eq_(loop.run_until_complete(mod.proc(2, 3)), (5, 6))
+        mod.executor.close()
+    finally:
+        loop.close()
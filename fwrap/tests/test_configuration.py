@@ -0,0 +1,77 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+from optparse import OptionParser
+
+from fwrap.configuration import Configuration
+
+from nose.tools import ok_, eq_, raises
+
+class test_configuration(object):
+
+    def setup(self):
+        self.parser = OptionParser()
+        Configuration.add_options(self.parser)
+
+    def parse(self, args):
+        opts, args = self.parser.parse_args(args)
+        return Configuration.from_options(opts)
+
+    def test_defaults(self):
+        cfg = self.parse([])
+        ok_(not cfg.strict_arrays)
+        eq_(cfg.to_cmdline(), [])
+
+    def test_strict_arrays(self):
+        cfg = self.parse(['--strict-arrays'])
+        ok_(cfg.strict_arrays)
+        eq_(cfg.to_cmdline(), ['--strict-arrays'])
+
+    def test_assumed_shape_cfi(self):
+        cfg = self.parse(['--assumed-shape-cfi'])
+        ok_(cfg.assumed_shape_cfi)
+        eq_(cfg.to_cmdline(), ['--assumed-shape-cfi'])
+
+    def test_procs(self):
+        cfg = self.parse(['--keep-gil=Subr1, func2'])
+        eq_(cfg.keep_gil, ('subr1', 'func2'))
+        ok_(not cfg.releases_gil('SUBR1'))
+        ok_(cfg.releases_gil('subr2'))
+        eq_(cfg.to_cmdline(), ['--keep-gil=subr1,func2'])
+
+    def test_unchecked(self):
+        cfg = self.parse(['--unchecked=Subr1'])
+        ok_(cfg.is_unchecked('SUBR1'))
+        ok_(not cfg.is_unchecked('subr2'))
+        eq_(cfg.to_cmdline(), ['--unchecked=subr1'])
+
+    def test_c_order(self):
+        cfg = self.parse(['--c-order=Subr1,subr2.B'])
+        ok_(cfg.c_order_arg('subr1', 'a'))
+        ok_(cfg.c_order_arg('subr2', 'b'))
+        ok_(not cfg.c_order_arg('subr2', 'a'))
+        ok_(not cfg.c_order_arg('subr3', 'b'))
+        eq_(cfg.to_cmdline(), ['--c-order=subr1,subr2.b'])
+
+    def test_workspace(self):
+        cfg = self.parse(['--workspace=Gesv.work,gesv.lwork=max(1, 3*N),'
+                          'gesv.iwork'])
+        eq_(cfg.workspace, ('gesv.work', 'gesv.lwork=max(1, 3*n)',
+                            'gesv.iwork'))
+        eq_(cfg.workspace_arg('GESV', 'LWork'), 'max(1, 3*n)')
+        eq_(cfg.workspace_arg('gesv', 'work'), '')
+        eq_(cfg.workspace_arg('gesv', 'n'), None)
+        eq_(cfg.workspace_arg('posv', 'work'), None)
+        eq_(cfg.to_cmdline(),
+            ['--workspace=gesv.work,gesv.lwork=max(1, 3*n),gesv.iwork'])
+
+    def test_cmdline_roundtrip(self):
+        cfg = Configuration(strict_arrays=True, copy_stats=True,
+                            keep_gil=('subr1', 'func2'))
+        eq_(vars(self.parse(cfg.to_cmdline())), vars(cfg))
+
+    @raises(TypeError)
+    def test_unknown_option(self):
+        Configuration(no_such_option=True)
@@ -6,12 +6,13 @@
 from fwrap import cy_wrap
 from fwrap import pyf_iface as pyf
 from fwrap import fc_wrap
+from fwrap.configuration import Configuration
 from cStringIO import StringIO
 from fwrap.code import CodeBuffer
 
 from tutils import compare
 
-from nose.tools import ok_, eq_, set_trace
+from nose.tools import ok_, eq_, raises, set_trace
 
 def make_caws(dts, names, intents=None):
     if intents is None:
@@ -127,35 +128,35 @@ class test_cy_char_array_arg_wrapper(object):
 
     def test_intern_declarations(self):
         eq_(self.cy_arg1d.intern_declarations(),
-                ["cdef np.ndarray[fw_charr_x8_t, "
-                 "ndim=1, mode='fortran'] charr1_",
+                ["cdef np.ndarray charr1_",
                  "cdef fwi_npy_intp_t charr1_shape[2]"])
         eq_(self.cy_arg2d.intern_declarations(),
-                ["cdef np.ndarray[fw_charr_x30_t, "
-                 "ndim=2, mode='fortran'] charr2_",
+                ["cdef np.ndarray charr2_",
                  "cdef fwi_npy_intp_t charr2_shape[3]"])
 
     def test_pre_call_code(self):
-        cmp1 = ["charr1_odtype = charr1.dtype",
-                 "for i in range(1): charr1_shape[i+1] = charr1.shape[i]",
-                 "charr1.dtype = 'b'",
-                 "charr1_ = charr1",
-                 "charr1_shape[0] = <fwi_npy_intp_t>"
-                     "(charr1.shape[0]/charr1_shape[1])",]
+        cmp1 = ["charr1_ = np.PyArray_FROMANY(charr1, np.NPY_STRING, "
+                    "1, 1, np.NPY_F_CONTIGUOUS)",
+                "charr1_shape[0] = np.PyArray_ITEMSIZE(charr1_)",
+                "charr1_shape[1] = charr1_.shape[0]"]
         eq_(self.cy_arg1d.pre_call_code(), cmp1)
-        cmp2 = ["charr2_odtype = charr2.dtype",
-                 "for i in range(2): charr2_shape[i+1] = charr2.shape[i]",
-                 "charr2.dtype = 'b'",
-                 "charr2_ = charr2",
-                 "charr2_shape[0] = <fwi_npy_intp_t>"
-                     "(charr2.shape[0]/charr2_shape[1])"]
+        cmp2 = ["charr2_ = np.PyArray_FROMANY(charr2, np.NPY_STRING, "
+                    "2, 2, np.NPY_F_CONTIGUOUS)",
+                "charr2_shape[0] = np.PyArray_ITEMSIZE(charr2_)",
+                "charr2_shape[1] = charr2_.shape[0]",
+                "charr2_shape[2] = charr2_.shape[1]"]
         eq_(self.cy_arg2d.pre_call_code(), cmp2)
 
     def test_post_call_code(self):
-        eq_(self.cy_arg1d.post_call_code(),
-                ["charr1.dtype = charr1_odtype"])
-        eq_(self.cy_arg2d.post_call_code(),
-                ["charr2.dtype = charr2_odtype"])
+        # the caller's array is left alone.
+        eq_(self.cy_arg1d.post_call_code(), [])
+        eq_(self.cy_arg2d.post_call_code(), [])
+
+    def test_memoryview(self):
+        cfg = Configuration(array_args='memoryview')
+        cy_arg = cy_wrap.CyCharArrayArgWrapper(self.cy_arg1d.arg, cfg)
+        eq_(cy_arg.intern_declarations(), self.cy_arg1d.intern_declarations())
+        eq_(cy_arg.call_arg_list(), self.cy_arg1d.call_arg_list())
 
     def test_call_arg_list(self):
         eq_(self.cy_arg1d.call_arg_list(),
@@ -218,6 +219,154 @@ class test_cy_array_arg_wrapper(object):
         eq_(self.cy_arg.return_tuple_list(), [])
         eq_(self.cy_int_arg.return_tuple_list(), ["int_array_"])
 
+    def test_memoryview(self):
+        cfg = Configuration(array_args='memoryview')
+        cy_arg = cy_wrap.CyArrayArgWrapper(self.cy_arg.arg, cfg)
+        cy_int_arg = cy_wrap.CyArrayArgWrapper(self.cy_int_arg.arg, cfg)
+        eq_(cy_arg.intern_declarations(),
+            ["cdef const fwr_real_t[::1, :, :] array_"])
+        eq_(cy_int_arg.intern_declarations(),
+            ["cdef fwi_integer_t[::1] int_array_"])
+        eq_(cy_int_arg.pre_call_code(),
+            ["try:",
+             "    int_array_ = int_array",
+             "except (TypeError, ValueError):",
+             "    int_array_ = np.PyArray_FROMANY(int_array, "
+                    "fwi_integer_t_enum, 1, 1, np.NPY_F_CONTIGUOUS)"])
+        eq_(cy_arg.call_arg_list()[-1], '<fwr_real_t*>&array_[0, 0, 0]')
+        eq_(cy_arg.return_tuple_list(), [])
+        eq_(cy_int_arg.return_tuple_list(), ['int_array_.base'])
+
+    def test_buffer(self):
+        cfg = Configuration(array_args='buffer')
+        cy_arg = cy_wrap.CyArrayArgWrapper(self.cy_arg.arg, cfg)
+        cy_int_arg = cy_wrap.CyArrayArgWrapper(self.cy_int_arg.arg, cfg)
+        eq_(cy_int_arg.intern_declarations(),
+            ["cdef object int_array_",
+             "cdef fw_buffer_t int_array_buf",
+             "int_array_buf.obj = NULL"])
+        eq_(cy_int_arg.pre_call_code(),
+            ["int_array_ = int_array",
+             "if not fw_array_buffer(&int_array_buf, int_array_, "
+                    "fwi_integer_t_enum, 1, 1):",
+             "    int_array_ = np.PyArray_FROMANY(int_array, "
+                    "fwi_integer_t_enum, 1, 1, np.NPY_F_CONTIGUOUS)",
+             "    fw_array_buffer(&int_array_buf, int_array_, "
+                    "fwi_integer_t_enum, 1, 1, 1)"])
+        eq_(cy_arg.pre_call_code()[1],
+            "if not fw_array_buffer(&array_buf, array_, "
+                "fwr_real_t_enum, 3, 0):")
+        eq_(cy_int_arg.call_arg_list(),
+            ['<fwi_npy_intp_t*>&int_array_buf.shape[0]',
+             '<fwi_integer_t*>int_array_buf.buf'])
+        eq_(cy_int_arg.post_call_code(), ['PyBuffer_Release(&int_array_buf)'])
+        eq_(cy_arg.return_tuple_list(), [])
+        eq_(cy_int_arg.return_tuple_list(), ['int_array_'])
+
+    def test_nogil_arg_declarations(self):
+        eq_(self.cy_arg.nogil_arg_declarations(),
+            ['fwi_npy_intp_t array_d1', 'fwi_npy_intp_t array_d2',
+             'fwi_npy_intp_t array_d3', 'fwr_real_t *array'])
+        eq_(self.cy_arg.nogil_call_arg_list(),
+            ['&array_d1', '&array_d2', '&array_d3', 'array'])
+
+    def test_strict_pre_call_code(self):
+        cfg = Configuration(strict_arrays=True)
+        cy_arg = cy_wrap.CyArrayArgWrapper(self.cy_arg.arg, cfg)
+        cy_int_arg = cy_wrap.CyArrayArgWrapper(self.cy_int_arg.arg, cfg)
+        eq_(cy_arg.pre_call_code(),
+                ["array_ = fw_strict_array(array, "
+                 "fwr_real_t_enum, 3, 0, 'array')"])
+        eq_(cy_int_arg.pre_call_code(),
+                ["int_array_ = fw_strict_array(int_array, "
+                 "fwi_integer_t_enum, 1, 1, 'int_array')"])
+
+    def test_copy_stats_pre_call_code(self):
+        cfg = Configuration(copy_stats=True)
+        cy_arg = cy_wrap.CyArrayArgWrapper(self.cy_arg.arg, cfg, 'subr')
+        eq_(cy_arg.pre_call_code(),
+                ["array_ = fw_coerce_array(array, "
+                 "fwr_real_t_enum, 3, 'subr', 'array')"])
+
+
+class test_c_order(object):
+
+    def setup(self):
+        arg = pyf.Argument('array', dtype=pyf.default_real,
+                           dimension=[':']*2, intent='inout')
+        vec = pyf.Argument('vec', dtype=pyf.default_real,
+                           dimension=[':'], intent='inout')
+        self.cfg = Configuration(c_order=('subr',))
+        self.cy_arg = cy_wrap.CyArrayArgWrapper(
+                fc_wrap.ArrayArgWrapper(arg), self.cfg, 'subr')
+        self.cy_vec = cy_wrap.CyArrayArgWrapper(
+                fc_wrap.ArrayArgWrapper(vec), self.cfg, 'subr')
+        self.cy_other = cy_wrap.CyArrayArgWrapper(
+                fc_wrap.ArrayArgWrapper(arg), self.cfg, 'other')
+
+    def test_intern_declarations(self):
+        eq_(self.cy_arg.intern_declarations()[-1], 'cdef bint array_corder')
+        eq_(len(self.cy_vec.intern_declarations()), 1)
+        eq_(len(self.cy_other.intern_declarations()), 1)
+
+    def test_pre_call_code(self):
+        eq_(self.cy_arg.pre_call_code(),
+                ['array_corder = fw_c_order(array)',
+                 'if array_corder:',
+                 '    array = array.T',
+                 'array_ = np.PyArray_FROMANY(array, fwr_real_t_enum, 2, 2, '
+                    'np.NPY_F_CONTIGUOUS)'])
+        eq_(self.cy_vec.pre_call_code(),
+                ['vec_ = np.PyArray_FROMANY(vec, fwr_real_t_enum, 1, 1, '
+                    'np.NPY_F_CONTIGUOUS)'])
+
+    def test_return_tuple_list(self):
+        eq_(self.cy_arg.return_tuple_list(),
+                ['(array_.T if array_corder else array_)'])
+        eq_(self.cy_other.return_tuple_list(), ['array_'])
+
+
+class test_cy_cfi_array_arg_wrapper(object):
+
+    def setup(self):
+        arg = pyf.Argument('array', dtype=pyf.default_real,
+                           dimension=[':']*2, intent='inout')
+        self.fc_arg = fc_wrap.CfiArrayArgWrapper(arg)
+        self.cy_arg = cy_wrap.CyArrayArgWrapper(self.fc_arg, None, 'subr')
+
+    def test_factory(self):
+        ok_(isinstance(self.cy_arg, cy_wrap.CyCfiArrayArgWrapper))
+
+    def test_intern_declarations(self):
+        eq_(self.cy_arg.intern_declarations(),
+                ['cdef np.ndarray array_',
+                 'cdef fw_cfi_cdesc_t array_cdesc'])
+
+    def test_pre_call_code(self):
+        # any memory layout will do.
+        eq_(self.cy_arg.pre_call_code(),
+                ['array_ = np.PyArray_FROMANY(array, fwr_real_t_enum, '
+                    '2, 2, np.NPY_ALIGNED)',
+                 'fw_cfi_array(<CFI_cdesc_t*>&array_cdesc, array_, 2)'])
+        cfg = Configuration(strict_arrays=True)
+        cy_arg = cy_wrap.CyArrayArgWrapper(self.fc_arg, cfg, 'subr')
+        eq_(cy_arg.pre_call_code()[0],
+                "array_ = fw_strict_array(array, fwr_real_t_enum, 2, 1, "
+                "'array', 0)")
+        cfg = Configuration(copy_stats=True)
+        cy_arg = cy_wrap.CyArrayArgWrapper(self.fc_arg, cfg, 'subr')
+        eq_(cy_arg.pre_call_code()[0],
+                "array_ = fw_coerce_array(array, fwr_real_t_enum, 2, "
+                "'subr', 'array', np.NPY_ALIGNED)")
+
+    def test_call_arg_list(self):
+        eq_(self.cy_arg.call_arg_list(), ['<CFI_cdesc_t*>&array_cdesc'])
+        eq_(self.cy_arg.nogil_arg_declarations(), ['CFI_cdesc_t *array'])
+        eq_(self.cy_arg.nogil_call_arg_list(), ['array'])
+
+    def test_return_tuple_list(self):
+        eq_(self.cy_arg.return_tuple_list(), ['array_'])
+
 
 class test_char_assumed_size(object):
 
@@ -234,7 +383,7 @@ class test_char_assumed_size(object):
 
     def test_extern_declarations(self):
         eq_(self.intent_out.extern_declarations(),
-                ['fw_bytes name'])
+                ['object name'])
 
     def test_pre_call_code(self):
         eq_(self.intent_out.pre_call_code(),
@@ -242,10 +391,35 @@ class test_char_assumed_size(object):
                  'fw_name = PyBytes_FromStringAndSize(NULL, fw_name_len)',
                  'fw_name_buf = <char*>fw_name',])
         eq_(self.intent_inout.pre_call_code(),
-                ['fw_name_len = len(name)',
-                 'fw_name = PyBytes_FromStringAndSize(NULL, fw_name_len)',
-                 'fw_name_buf = <char*>fw_name',
-                 'memcpy(fw_name_buf, <char*>name, fw_name_len+1)',])
+                ['if type(name) is bytes:',
+                 '    fw_name_len = len(name)',
+                 '    fw_name = PyBytes_FromStringAndSize(NULL, fw_name_len)',
+                 '    fw_name_buf = <char*>fw_name',
+                 '    memcpy(fw_name_buf, <char*>name, fw_name_len+1)',
+                 '    fw_name_view = None',
+                 'else:',
+                 "    fw_name_view = fw_char_buffer(name, 1, 'name')",
+                 '    fw_name_len = PyMemoryView_GET_BUFFER(fw_name_view).len',
+                 '    fw_name_buf = <char*>PyMemoryView_GET_BUFFER('
+                                                    'fw_name_view).buf'])
+
+    def test_out_buffers(self):
+        cfg = Configuration(char_out_buffers=True)
+        cy_arg = cy_wrap.CyArgWrapper(self.intent_out.arg, cfg)
+        eq_(cy_arg.pre_call_code()[0], 'if type(name) is bytes:')
+        eq_(cy_arg.pre_call_code()[1], '    fw_name_len = len(name)')
+
+    def test_helper(self):
+        def wrap(intent, cfg=None):
+            name = pyf.Argument('name', pyf.CharacterType('ch_8', len='8'),
+                                intent)
+            subr = pyf.Subroutine(name='subr', args=[name])
+            return cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([subr], cfg), cfg)
+        # fw_char_buffer is only generated for arguments taking buffers.
+        ok_(cy_wrap._uses_char_buffers(wrap('in')))
+        ok_(not cy_wrap._uses_char_buffers(wrap('out')))
+        ok_(cy_wrap._uses_char_buffers(
+                wrap('out', Configuration(char_out_buffers=True))))
 
 class test_char_args(object):
 
@@ -259,31 +433,31 @@ class test_char_args(object):
                                 self.intents)
         (self.intent_in, self.intent_out,
                 self.intent_inout, self.no_intent) = self.caws
+        cfg = Configuration(char_out_buffers=True)
+        self.out_buffer = cy_wrap.CyArgWrapper(self.intent_out.arg, cfg)
 
     def test_extern_declarations(self):
         eq_(self.intent_in.extern_declarations(),
-               ['fw_bytes name'])
+               ['object name'])
         eq_(self.intent_inout.extern_declarations(),
-               ['fw_bytes name'])
+               ['object name'])
         eq_(self.intent_out.extern_declarations(),
                [])
+        eq_(self.out_buffer.extern_declarations(),
+               ['object name'])
 
     def test_intern_declarations(self):
         eq_(self.intent_out.intern_declarations(),
                 ['cdef fw_bytes fw_name',
                  'cdef fwi_npy_intp_t fw_name_len',
                  'cdef char *fw_name_buf'])
-        eq_(self.intent_in.intern_declarations(),
-                ['cdef fw_bytes fw_name',
-                 'cdef fwi_npy_intp_t fw_name_len'])
-        eq_(self.intent_inout.intern_declarations(),
-                ['cdef fw_bytes fw_name',
-                 'cdef fwi_npy_intp_t fw_name_len',
-                 'cdef char *fw_name_buf'])
-        eq_(self.no_intent.intern_declarations(),
-                ['cdef fw_bytes fw_name',
-                 'cdef fwi_npy_intp_t fw_name_len',
-                 'cdef char *fw_name_buf'])
+        for arg in (self.intent_in, self.intent_inout, self.no_intent,
+                    self.out_buffer):
+            eq_(arg.intern_declarations(),
+                    ['cdef fw_bytes fw_name',
+                     'cdef fwi_npy_intp_t fw_name_len',
+                     'cdef char *fw_name_buf',
+                     'cdef object fw_name_view'])
 
     def test_pre_call_code(self):
         eq_(self.intent_out.pre_call_code(),
@@ -291,13 +465,38 @@ class test_char_args(object):
                  'fw_name = PyBytes_FromStringAndSize(NULL, fw_name_len)',
                  'fw_name_buf = <char*>fw_name'])
         eq_(self.intent_in.pre_call_code(),
-                ['fw_name_len = len(name)',
-                 'fw_name = name',])
+                ['if type(name) is bytes:',
+                 '    fw_name_len = len(name)',
+                 '    fw_name = name',
+                 '    fw_name_buf = <char*>fw_name',
+                 'else:',
+                 "    fw_name_view = fw_char_buffer(name, 0, 'name')",
+                 '    fw_name_len = PyMemoryView_GET_BUFFER(fw_name_view).len',
+                 '    fw_name_buf = <char*>PyMemoryView_GET_BUFFER('
+                                                    'fw_name_view).buf'])
         eq_(self.intent_inout.pre_call_code(),
-                ['fw_name_len = 30',
-                 'fw_name = PyBytes_FromStringAndSize(NULL, fw_name_len)',
-                 'fw_name_buf = <char*>fw_name',
-                 'memcpy(fw_name_buf, <char*>name, fw_name_len+1)',])
+                ['if type(name) is bytes:',
+                 '    fw_name_len = 30',
+                 '    fw_name = PyBytes_FromStringAndSize(NULL, fw_name_len)',
+                 '    fw_name_buf = <char*>fw_name',
+                 '    memcpy(fw_name_buf, <char*>name, fw_name_len+1)',
+                 '    fw_name_view = None',
+                 'else:',
+                 "    fw_name_view = fw_char_buffer(name, 1, 'name')",
+                 '    fw_name_len = PyMemoryView_GET_BUFFER(fw_name_view).len',
+                 '    fw_name_buf = <char*>PyMemoryView_GET_BUFFER('
+                                                    'fw_name_view).buf'])
+        eq_(self.out_buffer.pre_call_code(),
+                ['if name is None or type(name) is bytes:',
+                 '    fw_name_len = 20',
+                 '    fw_name = PyBytes_FromStringAndSize(NULL, fw_name_len)',
+                 '    fw_name_buf = <char*>fw_name',
+                 '    fw_name_view = None',
+                 'else:',
+                 "    fw_name_view = fw_char_buffer(name, 1, 'name')",
+                 '    fw_name_len = PyMemoryView_GET_BUFFER(fw_name_view).len',
+                 '    fw_name_buf = <char*>PyMemoryView_GET_BUFFER('
+                                                    'fw_name_view).buf'])
 
     def test_post_call_code(self):
         eq_(self.intent_out.post_call_code(), [])
@@ -307,15 +506,25 @@ class test_char_args(object):
     def test_call_arg_list(self):
         eq_(self.intent_out.call_arg_list(), ['&fw_name_len', 'fw_name_buf'])
         eq_(self.intent_in.call_arg_list(),
-                ['&fw_name_len', '<char*>fw_name'])
+                ['&fw_name_len', 'fw_name_buf'])
         eq_(self.intent_inout.call_arg_list(),
                 ['&fw_name_len', 'fw_name_buf'])
 
     def test_return_tuple_list(self):
-        eq_(self.intent_inout.return_tuple_list(), ['fw_name'])
+        eq_(self.intent_inout.return_tuple_list(),
+                ['(name if fw_name_view is not None else fw_name)'])
+        eq_(self.out_buffer.return_tuple_list(),
+                ['(name if fw_name_view is not None else fw_name)'])
         eq_(self.intent_out.return_tuple_list(), ['fw_name'])
         eq_(self.intent_in.return_tuple_list(), [])
 
+    def test_docstring(self):
+        eq_(self.intent_out.docstring_extern_arg_list(), [])
+        eq_(self.out_buffer.docstring_extern_arg_list(), ['name'])
+        eq_(self.out_buffer.docstring_return_tuple_list(), ['name'])
+        eq_(self.out_buffer.in_dstring(),
+                ['name : fw_ch_20, len 20, intent out'])
+
 class test_cmplx_args(object):
 
     def setup(self):
@@ -492,13 +701,46 @@ cpdef api object fort_subr(fwi_integer_t int_arg_in, fwi_integer_t int_arg_inout
     cdef fwi_integer_t int_arg_out
     cdef fwi_integer_t fw_iserr__
     cdef fw_character_t fw_errstr__[fw_errstr_len]
-    fort_subr_c(&int_arg_in, &int_arg_inout, &int_arg_out, &real_arg, &fw_iserr__, fw_errstr__)
+    with nogil:
+        fort_subr_c(&int_arg_in, &int_arg_inout, &int_arg_out, &real_arg, &fw_iserr__, fw_errstr__)
     if fw_iserr__ != FW_NO_ERR__:
         raise RuntimeError("an error was encountered when calling the 'fort_subr' wrapper.")
     return (int_arg_inout, int_arg_out, real_arg,)
 '''
         compare(cy_wrapper, buf.getvalue())
 
+    def test_nogil_prototype(self):
+        eq_(self.cy_subr_wrapper.nogil_prototype(),
+            'cdef int fort_subr_nogil(fwi_integer_t int_arg_in, '
+            'fwi_integer_t *int_arg_inout, fwi_integer_t *int_arg_out, '
+            'fwr_real_t *real_arg) nogil')
+        eq_(self.cy_subr_wrapper.pxd_declarations(),
+            [self.cy_subr_wrapper.cy_prototype(),
+             self.cy_subr_wrapper.nogil_prototype()])
+
+    def test_generate_nogil_wrapper(self):
+        buf = CodeBuffer()
+        self.cy_func_wrapper.generate_nogil_wrapper(buf)
+        nogil_wrapper = '''\
+cdef int fort_func_nogil(fwi_integer_t *fw_ret_arg, fwi_integer_t int_arg_in, fwi_integer_t *int_arg_inout, fwi_integer_t *int_arg_out, fwr_real_t *real_arg) nogil:
+    cdef fwi_integer_t fw_iserr__
+    cdef fw_character_t fw_errstr__[fw_errstr_len]
+    fort_func_c(fw_ret_arg, &int_arg_in, int_arg_inout, int_arg_out, real_arg, &fw_iserr__, fw_errstr__)
+    return fw_iserr__
+'''
+        compare(nogil_wrapper, buf.getvalue())
+
+    def test_keep_gil(self):
+        cfg = Configuration(keep_gil=('fort_subr',))
+        cy_subr_wrapper = cy_wrap.ProcWrapper(
+                            wrapped=self.cy_subr_wrapper.wrapped, cfg=cfg)
+        buf = CodeBuffer()
+        cy_subr_wrapper.put_proc_call(buf)
+        eq_(buf.getvalue(), cy_subr_wrapper.proc_call() + '\n')
+        buf = CodeBuffer()
+        self.cy_subr_wrapper.put_proc_call(buf)
+        eq_(buf.getvalue().splitlines()[0], 'with nogil:')
+
     def test_func_generate_wrapper(self):
         buf = CodeBuffer()
         self.cy_func_wrapper.generate_wrapper(buf)
@@ -525,13 +767,180 @@ cpdef api object fort_func(fwi_integer_t int_arg_in, fwi_integer_t int_arg_inout
     cdef fwi_integer_t int_arg_out
     cdef fwi_integer_t fw_iserr__
     cdef fw_character_t fw_errstr__[fw_errstr_len]
-    fort_func_c(&fw_ret_arg, &int_arg_in, &int_arg_inout, &int_arg_out, &real_arg, &fw_iserr__, fw_errstr__)
+    with nogil:
+        fort_func_c(&fw_ret_arg, &int_arg_in, &int_arg_inout, &int_arg_out, &real_arg, &fw_iserr__, fw_errstr__)
     if fw_iserr__ != FW_NO_ERR__:
         raise RuntimeError("an error was encountered when calling the 'fort_func' wrapper.")
     return (fw_ret_arg, int_arg_inout, int_arg_out, real_arg,)
     '''
         compare(cy_wrapper, buf.getvalue())
 
+class test_buffer_proc_wrapper(object):
+
+    def setup(self):
+        arg = pyf.Argument('a', dtype=pyf.default_real,
+                           dimension=[':'], intent='in')
+        subr = fc_wrap.SubroutineWrapper(
+                        wrapped=pyf.Subroutine(name='subr', args=[arg]))
+        cfg = Configuration(array_args='buffer')
+        self.cy_wrapper = cy_wrap.ProcWrapper(wrapped=subr, cfg=cfg)
+
+    def test_post_try_finally(self):
+        # the buffer is released if the conversion fails, too.
+        buf = CodeBuffer()
+        self.cy_wrapper.post_try_finally(buf)
+        code = '''\
+try:
+    a_ = a
+    if not fw_array_buffer(&a_buf, a_, fwr_real_t_enum, 1, 0):
+        a_ = np.PyArray_FROMANY(a, fwr_real_t_enum, 1, 1, np.NPY_F_CONTIGUOUS)
+        fw_array_buffer(&a_buf, a_, fwr_real_t_enum, 1, 0, 1)
+    with nogil:
+        subr_c(<fwi_npy_intp_t*>&a_buf.shape[0], <fwr_real_t*>a_buf.buf, &fw_iserr__, fw_errstr__)
+    if fw_iserr__ != FW_NO_ERR__:
+        raise RuntimeError("an error was encountered when calling the 'subr' wrapper.")
+finally:
+    PyBuffer_Release(&a_buf)
+'''
+        eq_(buf.getvalue(), code)
+
+class test_profile(object):
+
+    def setup(self):
+        arg = pyf.Argument('a', dtype=pyf.default_real,
+                           dimension=[':'], intent='in')
+        subr = fc_wrap.SubroutineWrapper(
+                        wrapped=pyf.Subroutine(name='subr', args=[arg]))
+        self.cfg = Configuration(profile=True)
+        self.cy_wrapper = cy_wrap.ProcWrapper(wrapped=subr, cfg=self.cfg)
+
+    def test_generate_wrapper(self):
+        buf = CodeBuffer()
+        self.cy_wrapper.generate_wrapper(buf)
+        lines = [line.strip() for line in buf.getvalue().splitlines()]
+        eq_(lines[0], 'cdef fw_profile_t fw_profile_subr')
+        start = lines.index('cdef double fw_t0 = fw_clock(), fw_t1, fw_t2')
+        call = lines.index('with nogil:')
+        eq_(lines[call-2:call],
+            ['fw_nbytes = np.PyArray_NBYTES(a_)', 'fw_t1 = fw_clock()'])
+        eq_(lines[call+2], 'fw_t2 = fw_clock()')
+        eq_(lines[-1], 'fw_profile_record(&fw_profile_subr, fw_t0, fw_t1, '
+                       'fw_t2, fw_nbytes)')
+        ok_(start < call)
+
+    def test_profile_functions(self):
+        batched = cy_wrap.BatchedProcWrapper(
+                        wrapped=self.cy_wrapper.wrapped, cfg=self.cfg)
+        buf = CodeBuffer()
+        cy_wrap.put_profile_functions([self.cy_wrapper, batched], buf)
+        code = buf.getvalue()
+        ok_("fw_profile_stats(stats, 'subr', &fw_profile_subr)" in code)
+        ok_("fw_profile_stats(stats, 'subr_batched', "
+            "&fw_profile_subr_batched)" in code)
+        ok_('fw_profile_clear(&fw_profile_subr_batched)' in code)
+        eq_(cy_wrap.cymod_helper_names(self.cfg),
+            ['fwrap_profile', 'fwrap_reset_profile'])
+
+class test_workspace(object):
+
+    def wrap(self, work_dims, workspace):
+        n = pyf.Argument('n', dtype=pyf.default_integer, intent='in')
+        a = pyf.Argument('a', dtype=pyf.default_real, dimension=['n'],
+                         intent='inout')
+        work = pyf.Argument('work', dtype=pyf.default_real,
+                            dimension=work_dims, intent='out')
+        lwork = pyf.Argument('lwork', dtype=pyf.default_integer,
+                             intent='in')
+        subr = pyf.Subroutine(name='subr', args=[n, a, work, lwork])
+        cfg = Configuration(workspace=workspace)
+        fc_subr = fc_wrap.SubroutineWrapper(wrapped=subr, cfg=cfg)
+        return cy_wrap.ProcWrapper(wrapped=fc_subr, cfg=cfg)
+
+    def setup(self):
+        self.cfg = Configuration(workspace=('subr.work',
+                                            'subr.lwork=max(1,3*n)'))
+        self.cy_wrapper = self.wrap(['lwork'], self.cfg.workspace)
+
+    def test_hidden(self):
+        arg_mgr = self.cy_wrapper.arg_mgr
+        eq_(arg_mgr.arg_declarations(), ['fwi_integer_t n', 'object a'])
+        eq_(arg_mgr.return_tuple_list(), ['a_'])
+        work = arg_mgr.args[2]
+        ok_(isinstance(work, cy_wrap.CyWorkspaceArrayArgWrapper))
+        eq_(work.intern_declarations(),
+            ['cdef np.ndarray work_', 'cdef fwi_npy_intp_t work_shape[1]'])
+        eq_(work.pre_call_code(),
+            ['work_shape[0] = ((max(1,3*n)))',
+             "work_ = fw_workspace('subr.work', fwr_real_t_enum, "
+                "work_shape[0])"])
+        eq_(work.call_arg_list(), ['&work_shape[0]', '<fwr_real_t*>work_.data'])
+        ok_(not cy_wrap.BatchedProcWrapper.can_batch(self.cy_wrapper))
+
+    def test_assumed_size(self):
+        cy_wrapper = self.wrap(['*'], ('subr.work=2*n',))
+        eq_(cy_wrapper.arg_mgr.args[2].pre_call_code()[0],
+            'work_shape[0] = 2*n')
+        eq_(cy_wrapper.arg_mgr.arg_declarations(),
+            ['fwi_integer_t n', 'object a', 'fwi_integer_t lwork'])
+
+    @raises(ValueError)
+    def test_unknown_extent(self):
+        self.wrap(['*'], ('subr.work',))
+
+    @raises(ValueError)
+    def test_scalar_without_value(self):
+        self.wrap(['lwork'], ('subr.lwork',))
+
+    def test_helper(self):
+        buf = CodeBuffer()
+        cy_wrap.generate_cy_pyx([self.cy_wrapper], 'mod', buf, self.cfg)
+        ok_('cdef np.ndarray fw_workspace(' in buf.getvalue())
+
+class test_unchecked(object):
+
+    def setup(self):
+        n = pyf.Argument('n', pyf.default_integer, 'in')
+        x = pyf.Argument('x', pyf.default_real, 'inout', dimension=('n',))
+        pyf_subr = pyf.Subroutine(name='subr', args=[n, x])
+        self.cfg = Configuration(unchecked=('subr',), batched=True)
+        self.ast = cy_wrap.wrap_fc(
+                        fc_wrap.wrap_pyf_iface([pyf_subr], self.cfg), self.cfg)
+
+    def test_wrap_fc(self):
+        eq_([proc.name for proc in self.ast],
+            ['subr', 'subr_batched', 'subr_unchecked'])
+        ok_(isinstance(self.ast[2], cy_wrap.UncheckedProcWrapper))
+
+    def test_generate_wrapper(self):
+        buf = CodeBuffer()
+        self.ast[2].generate_wrapper(buf)
+        code = '''\
+cpdef api object subr_unchecked(fwi_integer_t n, object x):
+    """
+    subr_unchecked(n, x) -> x
+
+    Parameters
+    ----------
+    n : fwi_integer, intent in
+    x : fwr_real, 1D array, dimension(n), intent inout
+
+    Returns
+    -------
+    x : fwr_real, 1D array, dimension(n), intent inout
+
+    """
+    cdef np.ndarray[fwr_real_t, ndim=1, mode='fortran'] x_
+    x_ = np.PyArray_FROMANY(x, fwr_real_t_enum, 1, 1, np.NPY_F_CONTIGUOUS)
+    with nogil:
+        subr_unchecked_c(&n, <fwi_npy_intp_t*>&x_.shape[0], <fwr_real_t*>x_.data)
+    return x_
+'''
+        eq_(buf.getvalue(), code)
+
+    def test_pxd_declarations(self):
+        eq_(self.ast[2].pxd_declarations(),
+            ['cpdef api object subr_unchecked(fwi_integer_t n, object x)'])
+
 class test_docstring_gen(object):
     
     def setup(self):
@@ -662,3 +1071,223 @@ class test_docstring_gen(object):
         None
         '''
         compare("\n".join(cs.docstring()), dstring)
+
+class test_batched_proc_wrapper(object):
+
+    def setup(self):
+        n = pyf.Argument('n', pyf.default_integer, 'in')
+        x = pyf.Argument('x', pyf.default_real, 'inout', dimension=('n',))
+        s = pyf.Argument('s', pyf.default_real, 'out')
+        pyf_subr = pyf.Subroutine(name='subr', args=[n, x, s])
+        self.cfg = Configuration(batched=True)
+        self.fc_wrapper = fc_wrap.SubroutineWrapper(wrapped=pyf_subr)
+        self.cy_wrapper = cy_wrap.BatchedProcWrapper(
+                                wrapped=self.fc_wrapper, cfg=self.cfg)
+
+    def test_wrap_fc(self):
+        name = pyf.Argument('name', pyf.default_character, 'in')
+        pyf_subr = pyf.Subroutine(name='char_subr', args=[name])
+        fc_subr = fc_wrap.SubroutineWrapper(wrapped=pyf_subr)
+        ast = cy_wrap.wrap_fc([self.fc_wrapper, fc_subr], self.cfg)
+        eq_([proc.name for proc in ast], ['subr', 'subr_batched', 'char_subr'])
+        eq_([proc.name for proc in cy_wrap.wrap_fc([self.fc_wrapper])],
+            ['subr'])
+
+    def test_proc_declaration(self):
+        eq_(self.cy_wrapper.proc_declaration(),
+            'cpdef api object subr_batched(object n, object x):')
+
+    def test_pre_call_code(self):
+        buf = CodeBuffer()
+        self.cy_wrapper.pre_call_code(buf)
+        pcc = '''\
+        n_ = np.PyArray_FROMANY(n, fwi_integer_t_enum, 0, 1, np.NPY_F_CONTIGUOUS | np.NPY_FORCECAST)
+        fw_nbatch = fw_batch_len(n_, 0, fw_nbatch, 'n')
+        x_ = np.PyArray_FROMANY(x, fwr_real_t_enum, 2, 2, np.NPY_F_CONTIGUOUS)
+        fw_nbatch = fw_batch_len(x_, 1, fw_nbatch, 'x')
+        if fw_nbatch == -1:
+            fw_nbatch = 1
+        n_stride = fw_batch_stride(n_, 0)
+        x_stride = fw_batch_stride(x_, 1)
+        s_ = fw_batch_out(None, fwr_real_t_enum, fw_nbatch)
+        s_stride = fw_batch_stride(s_, 0)
+        fw_iserr__ = FW_NO_ERR__
+        '''
+        compare(buf.getvalue(), pcc)
+
+    def test_proc_call(self):
+        eq_(self.cy_wrapper.proc_call(),
+            'subr_c(<fwi_integer_t*>(n_.data + fw_b*n_stride), '
+            '<fwi_npy_intp_t*>&x_.shape[0], '
+            '<fwr_real_t*>(x_.data + fw_b*x_stride), '
+            '<fwr_real_t*>(s_.data + fw_b*s_stride), '
+            '&fw_iserr__, fw_errstr__)')
+
+    def test_put_proc_call(self):
+        buf = CodeBuffer()
+        self.cy_wrapper.put_proc_call(buf)
+        call = '''\
+        with nogil:
+            for fw_b in range(fw_nbatch):
+                %s
+                if fw_iserr__ != FW_NO_ERR__:
+                    break
+        ''' % self.cy_wrapper.proc_call()
+        compare(buf.getvalue(), call)
+
+    def test_return_tuple(self):
+        eq_(self.cy_wrapper.return_tuple(), 'return (x_, s_,)')
+
+class test_ufunc_proc_wrapper(object):
+
+    def setup(self):
+        x = pyf.Argument('x', pyf.default_real, 'in')
+        total = pyf.Argument('total', pyf.default_real, 'inout')
+        pyf_func = pyf.Function(name='func', args=[x, total],
+                    return_arg=pyf.Argument('func', pyf.default_integer))
+        self.cfg = Configuration(ufuncs=True)
+        self.fc_wrapper = fc_wrap.FunctionWrapper(wrapped=pyf_func)
+        self.cy_wrapper = cy_wrap.UfuncProcWrapper(
+                                wrapped=self.fc_wrapper, cfg=self.cfg)
+
+    def test_wrap_fc(self):
+        n = pyf.Argument('n', pyf.default_integer, 'in')
+        x = pyf.Argument('x', pyf.default_real, 'in', dimension=('n',))
+        arr_subr = fc_wrap.SubroutineWrapper(
+                    wrapped=pyf.Subroutine(name='arr_subr', args=[n, x]))
+        in_subr = fc_wrap.SubroutineWrapper(
+                    wrapped=pyf.Subroutine(name='in_subr', args=[n]))
+        ast = cy_wrap.wrap_fc([self.fc_wrapper, arr_subr, in_subr], self.cfg)
+        eq_([proc.name for proc in ast],
+            ['func', 'func_ufunc', 'arr_subr', 'in_subr'])
+        buf = CodeBuffer()
+        cy_wrap.generate_cy_pxd(ast, 'mod_fc', buf)
+        ok_('func_ufunc' not in buf.getvalue())
+
+    def test_loop(self):
+        buf = CodeBuffer()
+        self.cy_wrapper.put_loop(buf)
+        loop = '''\
+        cdef void fw_func_ufunc_loop(char **fw_args, np.npy_intp *fw_dims, np.npy_intp *fw_steps, void *fw_data) nogil:
+            cdef np.npy_intp fw_i
+            cdef fwi_integer_t fw_ret_arg
+            cdef fwr_real_t x
+            cdef fwr_real_t total
+            cdef fwi_integer_t fw_iserr__
+            cdef fw_character_t fw_errstr__[fw_errstr_len]
+            for fw_i in range(fw_dims[0]):
+                x = (<fwr_real_t*>(fw_args[0] + fw_i*fw_steps[0]))[0]
+                total = (<fwr_real_t*>(fw_args[1] + fw_i*fw_steps[1]))[0]
+                func_c(&fw_ret_arg, &x, &total, &fw_iserr__, fw_errstr__)
+                (<fwi_integer_t*>(fw_args[2] + fw_i*fw_steps[2]))[0] = fw_ret_arg
+                (<fwr_real_t*>(fw_args[3] + fw_i*fw_steps[3]))[0] = total
+        '''
+        compare(buf.getvalue(), loop)
+
+    def test_generate_wrapper(self):
+        buf = CodeBuffer()
+        self.cy_wrapper.generate_wrapper(buf)
+        lines = buf.getvalue().splitlines()
+        ok_('fw_func_ufunc_types[2] = fwi_integer_t_enum' in lines)
+        ok_(lines[-2].startswith('func_ufunc = np.PyUFunc_FromFuncAndData('
+                                 'fw_func_ufunc_loops, fw_func_ufunc_data, '
+                                 'fw_func_ufunc_types, 1, 2, 2,'))
+
+
+class test_module(object):
+
+    def setup(self):
+        state = pyf.ModuleVariable('state', pyf.default_dbl,
+                                   dimension=[':'], allocatable=True)
+        nsteps = pyf.ModuleVariable('nsteps', pyf.default_integer)
+        dt = pyf.ModuleVariable('dt', pyf.default_dbl, protected=True)
+        grid = pyf.ModuleVariable('grid', pyf.default_dbl,
+                                  dimension=['3'], protected=True)
+        mod = pyf.Module('sim', mod_objects=[nsteps, state, dt, grid])
+        n = pyf.Argument('n', pyf.default_integer, 'in')
+        subr = pyf.Subroutine(name='step', args=[n])
+        self.ast = cy_wrap.wrap_fc(fc_wrap.wrap_pyf_iface([mod, subr]))
+
+    def test_wrap_fc(self):
+        eq_([proc.name for proc in self.ast], ['sim', 'step'])
+        mod = self.ast[0]
+        ok_(isinstance(mod, cy_wrap.ModuleWrapper))
+        eq_([accessor.name for accessor in mod.accessors],
+            ['fw_sim_nsteps_c', 'fw_sim_state_c', 'fw_sim_dt_c',
+             'fw_sim_grid_c'])
+        ok_(cy_wrap._uses_module_arrays(self.ast))
+
+    def test_docstring(self):
+        dstring = cy_wrap.get_cymod_docstring(self.ast, 'mod')
+        idx = dstring.index('Modules')
+        eq_(dstring[idx-2:idx+5],
+            ['step(...)', '', 'Modules', '-------', 'sim', '',
+             'Data Types'])
+
+    def test_generate_wrapper(self):
+        buf = CodeBuffer()
+        self.ast[0].generate_wrapper(buf)
+        code = '''\
+cdef class fw_module_sim:
+    """
+    Variables of the Fortran module sim.
+
+    Arrays are views of the Fortran storage, or None while not allocated;
+    assigning to an array copies into the storage.  A view must not be
+    used once its array was deallocated or reallocated.
+    Protected variables are read-only.
+
+    Variables
+    ---------
+    nsteps : fwi_integer
+    state : fwr_dbl, 1D array, dimension(:), allocatable
+    dt : fwr_dbl, protected
+    grid : fwr_dbl, 1D array, dimension(3), protected
+    """
+    cdef fwi_integer_t *fw_nsteps
+    cdef object fw_state
+    cdef fwr_dbl_t *fw_dt
+    cdef object fw_grid
+
+    def __cinit__(self):
+        fw_sim_nsteps_c(<void**>&self.fw_nsteps)
+        fw_sim_dt_c(<void**>&self.fw_dt)
+
+    property nsteps:
+        "nsteps : fwi_integer"
+        def __get__(self):
+            return self.fw_nsteps[0]
+        def __set__(self, fwi_integer_t value):
+            self.fw_nsteps[0] = value
+
+    property state:
+        "state : fwr_dbl, 1D array, dimension(:), allocatable"
+        def __get__(self):
+            cdef void *fw_data
+            cdef fwi_npy_intp_t fw_shape[1]
+            fw_sim_state_c(&fw_data, fw_shape)
+            self.fw_state = fw_module_array(self.fw_state, fw_data, 1,
+                                            fw_shape, fwr_dbl_t_enum, 1)
+            return self.fw_state
+        def __set__(self, value):
+            fw_module_array_set(self.state, value, "sim.state")
+
+    property dt:
+        "dt : fwr_dbl, protected"
+        def __get__(self):
+            return self.fw_dt[0]
+
+    property grid:
+        "grid : fwr_dbl, 1D array, dimension(3), protected"
+        def __get__(self):
+            cdef void *fw_data
+            cdef fwi_npy_intp_t fw_shape[1]
+            fw_sim_grid_c(&fw_data, fw_shape)
+            self.fw_grid = fw_module_array(self.fw_grid, fw_data, 1,
+                                           fw_shape, fwr_dbl_t_enum, 0)
+            return self.fw_grid
+
+sim = fw_module_sim()
+
+'''
+        compare(code, buf.getvalue())
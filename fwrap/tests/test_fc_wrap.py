@@ -6,6 +6,7 @@
 from fwrap import pyf_iface as pyf
 from fwrap import fc_wrap
 from fwrap.code import CodeBuffer
+from fwrap.configuration import Configuration
 
 from tutils import compare
 
@@ -54,7 +55,7 @@ def test_generate_fc_pxd():
     code = '''\
     from fwrap_ktp cimport *
 
-    cdef extern from "foobar":
+    cdef extern from "foobar" nogil:
         void two_arg_c(fwr_real_t *, fwi_integer_t *, fwi_integer_t *, fwi_integer_t *, fw_character_t *)
     '''
     compare(buf.getvalue(), code)
@@ -221,6 +222,91 @@ def test_intent_hide():
 '''
     compare(check, buf.getvalue())
 
+def test_workspace_hide():
+    n = pyf.Argument('n', dtype=pyf.default_integer, intent='in')
+    lwork = pyf.Argument('lwork', dtype=pyf.default_integer, intent='in')
+    work = pyf.Argument('work', dtype=pyf.default_real,
+                        dimension=['lwork'], intent='out')
+    subr = pyf.Subroutine('ws_subr', args=[work, lwork, n])
+    cfg = Configuration(workspace=('ws_subr.work', 'ws_subr.lwork=2*n'))
+    wppr = fc_wrap.SubroutineWrapper(wrapped=subr, cfg=cfg)
+    arg_man = wppr.arg_man
+    eq_(arg_man.extern_arg_list(),
+        ['work_d1', 'work', 'n', 'fw_iserr__', 'fw_errstr__'])
+    eq_(arg_man.call_arg_list(), ['work', 'lwork', 'n'])
+    # lwork is set before the extent of work is checked against it.
+    eq_(arg_man.pre_call_code()[:2], ['fw_iserr__ = FW_INIT_ERR__',
+                                      'lwork = (2*n)'])
+
+def test_unchecked():
+    n = pyf.Argument('n', dtype=pyf.default_integer, intent='in')
+    arr = pyf.Argument('arr', dtype=pyf.default_real,
+                       dimension=['n'], intent='inout')
+    name = pyf.Argument('name', dtype=pyf.CharacterType('ch_8', len='8'),
+                        intent='in')
+    subr = pyf.Subroutine('uc_subr', args=[n, arr, name])
+    cfg = Configuration(unchecked=('uc_subr',))
+    checked, unchecked = fc_wrap.wrap_pyf_iface([subr], cfg)
+    ok_(checked.checked and not unchecked.checked)
+    eq_(unchecked.name, 'uc_subr_unchecked_c')
+    eq_(unchecked.extern_arg_list(),
+        ['n', 'arr_d1', 'arr', 'fw_name_len', 'name'])
+    eq_(unchecked.arg_man.pre_call_code(),
+        ['call c_f_pointer(name, fw_name)'])
+    eq_(unchecked.arg_man.post_call_code(), [])
+    ok_('FW_ARR_DIM__' in '\n'.join(checked.arg_man.pre_call_code()))
+    eq_(len(fc_wrap.wrap_pyf_iface([subr])), 1)
+
+def test_module_var_wrapper():
+    state = pyf.ModuleVariable('state', pyf.default_dbl,
+                               dimension=[':'], allocatable=True)
+    nsteps = pyf.ModuleVariable('nsteps', pyf.default_integer)
+    mod = pyf.Module('Sim', mod_objects=[state, nsteps])
+    state_w, nsteps_w = fc_wrap.wrap_pyf_iface([mod])
+    eq_(state_w.c_prototype(),
+        'void fw_sim_state_c(void **, fwi_npy_intp_t *);')
+    eq_(nsteps_w.c_prototype(), 'void fw_sim_nsteps_c(void **);')
+    buf = CodeBuffer()
+    state_w.generate_wrapper(buf)
+    fort_file = '''\
+subroutine fw_sim_state_c(fw_data, fw_shape) bind(c, name="fw_sim_state_c")
+    use fwrap_ktp_mod
+    use sim, only: state
+    implicit none
+    type(c_ptr), intent(out) :: fw_data
+    integer(kind=fwi_npy_intp_t), dimension(1), intent(out) :: fw_shape
+    fw_data = c_null_ptr
+    fw_shape = 0
+    if (.not. allocated(state)) return
+    fw_shape = shape(state)
+    call fw_address(state, fw_shape)
+contains
+    subroutine fw_address(fw_var, fw_extents)
+        integer(kind=fwi_npy_intp_t), dimension(1), intent(in) :: fw_extents
+        real(kind=fwr_dbl_t), dimension(fw_extents(1)), target :: fw_var
+        fw_data = c_loc(fw_var)
+    end subroutine fw_address
+end subroutine fw_sim_state_c
+'''
+    compare(fort_file, buf.getvalue())
+    buf = CodeBuffer()
+    nsteps_w.generate_wrapper(buf)
+    fort_file = '''\
+subroutine fw_sim_nsteps_c(fw_data) bind(c, name="fw_sim_nsteps_c")
+    use fwrap_ktp_mod
+    use sim, only: nsteps
+    implicit none
+    type(c_ptr), intent(out) :: fw_data
+    call fw_address(nsteps)
+contains
+    subroutine fw_address(fw_var)
+        integer(kind=fwi_integer_t), target :: fw_var
+        fw_data = c_loc(fw_var)
+    end subroutine fw_address
+end subroutine fw_sim_nsteps_c
+'''
+    compare(fort_file, buf.getvalue())
+
 def test_logical_function():
     return_arg = pyf.Argument('lgcl_fun',
             dtype=pyf.LogicalType(fw_ktp='lgcl'))
@@ -576,6 +662,40 @@ real(kind=fwr_real_t), dimension(real_arr_arg_d1, real_arr_arg_d2, real_arr_arg_
                  'endif').splitlines())
 
 
+class test_cfi_array_arg_wrapper(object):
+
+    def setup(self):
+        cfg = Configuration(assumed_shape_cfi=True)
+        self.arr_arg = pyf.Argument('arr_arg',
+                                pyf.default_integer,
+                                dimension=(':',':'), intent='inout')
+        self.explicit_arg = pyf.Argument('exp_arg',
+                                pyf.default_real,
+                                dimension=('d1',), intent='in')
+        self.cfi_wrapper = fc_wrap.ArgWrapperFactory(self.arr_arg, cfg)
+        self.explicit_wrapper = fc_wrap.ArgWrapperFactory(self.explicit_arg,
+                                                          cfg)
+
+    def test_factory(self):
+        ok_(isinstance(self.cfi_wrapper, fc_wrap.CfiArrayArgWrapper))
+        ok_(not isinstance(self.explicit_wrapper,
+                           fc_wrap.CfiArrayArgWrapper))
+        ok_(not isinstance(fc_wrap.ArgWrapperFactory(self.arr_arg),
+                           fc_wrap.CfiArrayArgWrapper))
+
+    def test_extern_decls(self):
+        eq_(self.cfi_wrapper.extern_declarations(),
+                ['integer(kind=fwi_integer_t), dimension(:, :), '
+                 'intent(inout) :: arr_arg'])
+        eq_(self.cfi_wrapper.extern_arg_list(), ['arr_arg'])
+
+    def test_c_declarations(self):
+        eq_(self.cfi_wrapper.c_types(), ['CFI_cdesc_t *'])
+        eq_(self.cfi_wrapper.c_declarations(), ['CFI_cdesc_t *arr_arg'])
+
+    def test_pre_call_code(self):
+        eq_(self.cfi_wrapper.pre_call_code(), [])
+
 class test_logical_arg(object):
 
     def setup(self):
@@ -86,3 +86,29 @@ end function int_args_func
             for arg in func.args],
         ["integer(kind=%d)" % i
             for i in (1,2,4,8)])
+
+def test_parse_module_variables():
+    fcode = '''\
+module sim
+    implicit none
+    private :: hidden
+    integer, parameter :: n = 3
+    integer :: nsteps = 0
+    real(kind=8), dimension(n, 2) :: grid
+    real(kind=8), allocatable, dimension(:) :: state
+    real(kind=8), protected :: dt
+    real(kind=8), pointer :: p(:)
+    character(len=10) :: label
+    integer :: hidden
+end module sim
+'''
+    mod, = fp.generate_ast([fcode])
+    eq_(mod.kind, 'module')
+    eq_(mod.name, 'sim')
+    eq_([var.name for var in mod.variables()],
+        ['dt', 'grid', 'nsteps', 'state'])
+    dt, grid, nsteps, state = mod.variables()
+    ok_(not nsteps.is_array)
+    eq_(grid.dimension.attrspec, 'dimension(n, 2)')
+    ok_(state.allocatable and not grid.allocatable)
+    ok_(dt.protected and not nsteps.protected)
@@ -91,7 +91,7 @@ end function empty_func
         header = '''\
         from fwrap_ktp cimport *
 
-        cdef extern from "test_fc.h":
+        cdef extern from "test_fc.h" nogil:
             void empty_func_c(fwi_integer_t *, fwi_integer_t *, fw_character_t *)
         '''
         compare(header, buf.getvalue())
@@ -105,7 +105,10 @@ end function empty_func
         cimport numpy as np
         from test_fc cimport *
 
+        # The <proc>_nogil functions call the procedures without any Python objects;
+        # they return FW_NO_ERR__ or the error code of the wrapper.
         cpdef api object empty_func()
+        cdef int empty_func_nogil(fwi_integer_t *fw_ret_arg) nogil
         '''
         compare(pxd, buf.getvalue())
 
@@ -136,6 +139,10 @@ np.import_array()
 include 'fwrap_ktp.pxi'
 cdef extern from "string.h":
     void *memcpy(void *dest, void *src, size_t n)
+cdef extern from "Python.h":
+    object PyMemoryView_FromObject(object obj)
+    Py_buffer *PyMemoryView_GET_BUFFER(object mview)
+    bint PyBuffer_IsContiguous(Py_buffer *view, char fort)
 cpdef api object empty_func():
     """
     empty_func() -> fw_ret_arg
@@ -152,10 +159,16 @@ cpdef api object empty_func():
     cdef fwi_integer_t fw_ret_arg
     cdef fwi_integer_t fw_iserr__
     cdef fw_character_t fw_errstr__[fw_errstr_len]
-    empty_func_c(&fw_ret_arg, &fw_iserr__, fw_errstr__)
+    with nogil:
+        empty_func_c(&fw_ret_arg, &fw_iserr__, fw_errstr__)
     if fw_iserr__ != FW_NO_ERR__:
         raise RuntimeError("an error was encountered when calling the 'empty_func' wrapper.")
     return fw_ret_arg
+cdef int empty_func_nogil(fwi_integer_t *fw_ret_arg) nogil:
+    cdef fwi_integer_t fw_iserr__
+    cdef fw_character_t fw_errstr__[fw_errstr_len]
+    empty_func_c(fw_ret_arg, &fw_iserr__, fw_errstr__)
+    return fw_iserr__
 ''' % get_version()
         compare(test_str, buf.getvalue())
 
@@ -170,3 +183,54 @@ cpdef api object empty_func():
             ok_(isinstance(ctp, dict))
             eq_(sorted(ctp.keys()),
                     ['basetype', 'fwrap_name', 'lang', 'npy_enum', 'odecl'])
+
+def test_reproducible_output():
+    # wrap the same sources in two processes with different hash seeds; the
+    # generated files must be identical.
+    import sys
+    import shutil
+    from subprocess import Popen, PIPE
+    fsrc = '''\
+subroutine many_types(a, b, c, d, e, f)
+    implicit none
+    integer(kind=8), intent(in) :: a
+    real(kind=4), dimension(a), intent(inout) :: b
+    complex(kind=8), intent(out) :: c
+    logical(kind=4), intent(in) :: d
+    character(len=10), intent(inout) :: e
+    double precision, dimension(:,:), intent(in) :: f
+end subroutine many_types
+
+function other_types(a, b)
+    implicit none
+    integer(kind=2), intent(in) :: a
+    real(kind=8), dimension(a) :: b
+    logical(kind=1) :: other_types
+end function other_types
+'''
+    pkg_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+                                os.path.abspath(__file__))))
+    outdirs = []
+    try:
+        for seed in ('1', '4242'):
+            outdir = tempfile.mkdtemp()
+            outdirs.append(outdir)
+            src = os.path.join(outdir, 'source.f90')
+            fh = open(src, 'w')
+            fh.write(fsrc)
+            fh.close()
+            env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=pkg_dir)
+            pp = Popen([sys.executable, '-c',
+                        'from fwrap import fwrapper; '
+                        'fwrapper.wrap(%r, name="repro")' % src],
+                       cwd=outdir, env=env, stdout=PIPE, stderr=PIPE)
+            out, err = pp.communicate()
+            eq_(pp.returncode, 0, err)
+        names = sorted(os.listdir(outdirs[0]))
+        eq_(names, sorted(os.listdir(outdirs[1])))
+        for name in names:
+            contents = [open(os.path.join(d, name)).read() for d in outdirs]
+            eq_(contents[0], contents[1], name)
+    finally:
+        for outdir in outdirs:
+            shutil.rmtree(outdir)
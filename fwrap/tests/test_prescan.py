@@ -0,0 +1,135 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+from fwrap import prescan
+from fwrap import fwrap_parse as fp
+
+from nose.tools import ok_, eq_
+
+def _index(src, isfree=True):
+    return prescan.SourceIndex(src.splitlines(), isfree=isfree)
+
+def test_skip_units():
+    buf = '''\
+module mod1
+  implicit none
+  integer :: mvar
+contains
+  subroutine modsub(a)
+    integer :: a
+  end subroutine modsub
+end module mod1
+
+program main
+  integer :: i
+  i = 1
+  call subr1(i)
+end program main
+
+subroutine subr1(a)
+  implicit none
+  interface
+    subroutine cb(x)
+      real :: x
+    end subroutine
+  end interface
+  integer, intent(in) :: a
+  print *, a
+end subroutine subr1
+'''
+    index = _index(buf)
+    ok_(index.ok)
+    eq_([(e.kind, e.name) for e in index.toplevel()], [('subroutine', 'subr1')])
+    source = index.needed_source()
+    eq_(len(source.split('\n')), len(buf.splitlines()))
+    ok_('mvar' not in source)
+    ok_('program' not in source)
+    ok_('print' not in source)
+    ok_('end subroutine subr1' in source)
+    ast = fp.generate_ast([buf])
+    # the module is wrapped for its variables, not its procedures.
+    eq_([proc.name for proc in ast], ['mod1', 'subr1'])
+    eq_([var.name for var in ast[0].variables()], ['mvar'])
+
+def test_spec_end():
+    buf = '''\
+function func1(a, b)
+  implicit none
+  integer, intent(in) :: a
+  real, dimension(a) :: b
+  double precision :: func1
+  b(1) = a
+  func1 = 1
+contains
+  function internal(x)
+    integer :: x, internal
+    internal = x
+  end function internal
+end function func1
+'''
+    index = _index(buf)
+    func1, = index.toplevel()
+    eq_(func1.spec_end, 5)
+    eq_(func1.end, 12)
+    eq_(func1.prefix, '')
+    lines = index.needed_source().splitlines()
+    eq_(lines[5], 'end function func1')
+    ok_('internal' not in '\n'.join(lines))
+
+def test_prefix():
+    buf = '''\
+pure integer(kind=8) function func2(a) result(r)
+  integer(kind=8), intent(in) :: a
+  r = a
+end function
+elemental subroutine subr2(a)
+  real, intent(inout) :: a
+end
+'''
+    index = _index(buf)
+    eq_([(e.name, e.prefix) for e in index.toplevel()],
+        [('func2', 'pure integer(kind=8)'), ('subr2', 'elemental')])
+
+def test_fixed_form():
+    buf = '''\
+      SUBROUTINE DGEXX( JOBZ, M, N, A,
+     $                  LDA )
+*     .. Scalar Arguments ..
+      CHARACTER          JOBZ
+      INTEGER            LDA, M, N
+      DOUBLE PRECISION   A( LDA, * )
+      IF( M.EQ.0 ) RETURN
+      END
+'''
+    index = _index(buf, isfree=False)
+    ok_(index.ok)
+    subr, = index.toplevel()
+    eq_((subr.name, subr.spec_end, subr.end), ('dgexx', 6, 7))
+    subr = fp.generate_ast([buf])[0]
+    eq_([arg.name for arg in subr.args], ['jobz', 'm', 'n', 'a', 'lda'])
+
+def test_unbalanced():
+    buf = '''\
+subroutine subr3(a)
+  integer :: a
+  a = 1
+end function subr3
+'''
+    index = _index(buf)
+    ok_(not index.ok)
+    eq_(index.needed_source(), buf.rstrip('\n'))
+
+def test_semicolon_spec_end():
+    buf = '''\
+subroutine subr4(n, x)
+  integer :: n; real :: x; x = n
+end subroutine subr4
+'''
+    index = _index(buf)
+    # the first executable statement shares its line with declarations.
+    ok_(not index.ok)
+    eq_(index.needed_source(), buf.rstrip('\n'))
+    subr = fp.generate_ast([buf])[0]
+    eq_([arg.name for arg in subr.args], ['n', 'x'])
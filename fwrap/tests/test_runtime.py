@@ -0,0 +1,153 @@
+#------------------------------------------------------------------------------
+# Copyright (c) 2010, Kurt W. Smith
+# All rights reserved. See LICENSE.txt.
+#------------------------------------------------------------------------------
+
+import os
+import tempfile
+
+import numpy as np
+
+from fwrap import runtime
+
+from nose.tools import ok_, eq_, raises
+
+def axpy(alpha, x, y):
+    # stands in for a wrapped procedure with an intent(inout) array.
+    y += alpha * x
+    return y, y.sum()
+
+def fail(x):
+    raise ValueError("failed on %r" % x)
+
+class Recorder(object):
+    # stands in for a wrapped procedure: filter(a, scale, out, total) ->
+    # (out, total)
+
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, a, scale, out, total):
+        ok_(a.flags.f_contiguous)
+        self.shapes.append(a.shape)
+        out[...] = scale * a
+        total = total + a.sum(axis=-1)
+        return out, total
+
+
+class test_stream(object):
+
+    def setup(self):
+        self.a = np.arange(60.0).reshape(3, 20)
+        self.out = np.zeros((3, 20))
+        self.proc = Recorder()
+
+    def call(self, a, **kwargs):
+        return runtime.stream(self.proc, (a, 2.0, self.out, np.zeros(3)),
+                              chunked=[0], outputs={2: 0},
+                              accumulate={3: 1}, **kwargs)
+
+    def test_chunks(self):
+        out, total = self.call(self.a, chunk_len=7)
+        eq_(self.proc.shapes, [(3, 7), (3, 7), (3, 6)])
+        eq_(self.out.tolist(), (2 * self.a).tolist())
+        eq_(total.tolist(), self.a.sum(axis=1).tolist())
+
+    def test_no_prefetch(self):
+        out, total = self.call(self.a, chunk_len=3, prefetch=False)
+        eq_(len(self.proc.shapes), 7)
+        eq_(self.out.tolist(), (2 * self.a).tolist())
+        eq_(total.tolist(), self.a.sum(axis=1).tolist())
+
+    def test_chunk_bytes(self):
+        # 3 doubles per index for a and for out.
+        self.call(self.a, chunk_bytes=48*5)
+        eq_(self.proc.shapes, [(3, 5)]*4)
+
+    def test_memmap(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            mm = np.memmap(path, dtype=np.float64, mode='w+', shape=(3, 20))
+            mm[...] = self.a
+            out, total = self.call(mm, chunk_len=8)
+            eq_(total.tolist(), self.a.sum(axis=1).tolist())
+            eq_(self.out.tolist(), (2 * self.a).tolist())
+            del mm
+        finally:
+            os.remove(path)
+
+    def test_inout(self):
+        def double(a):
+            a *= 2
+            return a
+        a = self.a.copy()
+        runtime.stream(double, [a], [0], outputs={0: 0}, chunk_len=6)
+        eq_(a.tolist(), (2 * self.a).tolist())
+
+    def test_empty(self):
+        self.out = np.zeros((3, 0))
+        eq_(self.call(np.zeros((3, 0))), None)
+        eq_(self.proc.shapes, [])
+
+    @raises(ValueError)
+    def test_lengths(self):
+        self.call(np.zeros((3, 10)))
+
+    @raises(ValueError)
+    def test_nothing_chunked(self):
+        runtime.stream(self.proc, (self.a, 2.0, self.out, np.zeros(3)), [])
+
+
+class test_process_pool(object):
+
+    def setup(self):
+        self.pool = runtime.ProcessPool(2)
+
+    def teardown(self):
+        self.pool.terminate()
+
+    def test_shared(self):
+        x = runtime.shared_array((4, 5))
+        y = runtime.shared_array((4, 5))
+        x[...] = np.arange(20.0).reshape(4, 5)
+        y[...] = 1
+        res, total = self.pool.apply(axpy, (2.0, x, y))
+        # computed in place, and returned without a copy.
+        ok_(res is y)
+        eq_(y.tolist(), (2 * x + 1).tolist())
+        eq_(total, y.sum())
+
+    def test_views(self):
+        y = runtime.shared_array(10)
+        y[...] = 0
+        res, total = self.pool.apply(axpy, (1.0, np.ones(5), y[::2]))
+        ok_(np.shares_memory(res, y))
+        eq_(y.tolist(), [1, 0]*5)
+
+    def test_copied(self):
+        # other arrays are copied, in place results show in the result only.
+        y = np.zeros(3)
+        res, total = self.pool.apply(axpy, (1.0, np.arange(1.0, 4.0), y))
+        eq_(res.tolist(), [1, 2, 3])
+        eq_(y.tolist(), [0, 0, 0])
+        ok_(runtime._segment_of(res) is not None)
+
+    def test_map(self):
+        ys = [runtime.shared_array(3) for i in range(5)]
+        for i, y in enumerate(ys):
+            y[...] = i
+        results = self.pool.map(axpy, [(1.0, np.ones(3), y) for y in ys])
+        eq_([total for res, total in results], [3*(i+1) for i in range(5)])
+        ok_(all([res is y for (res, total), y in zip(results, ys)]))
+
+    def test_cleanup(self):
+        y = runtime.shared_array(3)
+        path = runtime._segment_of(y).path
+        ok_(os.path.exists(path))
+        del y
+        ok_(not os.path.exists(path))
+
+    @raises(ValueError)
+    def test_error(self):
+        self.pool.apply(fail, (1,))
@@ -1,15 +1,17 @@
 #!/usr/bin/python
 
-import os, sys, re, shutil, unittest, doctest
+import os, sys, re, time, shutil, unittest, doctest
 
 WITH_CYTHON = True
 
 TEST_DIRS = ['compile', 'errors', 'run', 'pyregr']
 TEST_RUN_DIRS = ['run', 'pyregr']
 
+fwrap_options_re = re.compile(r'^!\s*fwrap-options:(.*)$').match
+
 class FwrapTestBuilder(object):
     def __init__(self, rootdir, workdir, selectors, exclude_selectors,
-            cleanup_workdir, cleanup_sharedlibs, verbosity=0):
+            cleanup_workdir, cleanup_sharedlibs, verbosity=0, toolchain=None):
         self.rootdir = rootdir
         self.workdir = workdir
         self.selectors = selectors
@@ -17,6 +19,7 @@ class FwrapTestBuilder(object):
         self.cleanup_workdir = cleanup_workdir
         self.cleanup_sharedlibs = cleanup_sharedlibs
         self.verbosity = verbosity
+        self.toolchain = toolchain
 
     def build_suite(self):
         suite = unittest.TestSuite()
@@ -53,14 +56,18 @@ class FwrapTestBuilder(object):
                 test_class = FwrapRunTestCase
             else:
                 test_class = FwrapCompileTestCase
-            suite.addTest(self.build_test(test_class, path, workdir, filename))
+            # every test gets its own work directory so that tests can run
+            # concurrently and clean up after themselves.
+            suite.addTest(self.build_test(test_class, path,
+                            os.path.join(workdir, basename), filename))
         return suite
 
     def build_test(self, test_class, path, workdir, filename):
         return test_class(path, workdir, filename,
                 cleanup_workdir=self.cleanup_workdir,
                 cleanup_sharedlibs=self.cleanup_sharedlibs,
-                verbosity=self.verbosity)
+                verbosity=self.verbosity,
+                toolchain=self.toolchain)
 
 class _devnull(object):
 
@@ -73,19 +80,22 @@ class _devnull(object):
 class FwrapCompileTestCase(unittest.TestCase):
     def __init__(self, directory, workdir, filename,
             cleanup_workdir=True, cleanup_sharedlibs=True,
-            verbosity=0):
+            verbosity=0, toolchain=None):
         self.directory = directory
         self.workdir = workdir
         self.filename = filename
         self.cleanup_workdir = cleanup_workdir
         self.cleanup_sharedlibs = cleanup_sharedlibs
         self.verbosity = verbosity
+        self.toolchain = toolchain
         unittest.TestCase.__init__(self)
 
     def shortDescription(self):
         return "wrapping %s" % self.filename
 
     def setUp(self):
+        if not os.path.exists(self.workdir):
+            os.makedirs(self.workdir)
         if self.workdir not in sys.path:
             sys.path.insert(0, self.workdir)
 
@@ -106,7 +116,7 @@ class FwrapCompileTestCase(unittest.TestCase):
                     except IOError:
                         pass
         else:
-            os.makedirs(self.workdirs)
+            os.makedirs(self.workdir)
 
     def runTest(self):
         # fwrapc.py configure build fsrc...
@@ -118,8 +128,26 @@ class FwrapCompileTestCase(unittest.TestCase):
                 '--outdir=%s' % self.projdir,
                 fq_fname,
                 'install']
+        if self.toolchain:
+            argv.append('--toolchain=%s' % self.toolchain)
+        argv.extend(self.fwrap_options(fq_fname))
         fwrapc(argv=argv)
 
+    def fwrap_options(self, fname):
+        # wrapper options for a test are given in its leading comments:
+        #     ! fwrap-options: --strict-arrays
+        opts = []
+        for line in open(fname):
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith('!'):
+                break
+            match = fwrap_options_re(line)
+            if match:
+                opts.extend(match.group(1).split())
+        return opts
+
     def compile(self, directory, filename, workdir, incdir):
         self.run_wrapper(directory, filename, workdir, incdir)
 
@@ -136,16 +164,18 @@ class FwrapRunTestCase(FwrapCompileTestCase):
             result = self.defaultTestResult()
         result.startTest(self)
         try:
-            self.setUp()
-            self.runTest()
-            if self.projdir not in sys.path:
-                sys.path.insert(0, self.projdir)
-            doctest_mod_base = self.projname+'_doctest'
-            doctest_mod_fqpath = os.path.join(self.directory, doctest_mod_base+'.py')
-            shutil.copy(doctest_mod_fqpath, self.projdir)
-            doctest.DocTestSuite(self.projname+'_doctest').run(result) #??
-        except Exception:
-            result.addError(self, sys.exc_info())
+            try:
+                self.setUp()
+                self.runTest()
+                if self.projdir not in sys.path:
+                    sys.path.insert(0, self.projdir)
+                doctest_mod_base = self.projname+'_doctest'
+                doctest_mod_fqpath = os.path.join(self.directory, doctest_mod_base+'.py')
+                shutil.copy(doctest_mod_fqpath, self.projdir)
+                doctest.DocTestSuite(self.projname+'_doctest').run(result) #??
+            except Exception:
+                result.addError(self, sys.exc_info())
+        finally:
             result.stopTest(self)
         try:
             self.tearDown()
@@ -153,6 +183,276 @@ class FwrapRunTestCase(FwrapCompileTestCase):
             pass
 
 
+class TimingTestResult(unittest._TextTestResult):
+    """Text test result that records how long every test took.
+
+    Outcomes recorded in a worker process are merged with `add_record`; a
+    record without an outcome is a test that only reports its errors, like
+    the run tests whose doctests are reported on their own.
+    """
+
+    def __init__(self, *args, **kwargs):
+        unittest._TextTestResult.__init__(self, *args, **kwargs)
+        self.timings = []
+        self._start_times = {}
+
+    def startTest(self, test):
+        self._start_times[id(test)] = time.time()
+        unittest._TextTestResult.startTest(self, test)
+
+    def stopTest(self, test):
+        start = self._start_times.pop(id(test), None)
+        elapsed = getattr(test, 'elapsed', None)
+        if elapsed is None and start is not None:
+            elapsed = time.time() - start
+        if elapsed is not None:
+            self.timings.append((elapsed,
+                                 test.shortDescription() or str(test)))
+        unittest._TextTestResult.stopTest(self, test)
+
+    def _exc_info_to_string(self, err, test):
+        if isinstance(err[1], RemoteTraceback):
+            return str(err[1])
+        return unittest._TextTestResult._exc_info_to_string(self, err, test)
+
+    def add_record(self, record):
+        description, name, outcome, text, elapsed = record
+        test = RecordedTest(description, name, elapsed)
+        self.startTest(test)
+        err = (RemoteTraceback, RemoteTraceback(text), None)
+        if outcome == 'error':
+            self.addError(test, err)
+        elif outcome == 'failure':
+            self.addFailure(test, err)
+        elif outcome == 'skip':
+            self.addSkip(test, text)
+        elif outcome == 'expected_failure':
+            self.addExpectedFailure(test, err)
+        elif outcome == 'unexpected_success':
+            self.addUnexpectedSuccess(test)
+        elif outcome == 'success':
+            self.addSuccess(test)
+        self.stopTest(test)
+
+    def printTimings(self, count=None):
+        timings = sorted(self.timings, reverse=True)
+        if count is not None:
+            timings = timings[:count]
+        if not timings:
+            return
+        self.stream.writeln()
+        self.stream.writeln("Slowest tests:")
+        for elapsed, description in timings:
+            self.stream.writeln("%8.2fs  %s" % (elapsed, description))
+
+
+class TimingTextTestRunner(unittest.TextTestRunner):
+
+    resultclass = TimingTestResult
+
+    def run(self, test):
+        result = unittest.TextTestRunner.run(self, test)
+        result.printTimings(self.verbosity < 2 and 10 or None)
+        return result
+
+
+class RemoteTraceback(Exception):
+    """A traceback that was formatted in a worker process."""
+
+
+class RecordedTest(object):
+    """Stands in for a test that ran in a worker process."""
+
+    def __init__(self, description, name, elapsed):
+        self.description = description
+        self.name = name
+        self.elapsed = elapsed
+
+    def shortDescription(self):
+        return self.description
+
+    def __str__(self):
+        return self.name
+
+
+class RecordingTestResult(unittest.TestResult):
+    """Collects picklable records of the outcome of every test, in the order
+    the tests were started."""
+
+    def __init__(self):
+        unittest.TestResult.__init__(self)
+        self.records = []
+        self._pending = {}
+
+    def startTest(self, test):
+        unittest.TestResult.startTest(self, test)
+        record = [test.shortDescription() or str(test), str(test),
+                  None, None, time.time()]
+        self._pending[id(test)] = record
+        self.records.append(record)
+
+    def _outcome(self, test, outcome, text=None):
+        record = self._pending.get(id(test))
+        if record is not None:
+            record[2:4] = [outcome, text]
+
+    def addSuccess(self, test):
+        unittest.TestResult.addSuccess(self, test)
+        self._outcome(test, 'success')
+
+    def addError(self, test, err):
+        unittest.TestResult.addError(self, test, err)
+        self._outcome(test, 'error', self.errors[-1][1])
+
+    def addFailure(self, test, err):
+        unittest.TestResult.addFailure(self, test, err)
+        self._outcome(test, 'failure', self.failures[-1][1])
+
+    def addSkip(self, test, reason):
+        unittest.TestResult.addSkip(self, test, reason)
+        self._outcome(test, 'skip', reason)
+
+    def addExpectedFailure(self, test, err):
+        unittest.TestResult.addExpectedFailure(self, test, err)
+        self._outcome(test, 'expected_failure',
+                      self.expectedFailures[-1][1])
+
+    def addUnexpectedSuccess(self, test):
+        unittest.TestResult.addUnexpectedSuccess(self, test)
+        self._outcome(test, 'unexpected_success')
+
+    def stopTest(self, test):
+        unittest.TestResult.stopTest(self, test)
+        record = self._pending.pop(id(test), None)
+        if record is not None:
+            record[4] = time.time() - record[4]
+
+
+def run_test_in_worker(spec):
+    """Run one test in a worker process and return its records.
+
+    The output of the test (and of the compilers it runs) goes to a log
+    file next to the test's work directory.
+    """
+    test_class, args, kwargs = spec
+    test = globals()[test_class](*args, **kwargs)
+    result = RecordingTestResult()
+    log_name = test.workdir.rstrip(os.sep) + '.log'
+    log = open(log_name, 'w')
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    os.dup2(log.fileno(), 1)
+    os.dup2(log.fileno(), 2)
+    try:
+        try:
+            test.run(result)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+            log.close()
+    except KeyboardInterrupt:
+        return []
+    records = []
+    for description, name, outcome, text, elapsed in result.records:
+        if outcome in ('error', 'failure'):
+            text += "\nOutput of the test is in %s\n" % log_name
+        records.append((description, name, outcome, text, elapsed))
+    return records
+
+
+def iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for t in iter_tests(test):
+                yield t
+        else:
+            yield test
+
+
+def run_parallel(test_suite, processes, verbosity=0):
+    """Run the tests of test_suite in a pool of worker processes."""
+    from multiprocessing import Pool
+    specs = []
+    for test in iter_tests(test_suite):
+        specs.append((test.__class__.__name__,
+                      (test.directory, test.workdir, test.filename),
+                      dict(cleanup_workdir=test.cleanup_workdir,
+                           cleanup_sharedlibs=test.cleanup_sharedlibs,
+                           verbosity=test.verbosity,
+                           toolchain=test.toolchain)))
+
+    stream = unittest.runner._WritelnDecorator(sys.stderr)
+    result = TimingTestResult(stream, True, verbosity)
+    start = time.time()
+    pool = Pool(processes)
+    try:
+        for records in pool.imap_unordered(run_test_in_worker, specs, 1):
+            for record in records:
+                result.add_record(record)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    pool.join()
+    elapsed = time.time() - start
+
+    result.printErrors()
+    stream.writeln(result.separator2)
+    run = result.testsRun
+    stream.writeln("Ran %d test%s in %.3fs with %d processes" %
+                   (run, run != 1 and "s" or "", elapsed, processes))
+    stream.writeln()
+    if not result.wasSuccessful():
+        stream.write("FAILED (")
+        failed, errored = len(result.failures), len(result.errors)
+        if failed:
+            stream.write("failures=%d" % failed)
+        if errored:
+            if failed: stream.write(", ")
+            stream.write("errors=%d" % errored)
+        stream.writeln(")")
+    else:
+        stream.writeln("OK")
+    result.printTimings(verbosity < 2 and 10 or None)
+    return result
+
+
+def configure_toolchain(supportdir, reconfigure=False):
+    """Detect the compilers, Python, numpy and Cython once for the session.
+
+    The settings and the kind type map are cached in a toolchain directory
+    under supportdir that every test project is configured with, so it
+    survives between runs unless reconfigure is set.  Returns the toolchain
+    directory, or None if the toolchain can't be configured.
+    """
+    from subprocess import CalledProcessError
+    toolchain = os.path.join(supportdir, 'toolchain')
+    projdir = os.path.join(supportdir, 'toolchain_proj')
+    if reconfigure:
+        shutil.rmtree(toolchain, ignore_errors=True)
+    if not os.path.exists(supportdir):
+        os.makedirs(supportdir)
+    argv = ['configure',
+            '--name=toolchain',
+            '--outdir=%s' % projdir,
+            '--toolchain=%s' % toolchain]
+    start = time.time()
+    try:
+        fwrapc(argv=argv)
+    except (CalledProcessError, EnvironmentError), e:
+        sys.stderr.write("unable to configure a shared toolchain (%s); "
+                         "every test configures its own.\n" % e)
+        return None
+    sys.stderr.write("toolchain configured in %.2fs\n\n" %
+                     (time.time() - start))
+    return toolchain
+
+
 class FileListExcluder:
 
     def __init__(self, list_file):
@@ -184,6 +484,12 @@ if __name__ == '__main__':
     parser.add_option("-T", "--ticket", dest="tickets",
                       action="append",
                       help="a bug ticket number to run the respective test in 'tests/bugs'")
+    parser.add_option("--reconfigure", dest="reconfigure",
+                      action="store_true", default=False,
+                      help="detect the toolchain again instead of reusing the one cached in BUILD/support")
+    parser.add_option("-j", "--jobs", dest="jobs",
+                      action="store", type="int", default=1, metavar="N",
+                      help="run the tests in N worker processes")
 
     options, cmd_args = parser.parse_args()
 
@@ -234,8 +540,15 @@ if __name__ == '__main__':
 
     test_suite = unittest.TestSuite()
 
+    toolchain = configure_toolchain(os.path.join(WORKDIR, 'support'),
+                                    options.reconfigure)
+
     filetests = FwrapTestBuilder(ROOTDIR, WORKDIR, selectors, exclude_selectors,
-            options.cleanup_workdir, options.cleanup_sharedlibs, options.verbosity)
+            options.cleanup_workdir, options.cleanup_sharedlibs, options.verbosity,
+            toolchain)
     test_suite.addTest(filetests.build_suite())
 
-    unittest.TextTestRunner(verbosity=options.verbosity).run(test_suite)
+    if options.jobs > 1:
+        run_parallel(test_suite, options.jobs, options.verbosity)
+    else:
+        TimingTextTestRunner(verbosity=options.verbosity).run(test_suite)
@@ -0,0 +1,29 @@
+! fwrap-options: --batched
+
+        subroutine axpy(n, alpha, x, y, ysum)
+            implicit none
+            integer, intent(in) :: n
+            real(kind=8), intent(in) :: alpha
+            real(kind=8), dimension(n), intent(in) :: x
+            real(kind=8), dimension(n), intent(inout) :: y
+            real(kind=8), intent(out) :: ysum
+
+            y = alpha * x + y
+            ysum = sum(y)
+
+        end subroutine axpy
+
+        function trace(a, ncalls)
+            implicit none
+            real(kind=8), dimension(:, :), intent(in) :: a
+            integer, intent(inout) :: ncalls
+            real(kind=8) :: trace
+            integer :: i
+
+            trace = 0
+            do i = 1, min(size(a, 1), size(a, 2))
+                trace = trace + a(i, i)
+            enddo
+            ncalls = ncalls + 1
+
+        end function trace
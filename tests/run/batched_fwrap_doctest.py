@@ -0,0 +1,45 @@
+import numpy as np
+from batched_fwrap import *
+
+__doc__ = u'''
+The batch axis comes last; scalars are given once or per batch.
+
+>>> x = np.asfortranarray(np.arange(6.).reshape(2, 3))
+>>> y = np.zeros((2, 3), order='F')
+>>> y, ysum = axpy_batched(2, [1., 2., 3.], x, y)
+>>> y.tolist()
+[[0.0, 2.0, 6.0], [3.0, 8.0, 15.0]]
+>>> ysum.tolist()
+[3.0, 10.0, 21.0]
+>>> axpy_batched(2, 1., x, y)[1].tolist()
+[6.0, 15.0, 28.0]
+
+The results match calling the procedure on every slice.
+
+>>> a = np.asfortranarray(np.random.rand(3, 3, 5))
+>>> tr, ncalls = trace_batched(a, 0)
+>>> np.allclose(tr, [trace(a[:, :, i], 0)[0] for i in range(5)])
+True
+>>> ncalls.tolist()
+[1, 1, 1, 1, 1]
+>>> trace_batched(a, np.arange(5))[1].tolist()
+[1, 2, 3, 4, 5]
+
+Inconsistent batch sizes are an error.
+
+>>> axpy_batched(2, 1., x, np.zeros((2, 4), order='F'))
+Traceback (most recent call last):
+    ...
+ValueError: argument 'y' has 4 batches, expected 3
+>>> axpy_batched(2, [1., 2.], x, y)
+Traceback (most recent call last):
+    ...
+ValueError: argument 'x' has 3 batches, expected 2
+
+Errors raised by the wrapper name the batch.
+
+>>> axpy_batched([2, 2, 3], 1., x, y)
+Traceback (most recent call last):
+    ...
+RuntimeError: an error was encountered when calling the 'axpy' wrapper (batch 2).
+'''
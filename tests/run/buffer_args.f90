@@ -0,0 +1,24 @@
+! fwrap-options: --array-args=buffer
+
+        subroutine scale(n, alpha, a, b)
+            implicit none
+            integer, intent(in) :: n
+            real(kind=8), intent(in) :: alpha
+            real(kind=8), dimension(n, n), intent(in) :: a
+            real(kind=8), dimension(n, n), intent(inout) :: b
+
+            b = alpha * a + b
+
+        end subroutine scale
+
+        subroutine iota(n, x)
+            implicit none
+            integer, intent(in) :: n
+            integer, dimension(n), intent(inout) :: x
+            integer :: i
+
+            do i = 1, n
+                x(i) = x(i) + i
+            enddo
+
+        end subroutine iota
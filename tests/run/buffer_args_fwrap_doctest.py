@@ -0,0 +1,59 @@
+import ctypes
+import numpy as np
+from buffer_args_fwrap import *
+
+N = 2
+a = np.asfortranarray(np.arange(4.).reshape(N, N))
+
+__doc__ = u'''
+Fortran contiguous buffers of the right type are used as they are; the
+inout argument is returned as the object that was passed.
+
+>>> b = np.zeros((N, N), order='F')
+>>> scale(N, 2., a, b) is b
+True
+>>> b.tolist()
+[[0.0, 2.0], [4.0, 6.0]]
+
+Any object with a PEP 3118 buffer of the right format works, read-only ones
+for intent in arguments.
+
+>>> mv = memoryview(b)
+>>> scale(N, 1., a, mv) is mv
+True
+>>> b.tolist()
+[[0.0, 3.0], [6.0, 9.0]]
+>>> ro = a.copy(order='F')
+>>> ro.flags.writeable = False
+>>> scale(N, 1., ro, b).tolist()
+[[0.0, 4.0], [8.0, 12.0]]
+>>> x = (ctypes.c_int * 3)(10, 20, 30)
+>>> iota(3, x) is x
+True
+>>> list(x)
+[11, 22, 33]
+
+Read-only buffers aren't written to.
+
+>>> scale(N, 1., a, ro)
+Traceback (most recent call last):
+    ...
+ValueError: buffer source array is read-only
+
+Anything else is converted to a new array, e.g. buffers of another type.
+
+>>> y = (ctypes.c_short * 3)(10, 20, 30)
+>>> z = iota(3, y)
+>>> type(z) is np.ndarray, z.tolist(), list(y)
+(True, [11, 22, 33], [10, 20, 30])
+>>> c = scale(N, 1., a.tolist(), [[0, 0], [0, 0]])
+>>> type(c) is np.ndarray, c.tolist()
+(True, [[0.0, 1.0], [2.0, 3.0]])
+>>> scale(N, 1., np.ascontiguousarray(a), np.zeros((N, N))).tolist()
+[[0.0, 1.0], [2.0, 3.0]]
+
+Empty arrays are fine.
+
+>>> scale(0, 1., np.zeros((0, 0)), np.zeros((0, 0))).shape
+(0, 0)
+'''
@@ -0,0 +1,34 @@
+! fwrap-options: --c-order=scale2,outer.c
+      subroutine scale2(a, alpha)
+        implicit none
+        real(kind=8), dimension(:,:), intent(inout) :: a
+        real(kind=8), intent(in) :: alpha
+
+        a = alpha * a
+
+      end subroutine scale2
+
+      subroutine outer(x, y, c)
+        implicit none
+        real(kind=8), dimension(:), intent(in) :: x, y
+        real(kind=8), dimension(size(x), size(y)), intent(out) :: c
+        integer :: i, j
+
+        do j = 1, size(y)
+          do i = 1, size(x)
+            c(i, j) = x(i) * y(j)
+          enddo
+        enddo
+
+      end subroutine outer
+
+      subroutine fill_rows(a)
+        implicit none
+        integer, dimension(:,:), intent(inout) :: a
+        integer :: i
+
+        do i = 1, size(a, 1)
+          a(i, :) = i
+        enddo
+
+      end subroutine fill_rows
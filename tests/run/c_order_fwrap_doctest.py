@@ -0,0 +1,35 @@
+from c_order_fwrap import *
+import numpy as np
+
+__doc__ = u'''
+C contiguous arrays are passed as their transpose, without a copy, and
+the results come back in the caller's order.
+
+>>> a = np.arange(6.0).reshape(2, 3)
+>>> res = scale2(a, 2.0)
+>>> np.shares_memory(res, a), res.shape
+(True, (2, 3))
+>>> a.tolist()
+[[0.0, 2.0, 4.0], [6.0, 8.0, 10.0]]
+>>> f = np.asfortranarray(a)
+>>> scale2(f, 0.5) is f
+True
+>>> scale2([[1.0, 2.0]], 3.0).tolist()
+[[3.0, 6.0]]
+
+Only c is passed in C order here, so Fortran sees its extents reversed.
+
+>>> c = np.zeros((3, 2))
+>>> np.shares_memory(outer(np.array([1.0, 2.0]), np.array([1.0, 10.0, 100.0]), c), c)
+True
+>>> c.tolist()
+[[1.0, 2.0], [10.0, 20.0], [100.0, 200.0]]
+>>> c = outer(np.array([1.0, 2.0]), np.array([1.0, 10.0, 100.0]), np.zeros((2, 3), order='F'))
+>>> c.tolist()
+[[1.0, 10.0, 100.0], [2.0, 20.0, 200.0]]
+
+Procedures that aren't listed are unchanged.
+
+>>> fill_rows(np.zeros((2, 3), dtype=np.int32)).tolist()
+[[1, 1, 1], [2, 2, 2]]
+'''
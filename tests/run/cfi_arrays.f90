@@ -0,0 +1,32 @@
+! fwrap-options: --assumed-shape-cfi
+      subroutine add_index(a)
+        implicit none
+        real(kind=8), dimension(:,:), intent(inout) :: a
+        integer :: i, j
+
+        do j = 1, size(a, 2)
+          do i = 1, size(a, 1)
+            a(i, j) = a(i, j) + 10*i + j
+          enddo
+        enddo
+
+      end subroutine add_index
+
+      subroutine col_sums(a, s, n)
+        implicit none
+        integer, intent(in) :: n
+        integer, dimension(:,:), intent(in) :: a
+        integer, dimension(n), intent(out) :: s
+
+        s = sum(a, dim=1)
+
+      end subroutine col_sums
+
+      function total(v)
+        implicit none
+        real, dimension(:), intent(in) :: v
+        real :: total
+
+        total = sum(v)
+
+      end function total
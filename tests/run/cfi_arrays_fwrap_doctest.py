@@ -0,0 +1,44 @@
+from cfi_arrays_fwrap import *
+import numpy as np
+
+__doc__ = u'''
+Strided, offset and transposed views are passed as they are.
+
+>>> a = np.zeros((4, 6))
+>>> view = a[::2, 1::2]
+>>> add_index(view) is view
+True
+>>> a.tolist()
+[[0.0, 11.0, 0.0, 12.0, 0.0, 13.0], [0.0, 0.0, 0.0, 0.0, 0.0, 0.0], [0.0, 21.0, 0.0, 22.0, 0.0, 23.0], [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]]
+>>> b = np.zeros((2, 3))
+>>> add_index(b.T) is not None
+True
+>>> b.tolist()
+[[11.0, 21.0, 31.0], [12.0, 22.0, 32.0]]
+>>> c = np.zeros((3, 3))
+>>> add_index(c[::-1, ::-1]) is not None
+True
+>>> c.tolist()
+[[33.0, 32.0, 31.0], [23.0, 22.0, 21.0], [13.0, 12.0, 11.0]]
+
+>>> m = np.arange(12, dtype=np.int32).reshape(3, 4)
+>>> col_sums(m, np.zeros(4, dtype=np.int32), 4).tolist()
+[12, 15, 18, 21]
+>>> col_sums(m.T, np.zeros(3, dtype=np.int32), 3).tolist()
+[6, 22, 38]
+>>> col_sums(m[:, ::2], np.zeros(2, dtype=np.int32), 2).tolist()
+[12, 18]
+
+>>> v = np.arange(10, dtype=np.float32)
+>>> total(v[::3])
+18.0
+>>> total(v[9:0:-2])
+25.0
+>>> total(np.zeros(0, dtype=np.float32))
+0.0
+
+Arrays of another type are still converted.
+
+>>> total([1, 2, 3])
+6.0
+'''
@@ -11,6 +11,12 @@ True
 True
 >>> np.all(char_star(charr) == np.array([['123', '123', '123'], ['123', '123', '123']], dtype='|S3'))
 True
+>>> charr.dtype, charr.shape
+(dtype('S3'), (2, 3))
+>>> char_array(charr) is charr
+True
+>>> char_array(np.array([['x', 'y']], dtype='S3')).tolist()
+[['abc', 'abc']]
 '''
 
 # FIXME:
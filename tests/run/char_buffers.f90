@@ -0,0 +1,32 @@
+! fwrap-options: --char-out-buffers
+      subroutine copy_rec(rec_in, rec_out)
+        implicit none
+        character(len=8), intent(in) :: rec_in
+        character(len=8), intent(out) :: rec_out
+
+        rec_out = rec_in
+
+      end subroutine copy_rec
+
+      subroutine upcase(rec)
+        implicit none
+        character(*), intent(inout) :: rec
+        integer :: i, ich
+
+        do i = 1, len(rec)
+          ich = ichar(rec(i:i))
+          if (ich >= ichar('a') .and. ich <= ichar('z')) then
+            rec(i:i) = char(ich - 32)
+          endif
+        enddo
+
+      end subroutine upcase
+
+      subroutine fill(rec, ch)
+        implicit none
+        character(*), intent(out) :: rec
+        character, intent(in) :: ch
+
+        rec = repeat(ch, len(rec))
+
+      end subroutine fill
@@ -0,0 +1,55 @@
+from char_buffers_fwrap import *
+import numpy as np
+
+__doc__ = u'''
+>>> copy_rec('abcdefgh', None)
+'abcdefgh'
+>>> copy_rec(bytearray('abcdefgh'), None)
+'abcdefgh'
+>>> out = bytearray(8)
+>>> copy_rec(memoryview('12345678'), out) is out
+True
+>>> out
+bytearray(b'12345678')
+>>> copy_rec(np.array(['abcdefgh']), out) is out
+True
+>>> out
+bytearray(b'abcdefgh')
+>>> copy_rec('abc', out)
+Traceback (most recent call last):
+    ...
+RuntimeError: an error was encountered when calling the 'copy_rec' wrapper.
+>>> copy_rec('abcdefgh', memoryview('12345678'))
+Traceback (most recent call last):
+    ...
+ValueError: argument 'rec_out' is read-only, but the procedure may write to it
+>>> copy_rec(8, None)
+Traceback (most recent call last):
+    ...
+TypeError: argument 'rec_in' must be bytes or support the buffer protocol, not int
+
+>>> upcase('record 1')
+'RECORD 1'
+>>> rec = bytearray('record 2')
+>>> upcase(rec) is rec
+True
+>>> rec
+bytearray(b'RECORD 2')
+>>> recs = np.array(['one', 'two'], dtype='S3')
+>>> upcase(recs[1:]).tolist()
+['TWO']
+>>> recs.tolist()
+['one', 'TWO']
+>>> upcase(np.arange(10)[::2])
+Traceback (most recent call last):
+    ...
+ValueError: argument 'rec' is not contiguous
+
+>>> fill('....', '*')
+'****'
+>>> rec = bytearray(3)
+>>> fill(rec, bytearray('-')) is rec
+True
+>>> rec
+bytearray(b'---')
+'''
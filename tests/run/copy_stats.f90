@@ -0,0 +1,11 @@
+! fwrap-options: --copy-stats
+
+        subroutine scale_arrays(n, a, b)
+            implicit none
+            integer, intent(in) :: n
+            real(kind=8), dimension(n, n), intent(inout) :: a
+            integer, dimension(n), intent(in) :: b
+
+            a = a * 2
+
+        end subroutine scale_arrays
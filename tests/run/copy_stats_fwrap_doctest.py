@@ -0,0 +1,27 @@
+import numpy as np
+from copy_stats_fwrap import *
+
+N = 4
+b = np.ones(N, dtype=np.int32)
+
+__doc__ = u'''
+Arrays passed through as they are aren't counted.
+
+>>> fwrap_reset_copy_stats()
+>>> a = scale_arrays(N, np.ones((N, N), order='F'), b)
+>>> fwrap_copy_stats()
+{}
+
+A C-ordered array and a list are copied.
+
+>>> a = scale_arrays(N, np.ones((N, N)), [1]*N)
+>>> a = scale_arrays(N, np.ones((N, N)), b)
+>>> stats = fwrap_copy_stats()['scale_arrays']
+>>> stats['count'], stats['nbytes']
+(3, 272)
+>>> sorted(stats['args'].items())
+[('a', (2, 256)), ('b', (1, 16))]
+>>> fwrap_reset_copy_stats()
+>>> fwrap_copy_stats()
+{}
+'''
@@ -0,0 +1,12 @@
+! fwrap-options: --array-args=memoryview
+
+        subroutine scale(n, alpha, a, b)
+            implicit none
+            integer, intent(in) :: n
+            real(kind=8), intent(in) :: alpha
+            real(kind=8), dimension(n, n), intent(in) :: a
+            real(kind=8), dimension(n, n), intent(inout) :: b
+
+            b = alpha * a + b
+
+        end subroutine scale
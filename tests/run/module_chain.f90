@@ -0,0 +1,23 @@
+! The wrapper uses every module below, so under waf it must compile after
+! all of them.
+module chain_base
+    implicit none
+    integer :: ncalls = 0
+    real(kind=8), dimension(3) :: weights = (/ 1d0, 2d0, 3d0 /)
+end module chain_base
+
+module chain_top
+    use chain_base
+    implicit none
+    real(kind=8) :: scale = 2d0
+    real(kind=8), allocatable, dimension(:) :: result
+end module chain_top
+
+subroutine weigh(x)
+    use chain_top
+    implicit none
+    real(kind=8), dimension(3), intent(in) :: x
+    if (.not. allocated(result)) allocate(result(3))
+    result = scale * weights * x
+    ncalls = ncalls + 1
+end subroutine weigh
@@ -0,0 +1,16 @@
+import numpy as np
+from module_chain_fwrap import *
+
+__doc__ = u'''
+Each module is wrapped on its own; chain_top doesn't repeat the variables
+it uses from chain_base.
+
+>>> sorted(name for name in dir(chain_top) if not name.startswith('_'))
+['result', 'scale']
+>>> chain_top.result is None
+True
+>>> chain_base.weights[2] = 4.
+>>> weigh(np.ones(3))
+>>> chain_top.result.tolist(), chain_base.ncalls
+([2.0, 4.0, 8.0], 1)
+'''
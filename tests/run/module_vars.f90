@@ -0,0 +1,58 @@
+module sim_state
+    implicit none
+    integer :: nsteps = 0
+    real(kind=8) :: dt = 0.5d0
+    logical :: running = .false.
+    real(kind=8), dimension(3, 2) :: grid = 0
+    real(kind=8), allocatable, dimension(:) :: state
+    integer, allocatable, dimension(:, :) :: cells
+    ! only changed by the module's own procedures.
+    real(kind=8), protected :: total = 0
+    integer, dimension(2), protected :: counts = 0
+    ! not wrapped: pointers, characters and private variables.
+    real(kind=8), pointer :: ptr(:) => null()
+    character(len=8) :: label = 'sim'
+    integer, private :: secret = 42
+contains
+
+    subroutine add_total(x)
+        real(kind=8), intent(in) :: x
+        total = total + x
+        counts(1) = counts(1) + 1
+    end subroutine add_total
+end module sim_state
+
+subroutine accumulate(x)
+    use sim_state
+    implicit none
+    real(kind=8), intent(in) :: x
+    call add_total(x)
+end subroutine accumulate
+
+subroutine init_state(n)
+    use sim_state
+    implicit none
+    integer, intent(in) :: n
+    integer :: i
+    if (allocated(state)) deallocate(state)
+    allocate(state(n))
+    state = (/ (real(i, 8), i = 1, n) /)
+    if (.not. allocated(cells)) allocate(cells(2, n))
+    cells = 0
+    running = .true.
+end subroutine init_state
+
+subroutine step()
+    use sim_state
+    implicit none
+    state = state + dt
+    grid(:, 1) = grid(:, 1) + 1
+    nsteps = nsteps + 1
+end subroutine step
+
+subroutine free_state()
+    use sim_state
+    implicit none
+    deallocate(state, cells)
+    running = .false.
+end subroutine free_state
@@ -0,0 +1,84 @@
+import numpy as np
+from module_vars_fwrap import *
+
+__doc__ = u'''
+The module is wrapped as an object with its variables as properties.
+
+>>> sorted(name for name in dir(sim_state) if not name.startswith('_'))
+['cells', 'counts', 'dt', 'grid', 'nsteps', 'running', 'state', 'total']
+
+Scalars read and write the Fortran variables.
+
+>>> sim_state.nsteps, sim_state.dt, sim_state.running
+(0, 0.5, 0)
+>>> sim_state.dt = 0.25
+
+Allocatable arrays are None until allocated.
+
+>>> sim_state.state is None
+True
+>>> init_state(4)
+>>> sim_state.running
+1
+
+Arrays view the Fortran storage: changes show on both sides without copies.
+
+>>> state = sim_state.state
+>>> state.tolist()
+[1.0, 2.0, 3.0, 4.0]
+>>> state.flags.owndata, state.flags.f_contiguous
+(False, True)
+>>> state[0] = 10.
+>>> step()
+>>> state.tolist(), sim_state.nsteps
+([10.25, 2.25, 3.25, 4.25], 1)
+>>> sim_state.state is state
+True
+>>> grid = sim_state.grid
+>>> grid.shape, grid[:, 0].tolist()
+((3, 2), [1.0, 1.0, 1.0])
+>>> sim_state.grid = np.arange(6.).reshape(3, 2)
+>>> grid.tolist()
+[[0.0, 1.0], [2.0, 3.0], [4.0, 5.0]]
+>>> sim_state.cells.shape, sim_state.cells.dtype == np.dtype(np.intc)
+((2, 4), True)
+
+The view is made again after a reallocation.
+
+>>> init_state(6)
+>>> sim_state.state.tolist()
+[1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+>>> sim_state.state = 0
+>>> step()
+>>> sim_state.state.tolist()
+[0.25, 0.25, 0.25, 0.25, 0.25, 0.25]
+
+Protected variables are read-only: scalars can't be set and array views
+can't be written to.
+
+>>> accumulate(1.5)
+>>> sim_state.total, sim_state.counts.tolist()
+(1.5, [1, 0])
+>>> sim_state.total = 5.0
+Traceback (most recent call last):
+    ...
+AttributeError: attribute 'total' of 'module_vars_fwrap.fw_module_sim_state' objects is not writable
+>>> sim_state.counts = 0
+Traceback (most recent call last):
+    ...
+AttributeError: attribute 'counts' of 'module_vars_fwrap.fw_module_sim_state' objects is not writable
+>>> sim_state.counts[0] = 7
+Traceback (most recent call last):
+    ...
+ValueError: assignment destination is read-only
+>>> sim_state.total, sim_state.counts.tolist()
+(1.5, [1, 0])
+
+>>> free_state()
+>>> sim_state.state is None, sim_state.cells is None
+(True, True)
+>>> sim_state.state = 1.0
+Traceback (most recent call last):
+    ...
+ValueError: module array sim_state.state is not allocated
+'''
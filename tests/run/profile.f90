@@ -0,0 +1,16 @@
+! fwrap-options: --profile --batched --ufuncs
+
+        subroutine scale(n, alpha, a, b)
+            implicit none
+            integer, intent(in) :: n
+            real(kind=8), intent(in) :: alpha
+            real(kind=8), dimension(n, n), intent(in) :: a
+            real(kind=8), dimension(n, n), intent(inout) :: b
+            b = alpha * a + b
+        end subroutine scale
+
+        elemental function twice(x)
+            real(kind=8), intent(in) :: x
+            real(kind=8) :: twice
+            twice = 2 * x
+        end function twice
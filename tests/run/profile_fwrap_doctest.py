@@ -0,0 +1,48 @@
+import numpy as np
+from profile_fwrap import *
+
+a = np.ones((2, 2), order='F')
+b = np.zeros((2, 2), order='F')
+
+__doc__ = u'''
+Every call is counted, with the bytes of its array arguments.
+
+>>> fwrap_profile()
+{}
+>>> for i in range(3):
+...     b = scale(2, 1., a, b)
+>>> stats = fwrap_profile()
+>>> sorted(stats)
+['scale']
+>>> prof = stats['scale']
+>>> prof['count'], prof['nbytes']
+(3, 192)
+>>> sorted(prof)
+['count', 'fortran', 'marshal', 'max', 'nbytes', 'total']
+>>> 0 <= prof['fortran'] <= prof['total'], 0 < prof['max'] <= prof['total']
+(True, True)
+>>> abs(prof['fortran'] + prof['marshal'] - prof['total']) < 1e-12
+True
+
+Batched wrappers are counted on their own, with their scalar arguments
+given as arrays; ufuncs aren't counted.
+
+>>> b3 = scale_batched(2, 1., np.ones((2, 2, 4)), np.zeros((2, 2, 4)))
+>>> _ = twice_ufunc(np.arange(3.))
+>>> sorted(fwrap_profile())
+['scale', 'scale_batched']
+>>> fwrap_profile()['scale_batched']['nbytes']
+268
+
+Calls that fail aren't counted.
+
+>>> scale(2, 1., a, np.zeros(3))
+Traceback (most recent call last):
+    ...
+ValueError: object of too small depth for desired array
+>>> fwrap_profile()['scale']['count']
+3
+>>> fwrap_reset_profile()
+>>> fwrap_profile()
+{}
+'''
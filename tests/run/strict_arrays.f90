@@ -0,0 +1,13 @@
+! fwrap-options: --strict-arrays
+
+        subroutine strict_intents(n, a1, a2, a3)
+            implicit none
+            integer, intent(in) :: n
+            real(kind=8), dimension(n, n), intent(in) :: a1
+            real(kind=8), dimension(n, n), intent(inout) :: a2
+            integer, dimension(n), intent(out) :: a3
+
+            a2 = a2 + a1
+            a3 = n
+
+        end subroutine strict_intents
@@ -0,0 +1,46 @@
+import numpy as np
+from strict_arrays_fwrap import *
+
+N = 3
+a1 = np.ones((N, N), dtype=np.float64, order='F')
+a3 = np.zeros(N, dtype=np.int32)
+
+__doc__ = u'''
+Arrays that can be passed through are used as they are; intent(inout) arrays
+are updated in place.
+
+>>> a2 = np.zeros((N, N), dtype=np.float64, order='F')
+>>> b2, b3 = strict_intents(N, a1, a2, a3)
+>>> b2 is a2 and b3 is a3
+True
+>>> np.all(a2 == 1.0) and np.all(a3 == N)
+True
+
+Everything else is refused.
+
+>>> strict_intents(N, a1, np.zeros((N, N)), a3)
+Traceback (most recent call last):
+    ...
+ValueError: argument 'a2' is C contiguous, expected a Fortran contiguous array (copying is disabled)
+>>> strict_intents(N, a1.astype(np.float32), a2, a3)
+Traceback (most recent call last):
+    ...
+TypeError: argument 'a1' has dtype float32, expected float64 (copying is disabled)
+>>> strict_intents(N, a1.tolist(), a2, a3)
+Traceback (most recent call last):
+    ...
+TypeError: argument 'a1' must be a numpy array, not list (copying is disabled)
+>>> strict_intents(N, a1[0], a2, a3)
+Traceback (most recent call last):
+    ...
+ValueError: argument 'a1' has 1 dimensions, expected 2
+>>> strict_intents(N, a1, np.zeros((2*N, 2*N), order='F')[::2, ::2], a3)
+Traceback (most recent call last):
+    ...
+ValueError: argument 'a2' is not contiguous, expected a Fortran contiguous array (copying is disabled)
+>>> a2.flags.writeable = False
+>>> strict_intents(N, a1, a2, a3)
+Traceback (most recent call last):
+    ...
+ValueError: argument 'a2' is read-only, but the procedure may write to it
+'''
@@ -0,0 +1,45 @@
+! fwrap-options: --ufuncs
+
+        elemental function hypot2(x, y)
+            implicit none
+            real(kind=8), intent(in) :: x, y
+            real(kind=8) :: hypot2
+
+            hypot2 = sqrt(x**2 + y**2)
+
+        end function hypot2
+
+        function iadd(i, j)
+            implicit none
+            integer, intent(in) :: i, j
+            integer :: iadd
+
+            iadd = i + j
+
+        end function iadd
+
+        elemental subroutine accum(x, total, count)
+            implicit none
+            real, intent(in) :: x
+            real, intent(inout) :: total
+            integer, intent(out) :: count
+
+            total = total + x
+            count = 1
+
+        end subroutine accum
+
+        subroutine no_outputs(x)
+            implicit none
+            integer, intent(in) :: x
+        end subroutine no_outputs
+
+        subroutine with_array(n, x, y)
+            implicit none
+            integer, intent(in) :: n
+            real, dimension(n), intent(in) :: x
+            real, intent(out) :: y
+
+            y = sum(x)
+
+        end subroutine with_array
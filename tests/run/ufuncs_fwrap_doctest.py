@@ -0,0 +1,40 @@
+import numpy as np
+from ufuncs_fwrap import *
+
+__doc__ = u'''
+Procedures with only scalar arguments get a ufunc that broadcasts.
+
+>>> type(hypot2_ufunc) is np.ufunc
+True
+>>> (hypot2_ufunc.nin, hypot2_ufunc.nout)
+(2, 1)
+>>> hypot2_ufunc([[3.], [5.]], [4., 12.]).tolist()
+[[5.0, 12.36931687685298], [6.4031242374328485, 13.0]]
+>>> iadd_ufunc(np.arange(4, dtype=np.intc), 10).tolist()
+[10, 11, 12, 13]
+
+Results can be written to existing arrays.  Other types are cast to the
+kinds of the Fortran procedure following NumPy's casting rules.
+
+>>> out = np.zeros(3)
+>>> res = hypot2_ufunc(np.array([3, 6, 9], dtype=np.int16), 4, out=out)
+>>> res is out, out.tolist()
+(True, [5.0, 7.211102550927978, 9.848857801796104])
+>>> iadd_ufunc(np.arange(4, dtype=np.int64), 10)
+Traceback (most recent call last):
+    ...
+TypeError: ufunc 'iadd_ufunc' not supported for the input types, and the inputs could not be safely coerced to any supported types according to the casting rule ''safe''
+
+Intent inout arguments are both inputs and outputs.
+
+>>> (accum_ufunc.nin, accum_ufunc.nout)
+(2, 2)
+>>> total, count = accum_ufunc(np.array([1., 2., 3.], dtype=np.float32), 10.)
+>>> total.tolist(), count.tolist()
+([11.0, 12.0, 13.0], [1, 1, 1])
+
+Procedures without outputs or with array arguments don't get a ufunc.
+
+>>> 'no_outputs_ufunc' in dir(), 'with_array_ufunc' in dir()
+(False, False)
+'''
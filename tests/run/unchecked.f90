@@ -0,0 +1,30 @@
+! fwrap-options: --unchecked=axpy,count_char
+
+        subroutine axpy(n, alpha, x, y)
+            implicit none
+            integer, intent(in) :: n
+            real(kind=8), intent(in) :: alpha
+            real(kind=8), dimension(n), intent(in) :: x
+            real(kind=8), dimension(n), intent(inout) :: y
+            y = alpha * x + y
+        end subroutine axpy
+
+        function count_char(s, c)
+            implicit none
+            character(len=8), intent(in) :: s
+            character(len=1), intent(in) :: c
+            integer :: count_char
+            integer :: i
+            count_char = 0
+            do i = 1, len(s)
+                if (s(i:i) == c) count_char = count_char + 1
+            enddo
+        end function count_char
+
+        subroutine norm(n, x, res)
+            implicit none
+            integer, intent(in) :: n
+            real(kind=8), dimension(n), intent(in) :: x
+            real(kind=8), intent(out) :: res
+            res = sqrt(sum(x**2))
+        end subroutine norm
@@ -0,0 +1,32 @@
+import numpy as np
+import unchecked_fwrap
+from unchecked_fwrap import *
+
+__doc__ = u'''
+The unchecked wrappers compute the same as the checked ones.
+
+>>> x = np.arange(4.)
+>>> axpy(4, 2., x, np.ones(4)).tolist()
+[1.0, 3.0, 5.0, 7.0]
+>>> axpy_unchecked(4, 2., x, np.ones(4)).tolist()
+[1.0, 3.0, 5.0, 7.0]
+>>> count_char(b'abcabcab', b'a'), count_char_unchecked(b'abcabcab', b'a')
+(3, 3)
+
+The extents aren't checked, e.g. only the first n elements of larger
+arrays are used; the checked wrapper raises an error.
+
+>>> axpy(2, 2., x, np.ones(4))
+Traceback (most recent call last):
+    ...
+RuntimeError: an error was encountered when calling the 'axpy' wrapper.
+>>> axpy_unchecked(2, 2., x, np.ones(4)).tolist()
+[1.0, 3.0, 1.0, 1.0]
+
+Only the procedures asked for get unchecked wrappers.
+
+>>> hasattr(unchecked_fwrap, 'norm_unchecked')
+False
+>>> print(axpy_unchecked.__doc__.strip().splitlines()[0])
+axpy_unchecked(n, alpha, x, y) -> y
+'''
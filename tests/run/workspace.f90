@@ -0,0 +1,44 @@
+! fwrap-options: --workspace=partial_sums.work,partial_sums.lwork=max(1,2*n),partial_sums.iwork,smooth.w=m+1
+
+        ! LAPACK style: the caller provides scratch space and its size.
+        subroutine partial_sums(n, a, work, lwork, iwork, info)
+            implicit none
+            integer, intent(in) :: n, lwork
+            real(kind=8), dimension(n), intent(inout) :: a
+            real(kind=8), dimension(lwork), intent(out) :: work
+            integer, dimension(n), intent(out) :: iwork
+            integer, intent(out) :: info
+            integer :: i
+            info = 0
+            if (lwork < 2*n) then
+                info = -4
+                return
+            endif
+            do i = 1, n
+                iwork(i) = n - i + 1
+                work(n + i) = a(i)
+            enddo
+            work(1) = a(1)
+            do i = 2, n
+                work(i) = work(i-1) + work(n + i)
+            enddo
+            do i = 1, n
+                a(i) = work(iwork(n - i + 1))
+            enddo
+        end subroutine partial_sums
+
+        subroutine smooth(m, x, w)
+            implicit none
+            integer, intent(in) :: m
+            real(kind=8), dimension(m), intent(inout) :: x
+            real(kind=8), dimension(*) :: w
+            integer :: i
+            w(1) = x(1)
+            w(m+1) = x(m)
+            do i = 2, m
+                w(i) = (x(i-1) + x(i)) / 2
+            enddo
+            do i = 1, m
+                x(i) = (w(i) + w(i+1)) / 2
+            enddo
+        end subroutine smooth
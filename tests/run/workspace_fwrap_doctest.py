@@ -0,0 +1,42 @@
+import numpy as np
+from workspace_fwrap import *
+
+__doc__ = u'''
+The workspace arguments are hidden from the signatures.
+
+>>> a, info = partial_sums(4, np.arange(1., 5.))
+>>> a.tolist(), info
+([1.0, 3.0, 6.0, 10.0], 0)
+>>> smooth(3, np.array([1., 2., 4.])).tolist()
+[1.25, 2.25, 3.5]
+
+Every thread keeps one array per workspace argument, sized for the largest
+call so far.
+
+>>> cache = fw_workspaces.cache
+>>> sorted(cache)
+['partial_sums.iwork', 'partial_sums.work', 'smooth.w']
+>>> [cache[key].size for key in sorted(cache)]
+[4, 8, 4]
+>>> work = cache['partial_sums.work']
+>>> a, info = partial_sums(2, np.ones(2))
+>>> a.tolist(), cache['partial_sums.work'] is work
+([1.0, 2.0], True)
+>>> a, info = partial_sums(10, np.ones(10))
+>>> a.tolist() == list(range(1, 11)), cache['partial_sums.work'].size
+(True, 20)
+
+Other threads get arrays of their own.
+
+>>> import threading
+>>> def run():
+...     res.append((partial_sums(3, np.ones(3))[0].tolist(),
+...                 sorted(fw_workspaces.cache)))
+>>> res = []
+>>> t = threading.Thread(target=run)
+>>> t.start(); t.join()
+>>> res
+[([1.0, 2.0, 3.0], ['partial_sums.iwork', 'partial_sums.work'])]
+>>> cache['partial_sums.work'].size
+20
+'''